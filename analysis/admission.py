@@ -0,0 +1,244 @@
+"""
+SIB Admission Control - Global LLM concurrency budget across API workers
+
+Every LLM call takes a slot from a per-provider budget held in a small
+SQLite database in the shared cache directory, so the cap applies to the
+whole service rather than to each gunicorn worker. Callers beyond the cap
+wait in a bounded FIFO queue; when the queue is full the request is shed
+with a Retry-After estimate derived from the queue depth and the recent
+average call duration.
+
+Slots are owned by a host (container) and pid. Slots of dead processes on
+the same host are freed right away; pids of other containers can't be
+checked, so their slots expire after stale_after instead.
+"""
+
+import os
+import math
+import time
+import socket
+import sqlite3
+import logging
+from contextlib import closing, contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+RUNNING = 'running'
+WAITING = 'waiting'
+
+
+class Overloaded(Exception):
+    """Raised when the LLM budget cannot admit a call; carries Retry-After seconds."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def provider_limits(config: dict) -> Dict[str, int]:
+    """Per-provider max_in_flight overrides from the analysis config."""
+    return {
+        name: settings['max_in_flight']
+        for name, settings in config.get('analysis', {}).items()
+        if isinstance(settings, dict) and 'max_in_flight' in settings
+    }
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class AdmissionController:
+    """Cross-process in-flight cap and wait queue per LLM provider.
+
+    Args:
+        db_path: SQLite file shared by all workers
+        max_in_flight: Default concurrent LLM calls per provider
+        max_queue: Maximum callers waiting per provider before shedding
+        wait_timeout: Seconds a caller may wait for a slot
+        limits: Per-provider overrides of max_in_flight
+        stale_after: Seconds after which a held slot is considered leaked
+            (and, for slots of other hosts, a queued one too)
+    """
+
+    def __init__(self, db_path: Path, max_in_flight: int = 2, max_queue: int = 20,
+                 wait_timeout: float = 60.0, limits: Optional[Dict[str, int]] = None,
+                 stale_after: float = 300.0, poll_interval: float = 0.2):
+        self.db_path = Path(db_path)
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.wait_timeout = wait_timeout
+        self.limits = limits or {}
+        self.stale_after = stale_after
+        self.poll_interval = poll_interval
+        self.host = socket.gethostname()
+        with closing(self._connect()) as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""CREATE TABLE IF NOT EXISTS slots (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                provider TEXT NOT NULL,
+                state TEXT NOT NULL,
+                pid INTEGER NOT NULL,
+                since REAL NOT NULL,
+                host TEXT NOT NULL DEFAULT '')""")
+            columns = {row[1] for row in db.execute("PRAGMA table_info(slots)")}
+            if 'host' not in columns:
+                # Databases created before slots were host-qualified
+                db.execute("ALTER TABLE slots ADD COLUMN host TEXT NOT NULL DEFAULT ''")
+            db.execute("""CREATE TABLE IF NOT EXISTS durations (
+                provider TEXT PRIMARY KEY,
+                avg_seconds REAL NOT NULL)""")
+        try:
+            os.chmod(self.db_path, 0o600)
+        except OSError:
+            pass
+
+    def _connect(self) -> sqlite3.Connection:
+        # Autocommit mode; writers take the lock explicitly with BEGIN IMMEDIATE
+        return sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+
+    def limit_for(self, provider: str) -> int:
+        return max(1, int(self.limits.get(provider, self.max_in_flight)))
+
+    def _reap(self, db: sqlite3.Connection):
+        """Drop slots left behind by dead workers or hung calls.
+
+        Pids are only checked for slots of this host: other containers
+        sharing the cache directory have their own pid namespace.
+        """
+        now = time.time()
+        running_cutoff = now - self.stale_after
+        waiting_cutoff = now - max(self.stale_after, self.wait_timeout)
+        rows = db.execute("SELECT id, pid, state, since, host FROM slots").fetchall()
+        for slot_id, pid, state, since, host in rows:
+            if host == self.host:
+                leaked = not _pid_alive(pid) or (state == RUNNING and since < running_cutoff)
+            else:
+                leaked = since < (running_cutoff if state == RUNNING else waiting_cutoff)
+            if leaked:
+                db.execute("DELETE FROM slots WHERE id = ?", (slot_id,))
+
+    def _counts(self, db: sqlite3.Connection, provider: str) -> Dict[str, int]:
+        rows = db.execute("SELECT state, COUNT(*) FROM slots WHERE provider = ? GROUP BY state",
+                          (provider,)).fetchall()
+        counts = {RUNNING: 0, WAITING: 0}
+        counts.update(dict(rows))
+        return counts
+
+    def _retry_after(self, db: sqlite3.Connection, provider: str, waiting: int) -> int:
+        row = db.execute("SELECT avg_seconds FROM durations WHERE provider = ?", (provider,)).fetchone()
+        avg = row[0] if row else 30.0
+        rounds = math.ceil((waiting + 1) / self.limit_for(provider))
+        return max(1, int(math.ceil(rounds * avg)))
+
+    def stats(self, provider: str) -> dict:
+        """Current in-flight and queued counts for a provider."""
+        with closing(self._connect()) as db:
+            counts = self._counts(db, provider)
+            return {
+                'provider': provider,
+                'in_flight': counts[RUNNING],
+                'queued': counts[WAITING],
+                'limit': self.limit_for(provider),
+                'max_queue': self.max_queue,
+                'retry_after': self._retry_after(db, provider, counts[WAITING]),
+            }
+
+    def check(self, provider: str):
+        """Raise Overloaded if a new call would be shed right now."""
+        with closing(self._connect()) as db:
+            counts = self._counts(db, provider)
+            if counts[RUNNING] >= self.limit_for(provider) and counts[WAITING] >= self.max_queue:
+                raise Overloaded(f"{provider} queue full ({counts[WAITING]} waiting)",
+                                 self._retry_after(db, provider, counts[WAITING]))
+
+    def _acquire(self, provider: str) -> int:
+        limit = self.limit_for(provider)
+        db = self._connect()
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            self._reap(db)
+            counts = self._counts(db, provider)
+            if counts[RUNNING] < limit and counts[WAITING] == 0:
+                slot_id = db.execute("INSERT INTO slots (provider, state, pid, since, host) VALUES (?, ?, ?, ?, ?)",
+                                     (provider, RUNNING, os.getpid(), time.time(), self.host)).lastrowid
+                db.execute("COMMIT")
+                return slot_id
+            if counts[WAITING] >= self.max_queue:
+                retry_after = self._retry_after(db, provider, counts[WAITING])
+                db.execute("COMMIT")
+                raise Overloaded(f"{provider} queue full ({counts[WAITING]} waiting)", retry_after)
+            slot_id = db.execute("INSERT INTO slots (provider, state, pid, since, host) VALUES (?, ?, ?, ?, ?)",
+                                 (provider, WAITING, os.getpid(), time.time(), self.host)).lastrowid
+            db.execute("COMMIT")
+
+            # Wait our turn: promoted when we are the oldest waiter and a slot is free
+            deadline = time.monotonic() + self.wait_timeout
+            while time.monotonic() < deadline:
+                time.sleep(self.poll_interval)
+                db.execute("BEGIN IMMEDIATE")
+                self._reap(db)
+                head = db.execute("SELECT MIN(id) FROM slots WHERE provider = ? AND state = ?",
+                                  (provider, WAITING)).fetchone()[0]
+                if head == slot_id and self._counts(db, provider)[RUNNING] < limit:
+                    db.execute("UPDATE slots SET state = ?, since = ? WHERE id = ?",
+                               (RUNNING, time.time(), slot_id))
+                    db.execute("COMMIT")
+                    return slot_id
+                db.execute("COMMIT")
+
+            db.execute("BEGIN IMMEDIATE")
+            db.execute("DELETE FROM slots WHERE id = ?", (slot_id,))
+            waiting = self._counts(db, provider)[WAITING]
+            retry_after = self._retry_after(db, provider, waiting)
+            db.execute("COMMIT")
+            raise Overloaded(f"Timed out waiting for a {provider} slot", retry_after)
+        except sqlite3.Error:
+            if db.in_transaction:
+                db.execute("ROLLBACK")
+            raise
+        finally:
+            db.close()
+
+    def _release(self, provider: str, slot_id: int, duration: float):
+        with closing(self._connect()) as db:
+            db.execute("BEGIN IMMEDIATE")
+            db.execute("DELETE FROM slots WHERE id = ?", (slot_id,))
+            # Exponentially weighted average feeds the Retry-After estimate
+            db.execute("""INSERT INTO durations (provider, avg_seconds) VALUES (?, ?)
+                          ON CONFLICT(provider) DO UPDATE SET
+                          avg_seconds = 0.8 * avg_seconds + 0.2 * excluded.avg_seconds""",
+                       (provider, duration))
+            db.execute("COMMIT")
+
+    @contextmanager
+    def slot(self, provider: str) -> Iterator[None]:
+        """Hold one of the provider's LLM slots for the duration of the block.
+
+        Raises:
+            Overloaded: The wait queue is full or no slot freed up in time
+        """
+        try:
+            slot_id = self._acquire(provider)
+        except sqlite3.Error as e:
+            # Never let the bookkeeping store take the API down
+            logger.warning(f"Admission control unavailable, admitting without a slot: {e}")
+            yield
+            return
+
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            try:
+                self._release(provider, slot_id, time.monotonic() - started)
+            except sqlite3.Error as e:
+                logger.warning(f"Failed to release LLM slot {slot_id}: {e}")
@@ -1,23 +1,57 @@
 """
 SIB Alert Analyzer - LLM-powered security alert analysis
 
-Fetches alerts from Loki, obfuscates sensitive data, and uses LLM
+Fetches alerts from Loki or VictoriaLogs, obfuscates sensitive data, and uses LLM
 to provide attack vector analysis and mitigation strategies.
 """
 
+import copy
 import json
 import os
+import re
 import sys
+import gzip
+import time
 import argparse
+import itertools
+import threading
 import requests
-from datetime import datetime, timedelta
-from typing import Optional, List, Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Iterable, Iterator, Optional, List, Dict, Any, Tuple
 from pathlib import Path
 
 import yaml
 
-from obfuscator import obfuscate_alert, ObfuscationLevel
-from prompts import SYSTEM_PROMPT, USER_PROMPT_TEMPLATE, MITRE_MAPPING
+try:
+    import ijson
+except ImportError:  # optional - Loki responses are then parsed in one go
+    ijson = None
+
+from obfuscator import obfuscate_alert, obfuscate_incident, ObfuscationLevel
+from prompts import SYSTEM_PROMPT, USER_PROMPT_TEMPLATE, INCIDENT_PROMPT_TEMPLATE
+from ledger import Ledger, alert_fingerprint
+from backfill import Backfill, Checkpoint, DEFAULT_CHECKPOINT, split_range
+from storm import StormController
+from scheduler import PRIORITY_RANK, AnalysisScheduler
+from incidents import Incident, IncidentCorrelator, format_timeline
+from triage import SKIP, Triage
+from knowledge import RuleKnowledge
+from mitre import MitreIndex
+from compaction import compact, estimate_tokens, prompt_budget
+
+DEFAULT_LEDGER = os.path.expanduser('~/.local/state/sib/ledger.db')
+# Longest single LLM request (Ollama, on a loaded machine)
+LLM_REQUEST_TIMEOUT = 120
+
+# How enriched alerts are written (<backend>.storage_mode):
+# - labels: every enrichment field is a stream label (one stream per
+#   host/rule/technique combination)
+# - metadata: only STREAM_LABELS are stream labels; the high-cardinality
+#   fields go into Loki structured metadata (Loki 3.x, schema v13) or
+#   plain VictoriaLogs fields
+STORAGE_MODES = ('labels', 'metadata')
+STREAM_LABELS = ('source', 'type', 'severity')
 
 
 def _validate_url(url: str) -> str:
@@ -29,71 +63,484 @@ def _validate_url(url: str) -> str:
     return url.rstrip('/')
 
 
-class LokiClient:
+def alert_selector(priorities: Optional[List[str]] = None) -> str:
+    """Stream selector for Falco alerts, optionally limited to priorities.
+
+    The Prometheus-style selector is valid LogQL and LogsQL alike.
+    """
+    if not priorities:
+        return '{source="syscall"}'
+    if len(priorities) == 1:
+        return f'{{source="syscall", priority="{priorities[0]}"}}'
+    return f'{{source="syscall", priority=~"{"|".join(priorities)}"}}'
+
+
+def _quote(value: str) -> str:
+    """Double-quoted string literal, valid in LogQL and LogsQL."""
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _ns_to_rfc3339(ts_ns: int) -> str:
+    seconds, nanos = divmod(int(ts_ns), 1_000_000_000)
+    return datetime.fromtimestamp(seconds, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S') + f'.{nanos:09d}Z'
+
+
+def _rfc3339_to_ns(value: str) -> int:
+    # Keeps nanosecond precision that datetime would truncate
+    base, _, fraction = value.rstrip('Z').partition('.')
+    seconds = int(datetime.fromisoformat(base).replace(tzinfo=timezone.utc).timestamp())
+    return seconds * 1_000_000_000 + int((fraction + '000000000')[:9])
+
+
+def _make_alert(labels: Dict[str, str], timestamp_ns, log_line: str) -> dict:
+    """Build an alert dict from one log entry."""
+    try:
+        alert = json.loads(log_line)
+    except json.JSONDecodeError:
+        alert = {'output': log_line}
+    if not isinstance(alert, dict):
+        alert = {'output': log_line}
+    
+    alert['_labels'] = labels
+    alert['_timestamp'] = datetime.fromtimestamp(int(timestamp_ns) / 1e9)
+    alert['_timestamp_ns'] = int(timestamp_ns)
+    alert['_fingerprint'] = alert_fingerprint(labels, timestamp_ns, log_line)
+    return alert
+
+
+def open_alert_file(path: str):
+    """Open Falco JSON output for reading: '-' is stdin, gzip is detected by content."""
+    if path == '-':
+        return sys.stdin
+    with open(path, 'rb') as f:
+        gzipped = f.read(2) == b'\x1f\x8b'
+    if gzipped:
+        return gzip.open(path, 'rt', encoding='utf-8', errors='replace')
+    return open(path, encoding='utf-8', errors='replace')
+
+
+def read_falco_json(lines: Iterable[str], priority: Optional[str] = None,
+                    rule: Optional[str] = None) -> Iterator[dict]:
+    """Yield alerts from Falco JSON output (json_output=true), one per line.
+
+    Lines are read only as alerts are consumed, so a slow analysis slows
+    down the reader (and the pipe feeding it) instead of buffering. Lines
+    that are not Falco events, such as startup messages, are skipped.
+    """
+    skipped = 0
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            alert = json.loads(line)
+        except json.JSONDecodeError:
+            alert = None
+        if not isinstance(alert, dict) or 'output' not in alert:
+            skipped += 1
+            continue
+        if priority and str(alert.get('priority', '')).lower() != priority.lower():
+            continue
+        if rule and not re.search(rule, str(alert.get('rule', ''))):
+            continue
+        
+        # The labels Falcosidekick gives the same event in the log backend
+        labels = {k: str(alert[k]) for k in ('source', 'priority', 'rule', 'hostname') if alert.get(k)}
+        labels.setdefault('source', 'syscall')
+        try:
+            timestamp_ns = _rfc3339_to_ns(alert['time'])
+        except (KeyError, TypeError, ValueError):
+            timestamp_ns = time.time_ns()
+        alert['_labels'] = labels
+        alert['_timestamp'] = datetime.fromtimestamp(timestamp_ns / 1e9)
+        alert['_timestamp_ns'] = timestamp_ns
+        alert['_fingerprint'] = alert_fingerprint(labels, timestamp_ns, line)
+        yield alert
+    if skipped:
+        print(f"Skipped {skipped} lines that are not Falco JSON events", file=sys.stderr)
+
+
+class LogBackend:
+    """Base class for log stores that hold Falco alerts and enriched results."""
+
+    name = 'log store'
+
+    def iter_page(self, query: str, start_ns: int, end_ns: int, limit: int,
+                  direction: str) -> Iterator[dict]:
+        """Yield up to limit alerts, the oldest ('forward') or newest ('backward')
+        in the range, in no particular order."""
+        raise NotImplementedError
+
+    def query_range(self, query: str, start: datetime, end: datetime, limit: int = 100,
+                    direction: str = 'backward') -> List[dict]:
+        """Return alerts in a time range, newest first ('backward') or oldest first."""
+        alerts = list(self.iter_page(query, int(start.timestamp() * 1e9),
+                                     int(end.timestamp() * 1e9), limit, direction))
+        alerts.sort(key=lambda a: a['_timestamp_ns'], reverse=direction == 'backward')
+        return alerts
+
+    def iter_alerts(self, query: str, start: datetime, end: datetime, page_size: int = 1000,
+                    direction: str = 'forward') -> Iterator[dict]:
+        """Yield every alert in a time range, paging through it.
+
+        Each page moves the start (or, backward, the end) to the last
+        timestamp seen; entries at that timestamp are requested again and
+        skipped by fingerprint, so nothing is lost or repeated at page
+        boundaries. Memory use is bounded by page_size.
+        """
+        forward = direction == 'forward'
+        start_ns = int(start.timestamp() * 1e9)
+        end_ns = int(end.timestamp() * 1e9)
+        boundary_ns, seen = None, set()
+        while start_ns <= end_ns:
+            # Loki's end is exclusive, so ask for one ns past the boundary
+            page = list(self.iter_page(query, start_ns, end_ns if forward else end_ns + 1,
+                                       page_size, direction))
+            page.sort(key=lambda a: a['_timestamp_ns'], reverse=not forward)
+            new = [a for a in page
+                   if not (a['_timestamp_ns'] == boundary_ns and a['_fingerprint'] in seen)]
+            yield from new
+            if len(page) < page_size:
+                return
+            
+            last_ns = page[-1]['_timestamp_ns']
+            if not new:
+                # A whole page shares one timestamp - step past it
+                print(f"More than {page_size} entries at {last_ns}, skipping the rest", file=sys.stderr)
+                last_ns += 1 if forward else -1
+                seen = set()
+            elif last_ns != boundary_ns:
+                seen = set()
+            boundary_ns = last_ns
+            seen.update(a['_fingerprint'] for a in page if a['_timestamp_ns'] == last_ns)
+            if forward:
+                start_ns = last_ns
+            else:
+                end_ns = last_ns
+
+    def filter_query(self, query: str, field: str, value: str, regex: bool = False) -> str:
+        """Narrow a query to entries whose field equals (or matches) value."""
+        raise NotImplementedError
+
+    def count_by(self, query: str, start_ns: int, end_ns: int, by: List[str],
+                 limit: int) -> List[Tuple[Dict[str, str], int]]:
+        """Count matching entries per group in the backend and return the
+        limit largest groups, largest first, as (field values, count)."""
+        raise NotImplementedError
+
+    def push_streams(self, streams: List[dict]):
+        """Write entries given in Loki push format ({"stream", "values"} dicts).
+
+        Raises:
+            requests.RequestException: The request failed
+        """
+        raise NotImplementedError
+
+    def push(self, labels: Dict[str, str], log_line: str, timestamp: Optional[datetime] = None,
+             metadata: Optional[Dict[str, str]] = None) -> bool:
+        """Push a log entry (with optional structured metadata)."""
+        if timestamp is None:
+            timestamp = datetime.now()
+        
+        # Nanosecond timestamps as strings, as in the Loki push API
+        ts_ns = str(int(timestamp.timestamp() * 1e9))
+        
+        value = [ts_ns, log_line, metadata] if metadata else [ts_ns, log_line]
+        try:
+            self.push_streams([{"stream": labels, "values": [value]}])
+            return True
+        except Exception as e:
+            print(f"Failed to push to {self.name}: {e}", file=sys.stderr)
+            return False
+
+
+class LokiClient(LogBackend):
     """Client for querying alerts from Loki."""
 
+    name = 'Loki'
+
     def __init__(self, url: str = "http://localhost:3100"):
         self.url = _validate_url(url)
     
-    def query_range(self, query: str, start: datetime, end: datetime, limit: int = 100) -> List[dict]:
-        """Query Loki for logs in a time range."""
+    def iter_page(self, query: str, start_ns: int, end_ns: int, limit: int,
+                  direction: str) -> Iterator[dict]:
+        """Query Loki for one page of logs in a time range.
+
+        direction='backward' returns the newest entries (Loki's default);
+        'forward' the oldest. With ijson installed the response is parsed
+        one stream at a time instead of loading the whole body.
+        """
         params = {
             'query': query,
-            'start': int(start.timestamp() * 1e9),
-            'end': int(end.timestamp() * 1e9),
+            'start': start_ns,
+            'end': end_ns,
             'limit': limit,
+            'direction': direction,
         }
         
-        response = requests.get(f"{self.url}/loki/api/v1/query_range", params=params, timeout=30)
+        with requests.get(f"{self.url}/loki/api/v1/query_range", params=params, stream=True,
+                          timeout=30) as response:
+            response.raise_for_status()
+            if ijson is not None:
+                response.raw.decode_content = True
+                streams = ijson.items(response.raw, 'data.result.item')
+            else:
+                streams = response.json().get('data', {}).get('result', [])
+            
+            for stream in streams:
+                labels = stream.get('stream', {})
+                for timestamp_ns, log_line in stream.get('values', []):
+                    yield _make_alert(labels, timestamp_ns, log_line)
+    
+    def filter_query(self, query: str, field: str, value: str, regex: bool = False) -> str:
+        # Falcosidekick sends rule, priority and hostname as stream labels,
+        # so label filters apply without a | json stage
+        return f"{query} | {field}{'=~' if regex else '='}{_quote(value)}"
+    
+    def count_by(self, query: str, start_ns: int, end_ns: int, by: List[str],
+                 limit: int) -> List[Tuple[Dict[str, str], int]]:
+        """Group counts from one instant topk(count_over_time) query."""
+        seconds = max(1, (end_ns - start_ns) // 1_000_000_000)
+        params = {
+            'query': f"topk({int(limit)}, sum by ({', '.join(by)}) "
+                     f"(count_over_time({query} [{seconds}s])))",
+            'time': end_ns,
+        }
+        response = requests.get(f"{self.url}/loki/api/v1/query", params=params, timeout=30)
         response.raise_for_status()
         
-        data = response.json()
-        alerts = []
+        groups = []
+        for sample in response.json().get('data', {}).get('result', []):
+            metric = sample.get('metric', {})
+            groups.append(({f: metric.get(f, '') for f in by}, int(float(sample['value'][1]))))
+        groups.sort(key=lambda g: g[1], reverse=True)
+        return groups
+    
+    def push_streams(self, streams: List[dict]):
+        """Send one push request (gzip-compressed) for a list of streams.
+
+        Raises:
+            requests.RequestException: The request failed
+        """
+        body = gzip.compress(json.dumps({"streams": streams}).encode(), compresslevel=6)
+        response = requests.post(
+            f"{self.url}/loki/api/v1/push",
+            data=body,
+            headers={"Content-Type": "application/json", "Content-Encoding": "gzip"},
+            timeout=30
+        )
+        response.raise_for_status()
+
+
+class VictoriaLogsClient(LogBackend):
+    """Client for VictoriaLogs (the default SIB log store).
+
+    Queries are LogsQL and results are streamed as JSON lines, so large
+    ranges are never buffered as one response. Writes use the JSON lines
+    ingestion API; stream labels become VictoriaLogs stream fields and
+    structured metadata becomes regular fields.
+    """
+
+    name = 'VictoriaLogs'
+
+    def __init__(self, url: str = "http://localhost:9428"):
+        self.url = _validate_url(url)
+    
+    def iter_page(self, query: str, start_ns: int, end_ns: int, limit: int,
+                  direction: str) -> Iterator[dict]:
+        """Yield one page of alerts (LogsQL) as the response streams in."""
+        order = 'desc' if direction == 'backward' else 'asc'
+        params = {
+            'query': f'{query} | sort by (_time {order}) | limit {int(limit)}',
+            'start': _ns_to_rfc3339(start_ns),
+            'end': _ns_to_rfc3339(end_ns),
+        }
         
-        for stream in data.get('data', {}).get('result', []):
-            labels = stream.get('stream', {})
-            for value in stream.get('values', []):
-                timestamp_ns, log_line = value
-                try:
-                    alert = json.loads(log_line)
-                except json.JSONDecodeError:
-                    alert = {'output': log_line}
-                
-                alert['_labels'] = labels
-                alert['_timestamp'] = datetime.fromtimestamp(int(timestamp_ns) / 1e9)
-                alerts.append(alert)
+        with requests.get(f"{self.url}/select/logsql/query", params=params, stream=True,
+                          timeout=30) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                entry = json.loads(line)
+                # Falcosidekick's Loki labels arrive as plain fields
+                labels = {k: v for k, v in entry.items() if not k.startswith('_')}
+                yield _make_alert(labels, _rfc3339_to_ns(entry['_time']), entry.get('_msg', ''))
+    
+    def filter_query(self, query: str, field: str, value: str, regex: bool = False) -> str:
+        return f"{query} {field}:{'~' if regex else '='}{_quote(value)}"
+    
+    def count_by(self, query: str, start_ns: int, end_ns: int, by: List[str],
+                 limit: int) -> List[Tuple[Dict[str, str], int]]:
+        """Group counts from a LogsQL stats query."""
+        params = {
+            'query': f"{query} | stats by ({', '.join(by)}) count() as hits "
+                     f"| sort by (hits desc) | limit {int(limit)}",
+            'start': _ns_to_rfc3339(start_ns),
+            'end': _ns_to_rfc3339(end_ns),
+        }
+        response = requests.get(f"{self.url}/select/logsql/query", params=params, timeout=30)
+        response.raise_for_status()
         
-        return alerts
+        groups = []
+        for line in response.iter_lines():
+            if line:
+                entry = json.loads(line)
+                groups.append(({f: entry.get(f, '') for f in by}, int(entry.get('hits', 0))))
+        groups.sort(key=lambda g: g[1], reverse=True)
+        return groups
     
-    def push(self, labels: Dict[str, str], log_line: str, timestamp: Optional[datetime] = None) -> bool:
-        """Push a log entry to Loki."""
+    def push_streams(self, streams: List[dict]):
+        """Send Loki-format streams to /insert/jsonline in one gzip request.
+
+        Raises:
+            requests.RequestException: The request failed
+        """
+        stream_fields = sorted({k for stream in streams for k in stream["stream"]})
+        lines = []
+        for stream in streams:
+            for value in stream["values"]:
+                record = dict(value[2]) if len(value) > 2 and value[2] else {}
+                record.update(stream["stream"])
+                record['_time'] = _ns_to_rfc3339(int(value[0]))
+                record['_msg'] = value[1]
+                lines.append(json.dumps(record))
+        body = gzip.compress(('\n'.join(lines) + '\n').encode(), compresslevel=6)
+        response = requests.post(
+            f"{self.url}/insert/jsonline",
+            params={'_stream_fields': ','.join(stream_fields), '_time_field': '_time',
+                    '_msg_field': '_msg'},
+            data=body,
+            headers={"Content-Type": "application/stream+json", "Content-Encoding": "gzip"},
+            timeout=30
+        )
+        response.raise_for_status()
+
+
+class LogBatchWriter:
+    """Buffer log entries and push them to the log backend in batches.
+
+    Entries are grouped by label set with values sorted by timestamp, and
+    sent when the buffer reaches max_entries or max_bytes, when the oldest
+    buffered entry is flush_interval seconds old (checked on add), or on
+    flush()/close(). Failed pushes are retried with exponential backoff
+    before any newer entries are sent, so ordering is preserved.
+
+    Args:
+        client: Log backend to push through
+        max_entries: Entries per push request
+        max_bytes: Approximate uncompressed bytes per push request
+        flush_interval: Maximum seconds an entry waits in the buffer
+        max_retries: Retries of a failed push before its entries are dropped
+        backoff: Initial retry delay in seconds (doubled on every retry)
+    """
+
+    def __init__(self, client: LogBackend, max_entries: int = 500, max_bytes: int = 1024 * 1024,
+                 flush_interval: float = 30.0, max_retries: int = 5, backoff: float = 0.5):
+        self.client = client
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.requests = 0
+        self._lock = threading.RLock()
+        self._entries: List[tuple] = []
+        self._bytes = 0
+        self._first_added: Optional[float] = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add(self, labels: Dict[str, str], log_line: str, timestamp: Optional[datetime] = None,
+            callback: Optional[Callable[[bool], None]] = None,
+            metadata: Optional[Dict[str, str]] = None):
+        """Buffer one entry, with optional structured metadata.
+
+        callback, if given, is called with True once the entry was pushed
+        or False once it was dropped after all retries.
+        """
         if timestamp is None:
             timestamp = datetime.now()
-        
-        # Loki push API expects nanosecond timestamps as strings
-        ts_ns = str(int(timestamp.timestamp() * 1e9))
-        
-        payload = {
-            "streams": [
-                {
-                    "stream": labels,
-                    "values": [[ts_ns, log_line]]
-                }
-            ]
-        }
-        
-        try:
-            response = requests.post(
-                f"{self.url}/loki/api/v1/push",
-                json=payload,
-                headers={"Content-Type": "application/json"},
-                timeout=30
-            )
-            response.raise_for_status()
-            return True
-        except Exception as e:
-            print(f"Failed to push to Loki: {e}", file=sys.stderr)
-            return False
+        ts_ns = int(timestamp.timestamp() * 1e9)
+        with self._lock:
+            self._entries.append((labels, ts_ns, log_line, metadata, callback))
+            self._bytes += len(log_line) + 64
+            if self._first_added is None:
+                self._first_added = time.monotonic()
+            if (len(self._entries) >= self.max_entries or self._bytes >= self.max_bytes
+                    or time.monotonic() - self._first_added >= self.flush_interval):
+                self.flush()
+
+    @staticmethod
+    def _streams(entries: List[tuple]) -> List[dict]:
+        streams: Dict[str, dict] = {}
+        for labels, ts_ns, log_line, metadata, _ in entries:
+            key = json.dumps(labels, sort_keys=True)
+            stream = streams.setdefault(key, {"stream": labels, "values": []})
+            value = [ts_ns, log_line, metadata] if metadata else [ts_ns, log_line]
+            stream["values"].append(value)
+        for stream in streams.values():
+            stream["values"].sort(key=lambda v: v[0])
+            for value in stream["values"]:
+                value[0] = str(value[0])
+        return list(streams.values())
+
+    def _send(self, entries: List[tuple]) -> bool:
+        streams = self._streams(entries)
+        delay = self.backoff
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.requests += 1
+                self.client.push_streams(streams)
+                return True
+            except requests.HTTPError as e:
+                status = e.response.status_code if e.response is not None else 0
+                if status != 429 and status < 500:
+                    # Rejected (bad labels, too old, ...) - retrying won't help
+                    print(f"{self.client.name} rejected {len(entries)} entries: {e}", file=sys.stderr)
+                    return False
+                error = e
+            except requests.RequestException as e:
+                error = e
+            if attempt < self.max_retries:
+                time.sleep(delay)
+                delay *= 2
+        print(f"Failed to push {len(entries)} entries to {self.client.name} after {self.max_retries} retries: {error}",
+              file=sys.stderr)
+        return False
+
+    def flush(self) -> bool:
+        """Push everything buffered; True if all of it was accepted."""
+        with self._lock:
+            entries, self._entries = self._entries, []
+            self._bytes = 0
+            self._first_added = None
+            ok = True
+            # Respect max_entries/max_bytes per request even for large buffers
+            batch, size = [], 0
+            for entry in entries:
+                batch.append(entry)
+                size += len(entry[2]) + 64
+                if len(batch) >= self.max_entries or size >= self.max_bytes:
+                    ok = self._finish(batch) and ok
+                    batch, size = [], 0
+            if batch:
+                ok = self._finish(batch) and ok
+            return ok
+
+    def _finish(self, batch: List[tuple]) -> bool:
+        ok = self._send(batch)
+        for *_, callback in batch:
+            if callback is not None:
+                callback(ok)
+        return ok
+
+    def close(self):
+        self.flush()
 
 
 class LLMProvider:
@@ -101,16 +548,94 @@ class LLMProvider:
     
     def analyze(self, system_prompt: str, user_prompt: str) -> dict:
         raise NotImplementedError
+    
+    def warm_up(self) -> bool:
+        """Prepare the model ahead of the first alert (hosted APIs need nothing)."""
+        return True
+    
+    def timing(self) -> Optional[dict]:
+        """Timing of this thread's last analyze() call, if the provider reports it."""
+        return None
+
+
+# num_ctx in use per (url, model), shared by all providers of the process:
+# the API creates one per request
+_context_sizes: Dict[Tuple[str, str], int] = {}
+_context_lock = threading.Lock()
 
 
 class OllamaProvider(LLMProvider):
-    """Local Ollama LLM provider."""
+    """Local Ollama LLM provider.
     
-    def __init__(self, url: str = "http://localhost:11434", model: str = "llama3.1:8b"):
+    The model is kept loaded for keep_alive after each request, so sporadic
+    alerts don't pay a cold load, and the context window (num_ctx) is sized
+    to the prompt: a power of two holding the prompt and the response. The
+    window never shrinks within a process, since a new num_ctx makes Ollama
+    reload the model. It starts sized for prompt_tokens, the prompt budget,
+    so prompts compacted to the budget all use the window of the warm-up.
+    """
+    
+    # Tokens reserved for the JSON analysis
+    RESPONSE_TOKENS = 2048
+    MIN_CTX = 4096
+    
+    def __init__(self, url: str = "http://localhost:11434", model: str = "llama3.1:8b",
+                 keep_alive='30m', num_ctx='auto', max_ctx: int = 32768, preload: bool = True,
+                 prompt_tokens: int = 0):
         self.url = _validate_url(url)
         self.model = model
+        self.preload = preload
+        # Ollama takes a duration ('30m') or seconds (-1: keep loaded)
+        keep_alive = str(keep_alive).strip()
+        self.keep_alive = int(keep_alive) if re.fullmatch(r'-?\d+', keep_alive) else keep_alive
+        self.num_ctx = None if str(num_ctx).strip().lower() == 'auto' else int(num_ctx)
+        self.max_ctx = max_ctx
+        self.prompt_tokens = prompt_tokens
+        self._local = threading.local()
+    
+    def context_size(self, prompt_tokens: int) -> int:
+        """num_ctx for a prompt of prompt_tokens (estimated) tokens."""
+        if self.num_ctx is not None:
+            return self.num_ctx
+        needed = max(prompt_tokens, self.prompt_tokens) + self.RESPONSE_TOKENS
+        ctx = self.MIN_CTX
+        while ctx < needed and ctx < self.max_ctx:
+            ctx *= 2
+        key = (self.url, self.model)
+        with _context_lock:
+            _context_sizes[key] = max(_context_sizes.get(key, self.MIN_CTX), min(ctx, self.max_ctx))
+            return _context_sizes[key]
+    
+    def warm_up(self) -> bool:
+        """Load the model (a chat request without messages) so the first
+        alert doesn't wait for it, unless analysis.ollama.warm_up is off."""
+        if not self.preload:
+            return True
+        try:
+            response = requests.post(
+                f"{self.url}/api/chat",
+                json={
+                    "model": self.model,
+                    "messages": [],
+                    "keep_alive": self.keep_alive,
+                    "options": {"num_ctx": self.context_size(self.prompt_tokens)},
+                },
+                timeout=300
+            )
+            response.raise_for_status()
+        except Exception as e:
+            print(f"Ollama warm-up of {self.model} failed: {e}", file=sys.stderr)
+            return False
+        load = response.json().get('load_duration', 0) / 1e9
+        print(f"Ollama model {self.model} loaded ({load:.1f}s), kept for {self.keep_alive}", file=sys.stderr)
+        return True
+    
+    def timing(self) -> Optional[dict]:
+        return getattr(self._local, 'timing', None)
     
     def analyze(self, system_prompt: str, user_prompt: str) -> dict:
+        num_ctx = self.context_size(estimate_tokens(system_prompt) + estimate_tokens(user_prompt))
+        self._local.timing = None
         response = requests.post(
             f"{self.url}/api/chat",
             json={
@@ -120,13 +645,28 @@ class OllamaProvider(LLMProvider):
                     {"role": "user", "content": user_prompt}
                 ],
                 "stream": False,
-                "format": "json"
+                "format": "json",
+                "keep_alive": self.keep_alive,
+                "options": {"num_ctx": num_ctx},
             },
-            timeout=120
+            timeout=LLM_REQUEST_TIMEOUT
         )
         response.raise_for_status()
         
-        content = response.json().get('message', {}).get('content', '{}')
+        data = response.json()
+        # Durations are reported in nanoseconds
+        eval_seconds = data.get('eval_duration', 0) / 1e9
+        self._local.timing = {
+            'num_ctx': num_ctx,
+            'load_ms': round(data.get('load_duration', 0) / 1e6),
+            'prompt_eval_count': data.get('prompt_eval_count', 0),
+            'prompt_eval_ms': round(data.get('prompt_eval_duration', 0) / 1e6),
+            'eval_count': data.get('eval_count', 0),
+            'eval_ms': round(eval_seconds * 1000),
+            'total_ms': round(data.get('total_duration', 0) / 1e6),
+            'tokens_per_second': round(data.get('eval_count', 0) / eval_seconds, 1) if eval_seconds else None,
+        }
+        content = data.get('message', {}).get('content', '{}')
         return json.loads(content)
 
 
@@ -200,112 +740,406 @@ class AnthropicProvider(LLMProvider):
             raise
 
 
+def create_provider(config: dict) -> LLMProvider:
+    """Create the LLM provider configured by analysis.provider."""
+    analysis_config = config.get('analysis', {})
+    provider_name = analysis_config.get('provider', 'ollama')
+    
+    if provider_name == 'ollama':
+        ollama_config = analysis_config.get('ollama', {})
+        return OllamaProvider(
+            url=ollama_config.get('url', 'http://localhost:11434'),
+            model=ollama_config.get('model', 'llama3.1:8b'),
+            keep_alive=ollama_config.get('keep_alive', '30m'),
+            num_ctx=ollama_config.get('num_ctx', 'auto'),
+            max_ctx=int(ollama_config.get('max_ctx', 32768)),
+            preload=str(ollama_config.get('warm_up', True)).strip().lower() in ('true', '1', 'yes', 'on'),
+            prompt_tokens=prompt_budget(config, 'ollama', ollama_config.get('model', 'llama3.1:8b')),
+        )
+    elif provider_name == 'openai':
+        openai_config = analysis_config.get('openai', {})
+        api_key = os.path.expandvars(openai_config.get('api_key', ''))
+        return OpenAIProvider(
+            api_key=api_key,
+            model=openai_config.get('model', 'gpt-4o-mini')
+        )
+    elif provider_name == 'anthropic':
+        anthropic_config = analysis_config.get('anthropic', {})
+        api_key = os.path.expandvars(anthropic_config.get('api_key', ''))
+        return AnthropicProvider(
+            api_key=api_key,
+            model=anthropic_config.get('model', 'claude-3-haiku-20240307')
+        )
+    else:
+        raise ValueError(f"Unknown provider: {provider_name}")
+
+
 class AlertAnalyzer:
     """Main analyzer class that coordinates obfuscation and LLM analysis."""
     
-    def __init__(self, config: dict):
+    def __init__(self, config: dict, triage: bool = False, cache=None):
+        """
+        Args:
+            config: Analysis config (see config.yaml.example)
+            triage: Let the local pre-triage model (analysis.triage) answer
+                routine alerts without an LLM call
+            cache: AnalysisCache whose analyses near-duplicate alerts reuse
+                (analysis.similarity)
+        """
         self.config = config
-        self.loki = LokiClient(config.get('loki', {}).get('url', 'http://localhost:3100'))
+        self.backend_name = config.get('log_backend', 'loki')
+        self.backend = self._create_backend()
         self.obfuscation_level = config.get('analysis', {}).get('obfuscation_level', 'standard')
+        self.storage_mode = config.get(self.backend_name, {}).get('storage_mode', 'labels')
+        if self.storage_mode not in STORAGE_MODES:
+            raise ValueError(f"Unknown {self.backend_name}.storage_mode: {self.storage_mode}")
         self.provider = self._create_provider()
+        self.prompt_budget = prompt_budget(config, config.get('analysis', {}).get('provider', 'ollama'),
+                                           getattr(self.provider, 'model', ''))
+        self.knowledge = RuleKnowledge.from_config(config)
+        self.mitre = MitreIndex.from_config(config)
+        self.triage = Triage.from_config(config) if triage else None
+        self.cache = cache if cache is not None and cache.similar is not None else None
+    
+    def _create_backend(self) -> LogBackend:
+        """Create the configured log backend."""
+        if self.backend_name == 'loki':
+            return LokiClient(self.config.get('loki', {}).get('url', 'http://localhost:3100'))
+        elif self.backend_name == 'victorialogs':
+            return VictoriaLogsClient(self.config.get('victorialogs', {}).get('url', 'http://localhost:9428'))
+        else:
+            raise ValueError(f"Unknown log backend: {self.backend_name}")
     
     def _create_provider(self) -> LLMProvider:
         """Create the configured LLM provider."""
-        analysis_config = self.config.get('analysis', {})
-        provider_name = analysis_config.get('provider', 'ollama')
-        
-        if provider_name == 'ollama':
-            ollama_config = analysis_config.get('ollama', {})
-            return OllamaProvider(
-                url=ollama_config.get('url', 'http://localhost:11434'),
-                model=ollama_config.get('model', 'llama3.1:8b')
-            )
-        elif provider_name == 'openai':
-            openai_config = analysis_config.get('openai', {})
-            api_key = os.path.expandvars(openai_config.get('api_key', ''))
-            return OpenAIProvider(
-                api_key=api_key,
-                model=openai_config.get('model', 'gpt-4o-mini')
-            )
-        elif provider_name == 'anthropic':
-            anthropic_config = analysis_config.get('anthropic', {})
-            api_key = os.path.expandvars(anthropic_config.get('api_key', ''))
-            return AnthropicProvider(
-                api_key=api_key,
-                model=anthropic_config.get('model', 'claude-3-haiku-20240307')
-            )
-        else:
-            raise ValueError(f"Unknown provider: {provider_name}")
+        return create_provider(self.config)
+    
+    def alert_query(self, priority: Optional[str] = None, rule: Optional[str] = None) -> str:
+        """Backend query for alerts, optionally of one priority and matching a rule regex."""
+        query = alert_selector([priority] if priority else None)
+        if rule:
+            query = self.backend.filter_query(query, 'rule', rule, regex=True)
+        return query
     
     def fetch_alerts(self, priority: Optional[str] = None, 
-                     last: str = "1h", limit: int = 10) -> List[dict]:
-        """Fetch alerts from Loki."""
-        # Parse time duration
-        duration_map = {'m': 'minutes', 'h': 'hours', 'd': 'days'}
-        unit = last[-1]
-        value = int(last[:-1])
-        delta = timedelta(**{duration_map[unit]: value})
-        
+                     last: str = "1h", limit: int = 10, rule: Optional[str] = None) -> List[dict]:
+        """Fetch alerts from the log backend."""
+        end = datetime.now()
+        start = end - parse_duration(last)
+        return self.backend.query_range(self.alert_query(priority, rule), start, end, limit)
+    
+    def iter_alerts(self, priority: Optional[str] = None, last: str = "1h",
+                    page_size: int = 1000, rule: Optional[str] = None) -> Iterator[dict]:
+        """Yield every alert in the window, oldest first, fetching page by page."""
+        end = datetime.now()
+        start = end - parse_duration(last)
+        return self.backend.iter_alerts(self.alert_query(priority, rule), start, end, page_size)
+    
+    def fetch_grouped(self, by: List[str], priority: Optional[str] = None, last: str = "1h",
+                      groups: int = 10, per_group: int = 1, rule: Optional[str] = None) -> List[dict]:
+        """Fetch example alerts of the largest groups in the window.
+
+        The backend counts alerts per group (LogQL topk/count_over_time,
+        LogsQL stats), and only the per_group newest alerts of each of the
+        top groups are pulled, so the raw window is never transferred. Each
+        alert carries its group in '_group' and the group size in '_group_count'.
+
+        Raises:
+            ValueError: A group field is not a plain field name
+        """
+        for field in by:
+            if not re.fullmatch(r'[A-Za-z_][A-Za-z0-9_]*', field):
+                raise ValueError(f"Invalid group field: {field!r}")
         end = datetime.now()
-        start = end - delta
+        start = end - parse_duration(last)
+        query = self.alert_query(priority, rule)
+        counts = self.backend.count_by(query, int(start.timestamp() * 1e9),
+                                       int(end.timestamp() * 1e9), by, groups)
         
-        # Build query
-        if priority:
-            query = f'{{source="syscall", priority="{priority}"}}'
-        else:
-            query = '{source="syscall"}'
+        def examples(group_count: Tuple[Dict[str, str], int]) -> List[dict]:
+            group, count = group_count
+            group_query = query
+            for field, value in group.items():
+                group_query = self.backend.filter_query(group_query, field, value)
+            alerts = self.backend.query_range(group_query, start, end, per_group)
+            for alert in alerts:
+                alert['_group'] = group
+                alert['_group_count'] = count
+            return alerts
         
-        return self.loki.query_range(query, start, end, limit)
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            return [alert for alerts in pool.map(examples, counts) for alert in alerts]
+    
+    def pretriage(self, alert: dict) -> Optional[dict]:
+        """Pre-triage assessment of an alert (kept on it as '_triage'), or
+        None without a triage model."""
+        if self.triage is None:
+            return None
+        if '_triage' not in alert:
+            labels = alert.get('_labels', {})
+            obfuscated, _ = obfuscate_alert(alert, self.obfuscation_level)
+            alert['_triage'] = self.triage.assess(
+                labels.get('rule', alert.get('rule', 'Unknown')), obfuscated.get('output', ''),
+                labels.get('priority', alert.get('priority', 'Unknown')))
+        return alert['_triage']
+    
+    def find_similar(self, alert: dict, obfuscated: Optional[dict] = None) -> Optional[dict]:
+        """Cached analysis of a near-duplicate alert of the same rule (kept
+        on it as '_similar'), or None."""
+        if self.cache is None:
+            return None
+        if '_similar' not in alert:
+            if obfuscated is None:
+                obfuscated, _ = obfuscate_alert(alert, self.obfuscation_level)
+            labels = alert.get('_labels', {})
+            found = self.cache.find_similar(labels.get('rule', alert.get('rule', 'Unknown')),
+                                            obfuscated.get('output', ''))
+            alert['_similar'] = None
+            if found is not None:
+                cached, score = found
+                alert['_similar'] = {'cache_key': cached['cache_key'], 'score': round(score, 4),
+                                     'analysis': cached['analysis']}
+        return alert['_similar']
+    
+    def needs_llm(self, alert: dict) -> bool:
+        """False when the alert will be answered locally (rule knowledge, a
+        similar cached analysis or pre-triage), so callers need not wait for
+        an LLM slot."""
+        if self.knowledge is not None and self.knowledge.match(alert) is not None:
+            return False
+        if self.find_similar(alert) is not None:
+            return False
+        assessment = self.pretriage(alert)
+        return not (assessment and assessment['action'] == SKIP)
     
     def analyze_alert(self, alert: dict, dry_run: bool = False) -> dict:
         """Analyze a single alert."""
         # Obfuscate the alert
         obfuscated, mapping = obfuscate_alert(alert, self.obfuscation_level)
         
-        # Build the prompt
+        # Build the prompt, compacting an output too large for the token budget
         labels = alert.get('_labels', {})
-        user_prompt = USER_PROMPT_TEMPLATE.format(
-            rule_name=labels.get('rule', alert.get('rule', 'Unknown')),
-            priority=labels.get('priority', alert.get('priority', 'Unknown')),
-            timestamp=alert.get('_timestamp', 'Unknown'),
-            source=labels.get('source', 'syscall'),
-            obfuscated_output=obfuscated.get('output', str(obfuscated)),
-            container_image=obfuscated.get('output_fields', {}).get('container.image.repository', 'N/A'),
-            syscall=obfuscated.get('output_fields', {}).get('syscall.type', 'N/A'),
-            process=obfuscated.get('output_fields', {}).get('proc.name', 'N/A'),
-            parent_process=obfuscated.get('output_fields', {}).get('proc.pname', 'N/A'),
+        fields = {
+            'rule_name': labels.get('rule', alert.get('rule', 'Unknown')),
+            'priority': labels.get('priority', alert.get('priority', 'Unknown')),
+            'timestamp': alert.get('_timestamp', 'Unknown'),
+            'source': labels.get('source', 'syscall'),
+            'container_image': obfuscated.get('output_fields', {}).get('container.image.repository', 'N/A'),
+            'syscall': obfuscated.get('output_fields', {}).get('syscall.type', 'N/A'),
+            'process': obfuscated.get('output_fields', {}).get('proc.name', 'N/A'),
+            'parent_process': obfuscated.get('output_fields', {}).get('proc.pname', 'N/A'),
+        }
+        fixed_tokens = (estimate_tokens(SYSTEM_PROMPT)
+                        + estimate_tokens(USER_PROMPT_TEMPLATE.format(obfuscated_output='', **fields)))
+        prompt_output, compaction = compact(obfuscated.get('output', str(obfuscated)),
+                                            self.prompt_budget - fixed_tokens)
+        user_prompt = USER_PROMPT_TEMPLATE.format(obfuscated_output=prompt_output, **fields)
+        
+        rule_name = labels.get('rule', alert.get('rule', ''))
+        known = self.knowledge.answer(alert, obfuscated) if self.knowledge is not None else None
+        similar = self.find_similar(alert, obfuscated) if known is None else None
+        assessment = None
+        if self.triage is not None and known is None and similar is None:
+            assessment = alert.get('_triage') or self.triage.assess(
+                labels.get('rule', alert.get('rule', 'Unknown')), obfuscated.get('output', ''),
+                labels.get('priority', alert.get('priority', 'Unknown')))
+        
+        if dry_run:
+            result = {
+                'obfuscated_prompt': user_prompt,
+                'obfuscation_mapping': mapping,
+                'note': 'Dry run - no LLM call made'
+            }
+            rule_mitre = self.mitre.lookup(rule_name)
+            if rule_mitre:
+                result['rule_mitre'] = rule_mitre
+            if known:
+                result['knowledge'] = known['knowledge']
+            if similar:
+                result['similar'] = {k: similar[k] for k in ('cache_key', 'score')}
+            if assessment:
+                result['triage'] = assessment
+            if compaction:
+                result['compaction'] = compaction
+            return result
+        
+        # Quick MITRE mapping from the rule's tags, if available
+        quick_mitre = self.mitre.fallback(rule_name)
+        
+        llm_timing = None
+        if known is not None:
+            # Routine alert of a well-known rule
+            analysis = known
+        elif similar is not None:
+            # Near-duplicate of an alert the LLM already analyzed
+            analysis = copy.deepcopy(similar['analysis'])
+            analysis['similar'] = {k: similar[k] for k in ('cache_key', 'score')}
+        elif assessment and assessment['action'] == SKIP:
+            # Confidently a false positive - answered by the local model
+            analysis = self.triage.analysis(assessment, quick_mitre)
+        else:
+            # Call LLM
+            try:
+                analysis = self.provider.analyze(SYSTEM_PROMPT, user_prompt)
+                llm_timing = self.provider.timing()
+                analysis['mitre_attack'] = self.mitre.normalize(analysis.get('mitre_attack'), rule_name)
+            except Exception as e:
+                print(f"LLM analysis failed: {e}", file=sys.stderr)
+                analysis = {
+                    'error': 'LLM analysis failed',
+                    'fallback_mitre': quick_mitre
+                }
+        
+        result = {
+            'original_alert': alert,
+            'obfuscated_alert': obfuscated,
+            'obfuscation_mapping': mapping,
+            'analysis': analysis
+        }
+        if assessment:
+            result['triage'] = assessment
+        if compaction:
+            result['compaction'] = compaction
+        if llm_timing:
+            result['llm'] = llm_timing
+        return result
+    
+    def analyze_incident(self, incident: Incident, dry_run: bool = False) -> dict:
+        """Analyze the alerts of an incident together, with one LLM call."""
+        # One mapping for the whole incident keeps tokens consistent across alerts
+        obfuscated, hostname, mapping = obfuscate_incident(incident.alerts, incident.hostname,
+                                                           self.obfuscation_level)
+        images = sorted({a.get('output_fields', {}).get('container.image.repository')
+                         for a in obfuscated} - {None, ''})
+        duration = (incident.last_ns - incident.first_ns) / 1e9
+        user_prompt = INCIDENT_PROMPT_TEMPLATE.format(
+            alert_count=len(incident.alerts),
+            hostname=hostname,
+            containers=', '.join(images) or 'N/A',
+            start=incident.start,
+            end=incident.end,
+            duration=f"{duration:.0f}s",
+            rules=', '.join(incident.rules),
+            timeline=format_timeline(obfuscated),
         )
+        summary = {
+            'id': incident.id,
+            'hostname': incident.hostname,
+            'start': incident.start,
+            'end': incident.end,
+            'alert_count': len(incident.alerts),
+            'rules': incident.rules,
+        }
         
         if dry_run:
             return {
+                'incident': summary,
                 'obfuscated_prompt': user_prompt,
                 'obfuscation_mapping': mapping,
                 'note': 'Dry run - no LLM call made'
             }
         
-        # Get quick MITRE mapping if available
-        rule_name = labels.get('rule', alert.get('rule', ''))
-        quick_mitre = MITRE_MAPPING.get(rule_name, None)
-        
-        # Call LLM
+        llm_timing = None
         try:
             analysis = self.provider.analyze(SYSTEM_PROMPT, user_prompt)
+            llm_timing = self.provider.timing()
+            # Tags of the latest rule in the chain fill in a malformed mapping
+            analysis['mitre_attack'] = self.mitre.normalize(analysis.get('mitre_attack'), incident.rules[-1])
         except Exception as e:
             print(f"LLM analysis failed: {e}", file=sys.stderr)
-            analysis = {
-                'error': 'LLM analysis failed',
-                'fallback_mitre': quick_mitre
-            }
+            analysis = {'error': 'LLM analysis failed'}
         
-        return {
-            'original_alert': alert,
-            'obfuscated_alert': obfuscated,
+        result = {
+            'incident': summary,
+            'original_alerts': incident.alerts,
+            'obfuscated_alerts': obfuscated,
             'obfuscation_mapping': mapping,
             'analysis': analysis
         }
+        if llm_timing:
+            result['llm'] = llm_timing
+        return result
+    
+    def _store_entry(self, labels: Dict[str, str], entry: dict, timestamp: Optional[datetime],
+                     writer: Optional[LogBatchWriter], on_stored: Optional[Callable[[bool], None]]) -> bool:
+        metadata = None
+        if self.storage_mode == 'metadata':
+            metadata = {k: v for k, v in labels.items() if k not in STREAM_LABELS}
+            labels = {k: labels[k] for k in STREAM_LABELS}
+        
+        if writer is not None:
+            writer.add(labels, json.dumps(entry), timestamp, callback=on_stored, metadata=metadata)
+            return True
+        
+        stored = self.backend.push(labels, json.dumps(entry), timestamp, metadata)
+        if on_stored is not None:
+            on_stored(stored)
+        return stored
+    
+    def store_incident(self, result: dict, writer: Optional[LogBatchWriter] = None,
+                       on_stored: Optional[Callable[[bool], None]] = None) -> bool:
+        """Store an incident analysis (type="incident") in the log backend."""
+        analysis = result.get('analysis', {})
+        incident = result.get('incident', {})
+        alerts = result.get('original_alerts', [])
+        mitre = analysis.get('mitre_attack', {})
+        risk = analysis.get('risk', {})
+        fp = analysis.get('false_positive', {})
+        priorities = [a.get('_labels', {}).get('priority', a.get('priority', '')) for a in alerts]
+        
+        incident_labels = {
+            'source': 'analysis',
+            'type': 'incident',
+            'original_priority': min(priorities, key=lambda p: PRIORITY_RANK.get(str(p).lower(), 99),
+                                     default='unknown') or 'unknown',
+            'hostname': incident.get('hostname', 'unknown'),
+            'severity': risk.get('severity', 'unknown').lower(),
+            'mitre_tactic': mitre.get('tactic', 'unknown').replace(' ', '_'),
+            'mitre_technique': mitre.get('technique_id', 'unknown'),
+            'false_positive': str(fp.get('likely', False)).lower(),
+        }
+        incident_entry = {
+            'incident_id': incident.get('id', ''),
+            'start': incident['start'].isoformat() if isinstance(incident.get('start'), datetime) else str(incident.get('start', '')),
+            'end': incident['end'].isoformat() if isinstance(incident.get('end'), datetime) else str(incident.get('end', '')),
+            'alert_count': incident.get('alert_count', len(alerts)),
+            'rules': incident.get('rules', []),
+            'hostname': incident.get('hostname', ''),
+            'timeline': [{
+                'timestamp': a['_timestamp'].isoformat() if isinstance(a.get('_timestamp'), datetime) else str(a.get('_timestamp', '')),
+                'rule': a.get('_labels', {}).get('rule', a.get('rule', '')),
+                'priority': a.get('_labels', {}).get('priority', a.get('priority', '')),
+                'output': a.get('output', ''),
+            } for a in alerts],
+            'attack_vector': analysis.get('attack_vector', ''),
+            'mitre_attack': mitre,
+            'risk': risk,
+            'mitigations': analysis.get('mitigations', {}),
+            'false_positive': analysis.get('false_positive', {}),
+            'summary': analysis.get('summary', ''),
+            'investigate': analysis.get('investigate', []),
+        }
+        # Stored at the time of the last alert, when the incident was complete
+        return self._store_entry(incident_labels, incident_entry, incident.get('end'), writer, on_stored)
+    
+    @staticmethod
+    def incident_alert_result(result: dict, index: int) -> dict:
+        """Per-alert result for one alert of an analyzed incident."""
+        return {
+            'original_alert': result['original_alerts'][index],
+            'obfuscated_alert': result['obfuscated_alerts'][index],
+            'obfuscation_mapping': result.get('obfuscation_mapping', {}),
+            'analysis': result.get('analysis', {}),
+            'incident_id': result.get('incident', {}).get('id'),
+        }
     
-    def store_analysis(self, result: dict) -> bool:
-        """Store analysis result in Loki."""
+    def store_analysis(self, result: dict, writer: Optional[LogBatchWriter] = None,
+                       on_stored: Optional[Callable[[bool], None]] = None) -> bool:
+        """Store analysis result in the log backend.
+
+        With a writer the entry is only buffered (and True returned);
+        on_stored is called with the outcome once it was pushed.
+        """
         analysis = result.get('analysis', {})
         original = result.get('original_alert', {})
         labels = original.get('_labels', {})
@@ -342,29 +1176,159 @@ class AlertAnalyzer:
             'summary': analysis.get('summary', ''),
             'investigate': analysis.get('investigate', []),
         }
+        if '_sampled' in original:
+            # Stands for a whole alert storm (see storm.py)
+            enriched_entry['sampled'] = original['_sampled']
+        if result.get('incident_id'):
+            enriched_entry['incident_id'] = result['incident_id']
+        if 'triage' in result:
+            enriched_entry['triage'] = result['triage']
+        if 'compaction' in result:
+            enriched_entry['compaction'] = result['compaction']
+        if 'llm' in result:
+            enriched_entry['llm'] = result['llm']
+        if 'knowledge' in analysis:
+            enriched_entry['knowledge'] = analysis['knowledge']
+        if 'similar' in analysis:
+            enriched_entry['similar'] = analysis['similar']
         
-        return self.loki.push(
-            enriched_labels,
-            json.dumps(enriched_entry),
-            original.get('_timestamp')
-        )
+        return self._store_entry(enriched_labels, enriched_entry, original.get('_timestamp'),
+                                 writer, on_stored)
     
-    def analyze_batch(self, alerts: List[dict], dry_run: bool = False, store: bool = False) -> List[dict]:
-        """Analyze multiple alerts."""
-        results = []
-        for i, alert in enumerate(alerts):
-            print(f"Analyzing alert {i+1}/{len(alerts)}...", file=sys.stderr)
-            result = self.analyze_alert(alert, dry_run)
-            results.append(result)
-            
-            # Store in Loki if requested
-            if store and not dry_run and 'error' not in result.get('analysis', {}):
-                if self.store_analysis(result):
-                    print(f"  ✓ Stored analysis in Loki", file=sys.stderr)
-                else:
-                    print(f"  ✗ Failed to store analysis", file=sys.stderr)
+    def _analyze_incident_item(self, incident: Incident, position: str, dry_run: bool,
+                               writer: Optional[LogBatchWriter], ledger: Optional[Ledger],
+                               on_stored: Callable) -> Tuple[Optional[dict], int]:
+        """Analyze and queue one incident for iter_analyses.
+        
+        Returns:
+            Tuple of (result, queued): the incident result, or None when all
+            its alerts were already enriched, and the number of per-alert
+            entries queued for storage
+        """
+        # All alerts give context, but only unclaimed ones are stored again
+        claimed = [a for a in incident.alerts
+                   if ledger is None or '_fingerprint' not in a or ledger.claim(a)]
+        if not claimed:
+            print(f"Skipping incident {position} (already enriched)", file=sys.stderr)
+            return None, 0
         
-        return results
+        print(f"Analyzing incident {position} ({len(incident.alerts)} alerts on "
+              f"{incident.hostname})...", file=sys.stderr)
+        queued = set()
+        try:
+            result = self.analyze_incident(incident, dry_run)
+            if writer is not None and 'error' not in result.get('analysis', {}):
+                self.store_incident(result, writer)
+                for index, alert in enumerate(incident.alerts):
+                    if any(alert is c for c in claimed):
+                        tracked = ledger is not None and '_fingerprint' in alert
+                        self.store_analysis(self.incident_alert_result(result, index), writer,
+                                            on_stored(alert, tracked))
+                        queued.add(id(alert))
+        finally:
+            if ledger is not None:
+                for alert in claimed:
+                    if id(alert) not in queued and '_fingerprint' in alert:
+                        ledger.release(alert)
+        return result, len(queued)
+    
+    def analyze_batch(self, alerts: Iterable[dict], dry_run: bool = False, store: bool = False,
+                      ledger: Optional[Ledger] = None) -> List[dict]:
+        """Analyze multiple alerts (a list, or an iterator such as iter_alerts).
+
+        Stored analyses are pushed to the log backend in batches. With a ledger, pushed
+        alerts are recorded and alerts already enriched by an earlier or
+        concurrent run are skipped.
+        """
+        return list(self.iter_analyses(alerts, dry_run, store, ledger))
+    
+    def iter_analyses(self, alerts: Iterable[dict], dry_run: bool = False, store: bool = False,
+                      ledger: Optional[Ledger] = None) -> Iterator[dict]:
+        """Like analyze_batch, but yield each result as soon as it is ready.
+
+        Items may also be Incidents (see incidents.py): an incident of
+        several alerts is analyzed with one call, and both the incident and
+        each of its alerts are stored. Pending pushes are flushed when the
+        iterator is exhausted or closed.
+        """
+        total = f"/{len(alerts)}" if hasattr(alerts, '__len__') else ''
+        use_ledger = ledger is not None and store and not dry_run
+        writer = LogBatchWriter(self.backend) if store and not dry_run else None
+        pushed = []
+        queued_total = 0
+        
+        def on_stored(alert: dict, tracked: bool) -> Callable[[bool], None]:
+            def callback(ok: bool):
+                if ok:
+                    pushed.append(alert)
+                if tracked:
+                    if ok:
+                        ledger.mark_done(alert)
+                    else:
+                        ledger.release(alert)
+            return callback
+        
+        try:
+            for i, item in enumerate(alerts):
+                if isinstance(item, Incident) and len(item.alerts) == 1:
+                    item = item.alerts[0]
+                if isinstance(item, Incident):
+                    result, incident_queued = self._analyze_incident_item(
+                        item, f"{i+1}{total}", dry_run, writer, ledger if use_ledger else None, on_stored)
+                    queued_total += incident_queued
+                    if result is not None:
+                        yield result
+                    continue
+                
+                alert = item
+                tracked = use_ledger and '_fingerprint' in alert
+                if tracked and not ledger.claim(alert):
+                    print(f"Skipping alert {i+1}{total} (already enriched)", file=sys.stderr)
+                    continue
+                
+                print(f"Analyzing alert {i+1}{total}...", file=sys.stderr)
+                queued = False
+                try:
+                    result = self.analyze_alert(alert, dry_run)
+                    
+                    # Queue for the log backend if requested
+                    if writer is not None and 'error' not in result.get('analysis', {}):
+                        queued = self.store_analysis(result, writer, on_stored(alert, tracked))
+                        queued_total += 1
+                finally:
+                    if tracked and not queued:
+                        ledger.release(alert)
+                yield result
+        finally:
+            if writer is not None:
+                writer.close()
+                if pushed:
+                    print(f"  ✓ Stored {len(pushed)} analyses in {self.backend.name} ({writer.requests} requests)",
+                          file=sys.stderr)
+                if len(pushed) < queued_total:
+                    print(f"  ✗ Failed to store {queued_total - len(pushed)} analyses", file=sys.stderr)
+
+
+def parse_duration(value: str) -> timedelta:
+    """Parse a duration like 15m, 1h or 7d."""
+    duration_map = {'m': 'minutes', 'h': 'hours', 'd': 'days'}
+    unit = value[-1]
+    amount = int(value[:-1])
+    return timedelta(**{duration_map[unit]: amount})
+
+
+def parse_since(value: str, now: datetime) -> datetime:
+    """Parse a duration back from now (7d), 'now', epoch seconds or ISO 8601."""
+    if value == 'now':
+        return now
+    if value[-1:] in ('m', 'h', 'd') and value[:-1].isdigit():
+        return now - parse_duration(value)
+    try:
+        return datetime.fromtimestamp(float(value))
+    except ValueError:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        # Naive local time, like the rest of the analyzer
+        return parsed.astimezone().replace(tzinfo=None) if parsed.tzinfo else parsed
 
 
 def read_secret(env_var: str, default: str = '') -> str:
@@ -476,6 +1440,35 @@ def print_analysis(result: dict, verbose: bool = False):
     print("🔍 SECURITY ALERT ANALYSIS")
     print("="*70)
     
+    original = result.get('original_alert', {})
+    if '_group_count' in original:
+        print(f"\n📈 Occurrences: {original['_group_count']} ({', '.join(f'{k}={v}' for k, v in original['_group'].items())})")
+    incident = result.get('incident')
+    if incident:
+        print(f"\n🔗 Incident {incident['id']}: {incident['alert_count']} related alerts on "
+              f"{incident['hostname']} ({incident['start']} - {incident['end']})")
+        for rule in incident['rules']:
+            print(f"     • {rule}")
+    if 'knowledge' in analysis:
+        print(f"\n📚 Known rule: answered from the rule knowledge base ({analysis['knowledge']['version']}), no LLM call")
+    triage = result.get('triage')
+    if triage and triage['action'] == SKIP:
+        print(f"\n⚡ Pre-triaged locally: likely false positive "
+              f"({triage['false_positive_probability']['High']:.0%}), no LLM call")
+    compaction = result.get('compaction')
+    if compaction:
+        print(f"\n✂️  Prompt compacted: alert output {compaction['tokens_before']} → {compaction['tokens_after']} "
+              f"tokens ({', '.join(compaction['steps'])})")
+    llm = result.get('llm')
+    if verbose and llm:
+        print(f"\n⏱️  Ollama: load {llm['load_ms']}ms, prompt {llm['prompt_eval_count']} tokens in "
+              f"{llm['prompt_eval_ms']}ms, response {llm['eval_count']} tokens in {llm['eval_ms']}ms "
+              f"(num_ctx {llm['num_ctx']})")
+    if '_sampled' in original:
+        sampled = original['_sampled']
+        print(f"\n🌩️  Alert storm: sample of {sampled['population']} alerts "
+              f"({sampled['sampled']} analyzed, window from {sampled['window_start']})")
+    
     # Attack Vector
     print(f"\n🎯 Attack Vector:")
     print(f"   {analysis.get('attack_vector', 'N/A')}")
@@ -532,6 +1525,50 @@ def print_analysis(result: dict, verbose: bool = False):
     print("\n" + "="*70)
 
 
+def report_sampling(storm: Optional[StormController]):
+    if storm is not None and storm.dropped:
+        print(f"Alert storm sampling left out {storm.dropped} alerts (--no-sampling to analyze all)",
+              file=sys.stderr)
+
+
+def run_backfill(analyzer: AlertAnalyzer, args):
+    """Re-analyze --since..--until in time shards, resuming from the checkpoint."""
+    if not args.store and not args.dry_run:
+        print("Backfill needs --store (or --dry-run); results are not printed.", file=sys.stderr)
+        sys.exit(1)
+    query = analyzer.alert_query(args.priority, args.rule)
+    # Relative times are resolved once and kept in the checkpoint, so a
+    # resumed run covers the same range as the interrupted one
+    checkpoint = Checkpoint(Path(args.checkpoint), {
+        'query': query,
+        'since': args.since,
+        'until': args.until,
+        'shard': args.shard,
+        'backend': analyzer.backend.name,
+    })
+    if not checkpoint.load():
+        now = datetime.now()
+        checkpoint.start(parse_since(args.since, now), parse_since(args.until, now))
+    shards = split_range(checkpoint.since, checkpoint.until, parse_duration(args.shard))
+    print(f"Backfilling {checkpoint.since.isoformat()} - {checkpoint.until.isoformat()} "
+          f"in {len(shards)} shards ({analyzer.backend.name})...", file=sys.stderr)
+
+    writer = ledger = None
+    if args.store and not args.dry_run:
+        writer = LogBatchWriter(analyzer.backend)
+        if not args.reprocess:
+            ledger = Ledger(Path(args.ledger))
+            ledger.prune()
+    stats = Backfill(
+        analyzer, query, shards, checkpoint, writer=writer, ledger=ledger,
+        fetch_workers=max(1, args.fetch_workers), concurrency=max(1, args.concurrency),
+        dry_run=args.dry_run,
+        scheduler=AnalysisScheduler.from_config(analyzer.config, max_queued=max(1, args.concurrency) * 50),
+    ).run()
+    if args.json:
+        print(json.dumps(stats))
+
+
 def main():
     parser = argparse.ArgumentParser(
         description='SIB Alert Analyzer - AI-powered security alert analysis'
@@ -541,17 +1578,59 @@ def main():
                         help='Filter by priority')
     parser.add_argument('--last', '-l', default='1h',
                         help='Time range (e.g., 15m, 1h, 24h, 7d)')
-    parser.add_argument('--limit', '-n', type=int, default=5,
-                        help='Maximum number of alerts to analyze')
+    parser.add_argument('--limit', '-n', type=int,
+                        help='Maximum number of alerts to analyze (default: 5, or all with --input; '
+                             '0 = all, oldest first)')
+    parser.add_argument('--rule', '-r', metavar='REGEX',
+                        help='Only alerts whose rule matches this regex (filtered in the log backend)')
+    parser.add_argument('--group-by', '-g', metavar='FIELDS',
+                        help='Analyze examples of the largest groups (e.g., rule,hostname) instead of '
+                             'raw alerts; --limit sets the number of groups (default: 10)')
+    parser.add_argument('--per-group', type=int, default=1,
+                        help='Example alerts analyzed per group with --group-by (default: 1)')
+    parser.add_argument('--incidents', action='store_true',
+                        help='Group related alerts (same host, container or process tree) and analyze '
+                             'each group as one incident')
+    parser.add_argument('--incident-window', default='10m',
+                        help='Gap after which an incident is closed (default: 10m)')
+    parser.add_argument('--no-sampling', action='store_true',
+                        help='Analyze every alert of storming rules (config: analysis.storm)')
+    parser.add_argument('--no-triage', action='store_true',
+                        help='Send every alert to the LLM, even with a pre-triage model (config: analysis.triage)')
+    parser.add_argument('--input', '-i', metavar='FILE',
+                        help='Read Falco JSON lines from a file (gzip detected, - for stdin) instead of the log backend')
+    parser.add_argument('--stdin', action='store_true',
+                        help='Read Falco JSON lines from stdin (same as --input -)')
     parser.add_argument('--dry-run', '-d', action='store_true',
                         help='Show obfuscated data without calling LLM')
     parser.add_argument('--store', '-s', action='store_true',
-                        help='Store analysis results in Loki for Grafana dashboards')
+                        help='Store analysis results in the log backend for Grafana dashboards')
     parser.add_argument('--verbose', '-v', action='store_true',
                         help='Show detailed output including obfuscation mapping')
     parser.add_argument('--json', '-j', action='store_true',
                         help='Output raw JSON instead of formatted text')
+    parser.add_argument('--ndjson', action='store_true',
+                        help='Output one compact JSON line per result as soon as it completes')
+    parser.add_argument('--backend', choices=['loki', 'victorialogs'],
+                        help='Override log backend (config: log_backend)')
     parser.add_argument('--loki-url', help='Override Loki URL')
+    parser.add_argument('--victorialogs-url', help='Override VictoriaLogs URL')
+    parser.add_argument('--ledger', default=DEFAULT_LEDGER,
+                        help=f'Processed-alert ledger used with --store (default: {DEFAULT_LEDGER})')
+    parser.add_argument('--since',
+                        help='Backfill from this time (e.g., 7d, 2026-01-01T00:00:00, epoch seconds)')
+    parser.add_argument('--until', default='now',
+                        help='Backfill up to this time (default: now)')
+    parser.add_argument('--shard', default='1h',
+                        help='Backfill shard size (default: 1h)')
+    parser.add_argument('--fetch-workers', type=int, default=4,
+                        help='Backfill shards fetched in parallel (default: 4)')
+    parser.add_argument('--concurrency', type=int, default=4,
+                        help='Backfill analyses run in parallel (default: 4)')
+    parser.add_argument('--checkpoint', default=DEFAULT_CHECKPOINT,
+                        help=f'Backfill progress file for resuming (default: {DEFAULT_CHECKPOINT})')
+    parser.add_argument('--reprocess', action='store_true',
+                        help='Re-analyze alerts even if the ledger says they were enriched')
     
     args = parser.parse_args()
     
@@ -559,8 +1638,12 @@ def main():
     config = load_config(args.config)
     
     # Override with CLI args
+    if args.backend:
+        config['log_backend'] = args.backend
     if args.loki_url:
         config.setdefault('loki', {})['url'] = args.loki_url
+    if args.victorialogs_url:
+        config.setdefault('victorialogs', {})['url'] = args.victorialogs_url
     
     # Check if analysis is enabled
     if not config.get('analysis', {}).get('enabled', True):
@@ -568,29 +1651,120 @@ def main():
         sys.exit(1)
     
     # Create analyzer
-    analyzer = AlertAnalyzer(config)
+    analyzer = AlertAnalyzer(config, triage=not args.no_triage)
+    
+    if args.stdin:
+        args.input = '-'
+    if args.limit is None and not args.input and not args.group_by:
+        args.limit = 5
+    if args.since:
+        if args.input:
+            print("--since cannot be combined with --input/--stdin.", file=sys.stderr)
+            sys.exit(1)
+        run_backfill(analyzer, args)
+        return
     
     # Fetch alerts
-    print(f"Fetching alerts from last {args.last}...", file=sys.stderr)
-    alerts = analyzer.fetch_alerts(priority=args.priority, last=args.last, limit=args.limit)
+    source = None
+    if args.input:
+        # Offline replay: alerts are read lazily while they are analyzed
+        print(f"Reading Falco JSON from {'stdin' if args.input == '-' else args.input}...", file=sys.stderr)
+        try:
+            source = open_alert_file(args.input)
+        except OSError as e:
+            print(f"Cannot read {args.input}: {e}", file=sys.stderr)
+            sys.exit(1)
+        alerts = read_falco_json(source, priority=args.priority, rule=args.rule)
+        if args.limit:
+            alerts = itertools.islice(alerts, args.limit)
+    elif args.group_by:
+        # Let the backend count; pull only a few examples of the top groups
+        by = [f.strip() for f in args.group_by.split(',') if f.strip()]
+        print(f"Fetching top {args.limit or 10} groups by {', '.join(by)} from last {args.last} "
+              f"({analyzer.backend.name})...", file=sys.stderr)
+        try:
+            alerts = analyzer.fetch_grouped(by, priority=args.priority, last=args.last,
+                                            groups=args.limit or 10, per_group=args.per_group,
+                                            rule=args.rule)
+        except ValueError as e:
+            print(str(e), file=sys.stderr)
+            sys.exit(1)
+        
+        if not alerts:
+            print("No alerts found matching criteria.")
+            sys.exit(0)
+        
+        shown = []
+        for alert in alerts:
+            if alert['_group'] not in shown:
+                shown.append(alert['_group'])
+                print(f"  {alert['_group_count']:>7}  {' / '.join(alert['_group'].values())}", file=sys.stderr)
+        print(f"Found {len(alerts)} example alerts. Analyzing...", file=sys.stderr)
+    elif args.limit > 0:
+        print(f"Fetching alerts from last {args.last} ({analyzer.backend.name})...", file=sys.stderr)
+        alerts = analyzer.fetch_alerts(priority=args.priority, last=args.last, limit=args.limit,
+                                       rule=args.rule)
+        
+        if not alerts:
+            print("No alerts found matching criteria.")
+            sys.exit(0)
+        
+        print(f"Found {len(alerts)} alerts. Analyzing...", file=sys.stderr)
+    else:
+        # Page through the whole window, analyzing while fetching
+        print(f"Fetching alerts from last {args.last} ({analyzer.backend.name})...", file=sys.stderr)
+        alerts = analyzer.iter_alerts(priority=args.priority, last=args.last, rule=args.rule)
     
-    if not alerts:
-        print("No alerts found matching criteria.")
-        sys.exit(0)
+    # Analyze
+    ledger = None
+    if args.store and not args.dry_run and not args.reprocess:
+        ledger = Ledger(Path(args.ledger))
+        ledger.prune()
+    storm = None if args.no_sampling else StormController.from_config(config)
+    if storm is not None:
+        if isinstance(alerts, list):
+            # Rates are tracked in time order
+            alerts.sort(key=lambda a: a.get('_timestamp_ns', 0))
+        # Left-out alerts count as enriched, so later runs don't sample them again
+        alerts = storm.stream(alerts, on_drop=ledger.mark_done if ledger is not None else None)
+    if args.incidents:
+        if isinstance(alerts, list):
+            alerts.sort(key=lambda a: a.get('_timestamp_ns', 0))
+        correlator = IncidentCorrelator(window=parse_duration(args.incident_window).total_seconds())
+        alerts = correlator.stream(alerts)
     
-    print(f"Found {len(alerts)} alerts. Analyzing...", file=sys.stderr)
+    # JSON output - convert datetime to string
+    def json_serial(obj):
+        if isinstance(obj, datetime):
+            return obj.isoformat()
+        raise TypeError(f"Type {type(obj)} not serializable")
     
-    # Analyze
-    results = analyzer.analyze_batch(alerts, dry_run=args.dry_run, store=args.store)
+    if args.ndjson:
+        # Stream results (for jq, Vector, ...) instead of collecting them
+        results = analyzer.iter_analyses(alerts, dry_run=args.dry_run, store=args.store, ledger=ledger)
+        try:
+            for result in results:
+                sys.stdout.write(json.dumps(result, separators=(',', ':'), default=json_serial) + '\n')
+                sys.stdout.flush()
+        except BrokenPipeError:
+            # Reader went away (e.g. | head); stop analyzing but flush pending pushes
+            results.close()
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        finally:
+            if source is not None and source is not sys.stdin:
+                source.close()
+            report_sampling(storm)
+        return
+    
+    try:
+        results = analyzer.analyze_batch(alerts, dry_run=args.dry_run, store=args.store, ledger=ledger)
+    finally:
+        if source is not None and source is not sys.stdin:
+            source.close()
+        report_sampling(storm)
     
     # Output
     if args.json:
-        # JSON output - convert datetime to string
-        def json_serial(obj):
-            if isinstance(obj, datetime):
-                return obj.isoformat()
-            raise TypeError(f"Type {type(obj)} not serializable")
-        
         print(json.dumps(results, indent=2, default=json_serial))
     else:
         for result in results:
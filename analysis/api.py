@@ -9,22 +9,39 @@ import os
 import re
 import sys
 import json
-import time
 import logging
+import gzip
 import hashlib
-from datetime import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+from datetime import datetime, timezone
 from pathlib import Path
 from markupsafe import escape as html_escape
-from flask import Flask, request, jsonify, render_template_string
+from flask import Flask, Response, request, jsonify, render_template, make_response, url_for, g
+from jinja2 import ChoiceLoader, DictLoader
 from flask_cors import CORS
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
+from limits import parse_many
+from werkzeug.http import is_resource_modified
+
+try:
+    import brotli
+except ImportError:  # optional - gzip is used when brotli isn't installed
+    brotli = None
 
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from analyzer import AlertAnalyzer, load_config
+from analyzer import AlertAnalyzer, LLM_REQUEST_TIMEOUT, create_provider, load_config
 from obfuscator import Obfuscator, ObfuscationLevel
+from singleflight import SingleFlight
+from jobs import JobQueue, JobError, QueueFull, is_valid_job_id, ACTIVE_STATES, DONE
+from admission import AdmissionController, Overloaded, provider_limits
+from cache import AnalysisCache, get_cache_key
+from mitre import MitreIndex
+from history import FILTER_COLUMNS, SORT_COLUMNS, parse_time
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -39,12 +56,13 @@ if cors_origins != '*':
     cors_origins = [o.strip() for o in cors_origins.split(',')]
 CORS(app, resources={r"/api/*": {"origins": cors_origins}, r"/analyze": {"origins": cors_origins}})
 
-# Rate limiting
+# Rate limiting - memory:// counts per gunicorn worker; point RATELIMIT_STORAGE_URI
+# at a shared backend (e.g. redis://sib-redis:6379) for service-wide limits
 limiter = Limiter(
     app=app,
     key_func=get_remote_address,
     default_limits=["200 per day", "50 per hour"],
-    storage_uri="memory://",
+    storage_uri=os.environ.get('RATELIMIT_STORAGE_URI', 'memory://'),
 )
 
 # API key authentication (optional - set API_KEY env var to enable)
@@ -61,38 +79,94 @@ def check_auth():
     if provided_key != API_KEY:
         return jsonify({'error': 'Authentication required'}), 401
 
+# Response compression for text payloads (streams are left alone)
+COMPRESSIBLE_TYPES = {'text/html', 'text/plain', 'application/json'}
+COMPRESS_MIN_SIZE = 500
+
+
+@app.after_request
+def compress_response(response):
+    """Brotli- or gzip-encode text responses when the client accepts it."""
+    if (response.direct_passthrough or response.is_streamed
+            or response.status_code < 200 or response.status_code in (204, 304)
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_TYPES):
+        return response
+    
+    response.vary.add('Accept-Encoding')
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+    
+    accepted = request.accept_encodings
+    if brotli and accepted['br']:
+        response.set_data(brotli.compress(data, quality=5))
+        response.headers['Content-Encoding'] = 'br'
+    elif accepted['gzip']:
+        response.set_data(gzip.compress(data, compresslevel=6))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
 # Load config once at startup
 config = load_config()
 
 # Valid alert priorities
 VALID_PRIORITIES = {'Critical', 'High', 'Medium', 'Low', 'Notice', 'Warning', 'Error', 'Unknown'}
 
-# Analysis cache directory
+# Analysis cache directory, with an index for history listing, filtering and search
 CACHE_DIR = Path(os.environ.get('ANALYSIS_CACHE_DIR', '/app/cache'))
-CACHE_DIR.mkdir(parents=True, exist_ok=True)
-try:
-    os.chmod(CACHE_DIR, 0o700)
-except OSError:
-    pass
+analysis_cache = AnalysisCache(CACHE_DIR, config)
+history_index = analysis_cache.index
 
+# Run cache cleanup on startup, then pick up entries written without the index
+analysis_cache.cleanup()
+history_index.sync(CACHE_DIR)
 
-def cleanup_old_cache(max_age_days: int = 7):
-    """Remove cache files older than max_age_days."""
-    cutoff = time.time() - (max_age_days * 86400)
-    removed = 0
-    for cache_file in CACHE_DIR.glob("*.json"):
-        try:
-            if cache_file.stat().st_mtime < cutoff:
-                cache_file.unlink()
-                removed += 1
-        except OSError:
-            pass
-    if removed:
-        logger.info(f"Cache cleanup: removed {removed} old entries")
+# Coalesce concurrent analyses of the same alert (across workers via lock files in CACHE_DIR).
+# A leader may wait for an LLM slot and then for the LLM itself before its lock counts as stale.
+LLM_QUEUE_TIMEOUT = float(os.environ.get('LLM_QUEUE_TIMEOUT', '60'))
+single_flight = SingleFlight(CACHE_DIR, timeout=float(os.environ.get('COALESCE_TIMEOUT', '90')),
+                             stale_after=LLM_QUEUE_TIMEOUT + LLM_REQUEST_TIMEOUT + 60)
 
 
-# Run cache cleanup on startup
-cleanup_old_cache()
+# Service-wide LLM concurrency budget shared by all workers (CACHE_DIR/admission.db)
+LLM_PROVIDER = config.get('analysis', {}).get('provider', 'ollama')
+admission = AdmissionController(
+    CACHE_DIR / 'admission.db',
+    max_in_flight=int(os.environ.get('LLM_MAX_IN_FLIGHT', '2')),
+    max_queue=int(os.environ.get('LLM_MAX_QUEUE', '20')),
+    wait_timeout=LLM_QUEUE_TIMEOUT,
+    limits=provider_limits(config),
+)
+
+
+def warm_up_model():
+    """Load the local model so the first analysis doesn't wait for it.
+    
+    Runs in a background thread at startup; failures are logged, never raised.
+    """
+    try:
+        create_provider(config).warm_up()
+    except Exception:
+        logger.exception("Model warm-up failed")
+
+
+if LLM_PROVIDER == 'ollama':
+    threading.Thread(target=warm_up_model, daemon=True).start()
+
+
+def overloaded_response(e: Overloaded):
+    """429 with a Retry-After derived from the LLM queue depth."""
+    response = jsonify({'error': 'LLM service overloaded, retry later', 'retry_after': e.retry_after})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
+
+def llm_was_called(response) -> bool:
+    """Rate-limit deduction hook: cached and coalesced results are free."""
+    return g.get('llm_call', True)
 
 
 def is_valid_cache_key(key: str) -> bool:
@@ -484,110 +558,372 @@ LOADING_TEMPLATE = """
         <p style="font-size: 0.9em; margin-top: 20px;">This may take 10-30 seconds</p>
     </div>
     <script>
-        // Auto-submit form to trigger analysis
-        setTimeout(function() {
-            window.location.href = window.location.href.replace('/loading', '/result');
-        }, 500);
+        // Wait for the background job, then show the result
+        var resultUrl = '/result?job={{ job_id }}';
+        if (window.EventSource) {
+            var events = new EventSource('/api/jobs/{{ job_id }}/events');
+            events.addEventListener('status', function(e) {
+                var job = JSON.parse(e.data);
+                if (job.status !== 'queued' && job.status !== 'running') {
+                    events.close();
+                    window.location.href = resultUrl;
+                }
+            });
+            events.onerror = function() {
+                events.close();
+                setTimeout(function() { window.location.href = resultUrl; }, 2000);
+            };
+        } else {
+            setTimeout(function() { window.location.href = resultUrl; }, 3000);
+        }
     </script>
 </body>
 </html>
 """
 
-# ==================== Cache Functions ====================
+# History page template
+HISTORY_TEMPLATE = """
+<!DOCTYPE html>
+<html>
+<head>
+    <title>Analysis History - SIB</title>
+    <style>
+        body { font-family: -apple-system, sans-serif; background: #111217; color: #d8d9da; padding: 40px; }
+        h1 { color: #ff9830; }
+        table { width: 100%; border-collapse: collapse; margin-top: 20px; }
+        th, td { padding: 12px; text-align: left; border-bottom: 1px solid #2c3235; }
+        th { background: #1f2129; color: #73bf69; }
+        tr:hover { background: #1f2129; }
+        a { color: #3274d9; text-decoration: none; }
+        .back { margin-bottom: 20px; }
+        form input, form select, form button { background: #1f2129; color: #d8d9da; border: 1px solid #2c3235; border-radius: 4px; padding: 6px 10px; margin: 0 6px 6px 0; }
+        .pager { margin-top: 20px; }
+        .severity-critical { color: #f2495c; }
+        .severity-high { color: #ff9830; }
+        .severity-medium { color: #fade2a; }
+        .severity-low { color: #73bf69; }
+        .severity-unknown { color: #8e8e8e; }
+    </style>
+</head>
+<body>
+    {% macro field(name, placeholder) %}<input name="{{ name }}" value="{{ request.args.get(name, '') }}" placeholder="{{ placeholder }}">{% endmacro %}
+    {% macro select(name, options) %}<select name="{{ name }}">
+        <option value="">{{ name|title }}</option>
+        {% for o in options %}<option value="{{ o }}"{% if request.args.get(name) == o %} selected{% endif %}>{{ o }}</option>{% endfor %}
+    </select>{% endmacro %}
+    <div class="back"><a href="/">← Back to API</a></div>
+    <h1>📜 Analysis History</h1>
+    <p>{{ total }} cached analyses</p>
+    <form method="get" action="/history">
+        {{ field('q', 'Search summaries') }}
+        {{ field('rule', 'Rule') }}
+        {{ field('hostname', 'Hostname') }}
+        {{ select('priority', ['Critical', 'Error', 'Warning', 'Notice']) }}
+        {{ select('severity', ['critical', 'high', 'medium', 'low']) }}
+        {{ field('since', 'Since (ISO 8601)') }}
+        {{ field('until', 'Until (ISO 8601)') }}
+        {{ select('sort', sort_fields) }}
+        {{ select('order', ['desc', 'asc']) }}
+        <button type="submit">Filter</button>
+        <a href="/history">Reset</a>
+    </form>
+    <table>
+        <tr><th>Timestamp</th><th>Rule</th><th>Priority</th><th>AI Severity</th><th>Hostname</th></tr>
+        {% for a in analyses %}
+        {% set severity = a.severity or 'unknown' %}
+        <tr onclick="window.location='/history/{{ a.cache_key }}'" style="cursor: pointer;">
+            <td>{{ (a.timestamp or '')[:19] }}</td>
+            <td>{{ a.rule or '' }}</td>
+            <td>{{ a.priority or '' }}</td>
+            <td class="severity-{{ severity if severity in ['critical', 'high', 'medium', 'low'] else 'unknown' }}" style="font-weight: bold;">{{ severity }}</td>
+            <td>{{ a.hostname or '' }}</td>
+        </tr>
+        {% endfor %}
+    </table>
+    <div class="pager">{% if next_url %}<a href="{{ next_url }}">Next page →</a>{% endif %}</div>
+</body>
+</html>
+"""
 
-def normalize_output(output: str) -> str:
-    """Normalize alert output for consistent cache keys.
+# Home page template
+INDEX_TEMPLATE = """
+<!DOCTYPE html>
+<html>
+<head>
+    <title>SIB Analysis API</title>
+    <style>
+        body { font-family: -apple-system, sans-serif; background: #111217; color: #d8d9da; padding: 40px; }
+        h1 { color: #ff9830; }
+        h2 { color: #73bf69; margin-top: 30px; }
+        code { background: #2a2d35; padding: 2px 8px; border-radius: 4px; }
+        pre { background: #1f2129; padding: 20px; border-radius: 8px; overflow-x: auto; }
+        a { color: #3274d9; }
+        .stat { display: inline-block; background: #1f2129; padding: 15px 25px; border-radius: 8px; margin-right: 15px; }
+        .stat-value { font-size: 2em; color: #73bf69; }
+        .stat-label { color: #8e8e8e; }
+    </style>
+</head>
+<body>
+    <h1>🛡️ SIB Analysis API</h1>
+    <p>AI-powered security alert analysis with privacy protection.</p>
+    
+    <div style="margin: 30px 0;">
+        <div class="stat">
+            <div class="stat-value">{{ cached_count }}</div>
+            <div class="stat-label">Cached Analyses</div>
+        </div>
+        <a href="/history" style="background: #3274d9; color: white; padding: 15px 25px; border-radius: 8px; text-decoration: none;">📜 View History</a>
+    </div>
+    
+    <h2>Endpoints</h2>
     
-    Removes timestamps and normalizes whitespace to ensure
-    the same logical event produces the same cache key.
+    <h3>GET /analyze</h3>
+    <p>Analyze an alert and display results in a web page (for Grafana data links).</p>
+    <pre>GET /analyze?output=&lt;alert_text&gt;&amp;rule=&lt;rule_name&gt;&amp;priority=&lt;priority&gt;&amp;hostname=&lt;host&gt;</pre>
+    
+    <h3>GET /history</h3>
+    <p>Browse cached analyses with filters and search.</p>
+    
+    <h3>GET /api/history</h3>
+    <p>List cached analyses as JSON. Filters: <code>rule</code>, <code>severity</code>, <code>hostname</code>,
+    <code>priority</code> (repeatable), <code>since</code>/<code>until</code> (epoch or ISO 8601), <code>q</code> (summary search);
+    <code>sort</code> (timestamp, severity, rule, hostname, priority), <code>order</code>, <code>limit</code> (max 500).
+    Follow the <code>X-Next-Cursor</code> header (pass as <code>cursor</code>) for the next page.</p>
+    
+    <h3>GET /result?job=&lt;job_id&gt;</h3>
+    <p>Result page for a queued analysis (the loading page redirects here).</p>
+    
+    <h3>POST /api/analyze</h3>
+    <p>Analyze an alert and return JSON results.</p>
+    <pre>{
+"alert": "alert output text",
+"rule": "rule name",
+"priority": "Critical",
+"hostname": "host",
+"store": true,
+"async": false
+}</pre>
+    <p>With <code>"async": true</code> the request returns <code>202 Accepted</code> and a job id immediately.</p>
+    
+    <h3>POST /api/analyze/batch</h3>
+    <p>Analyze many alerts over one connection. Send a JSON array of alert objects or NDJSON
+    (<code>Content-Type: application/x-ndjson</code>); results stream back as NDJSON lines as each
+    analysis finishes. Rate limited per distinct uncached alert.</p>
+    
+    <h3>GET /api/jobs/&lt;job_id&gt;</h3>
+    <p>Poll a queued analysis; includes the result once <code>status</code> is <code>done</code>.</p>
+    
+    <h3>GET /api/jobs/&lt;job_id&gt;/events</h3>
+    <p>Server-sent events stream of job status changes.</p>
+    
+    <h3>GET /health</h3>
+    <p>Health check endpoint.</p>
+    
+    <h2>Grafana Integration</h2>
+    <p>Add a data link to your log panels:</p>
+    <pre>http://localhost:5000/analyze?output=${__value.raw}&amp;rule=${__data.fields.rule}&amp;priority=${__data.fields.priority}&amp;hostname=${__data.fields.hostname}</pre>
+</body>
+</html>
+"""
+
+# Templates are compiled once per process by Flask's Jinja environment and
+# reused from its cache (instead of re-parsing on every render_template_string)
+TEMPLATES = {
+    'analysis.html': ANALYSIS_TEMPLATE,
+    'loading.html': LOADING_TEMPLATE,
+    'history.html': HISTORY_TEMPLATE,
+    'index.html': INDEX_TEMPLATE,
+}
+app.jinja_env.loader = ChoiceLoader([DictLoader(TEMPLATES), app.jinja_env.loader])
+
+# Changes whenever the templates change, so stale cached pages revalidate
+TEMPLATE_VERSION = hashlib.sha256(''.join(TEMPLATES.values()).encode()).hexdigest()[:8]
+
+HISTORY_MAX_LIMIT = 500
+
+
+def history_query_args(default_limit: int = 50) -> dict:
+    """Build HistoryIndex.query() arguments from the request query string.
+    
+    Supported params: rule, severity, hostname, priority (repeatable),
+    since/until (epoch seconds or ISO 8601), q (summary search),
+    sort, order (asc/desc), limit and cursor.
     """
-    import re
-    # Normalize whitespace
-    normalized = ' '.join(output.split())
-    # Remove common timestamp patterns that make each event unique
-    # ISO format: 2026-01-09T12:34:56.789Z
-    normalized = re.sub(r'\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(\.\d+)?Z?', '[TIME]', normalized)
-    # Unix timestamp: 1234567890 or 1234567890.123
-    normalized = re.sub(r'\b\d{10,13}(\.\d+)?\b', '[TIMESTAMP]', normalized)
-    # Common date formats
-    normalized = re.sub(r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}', '[TIME]', normalized)
-    return normalized
-
-
-def get_cache_key(output: str, rule: str) -> str:
-    """Generate a cache key from alert output and rule."""
-    normalized = normalize_output(output)
-    content = f"{normalized}:{rule}"
-    return hashlib.sha256(content.encode()).hexdigest()[:16]
-
-
-def get_cached_analysis(cache_key: str) -> dict | None:
-    """Retrieve cached analysis if it exists."""
-    cache_file = CACHE_DIR / f"{cache_key}.json"
-    if cache_file.exists():
-        try:
-            with open(cache_file, 'r') as f:
-                return json.load(f)
-        except Exception as e:
-            logger.warning(f"Failed to read cache: {e}")
-    return None
-
-
-def save_to_cache(cache_key: str, result: dict, original_output: str, rule: str, priority: str, hostname: str):
-    """Save analysis result to cache."""
-    cache_file = CACHE_DIR / f"{cache_key}.json"
-    cache_data = {
-        'cache_key': cache_key,
-        'timestamp': datetime.now().isoformat(),
-        'original_output': original_output,
-        'rule': rule,
-        'priority': priority,
-        'hostname': hostname,
-        'analysis': result.get('analysis', {}),
-        'obfuscated_output': result.get('obfuscated_alert', {}).get('output', '') if isinstance(result.get('obfuscated_alert'), dict) else '',
-        'obfuscation_mapping': result.get('obfuscation_mapping', {})
+    args = request.args
+    since = args.get('since')
+    until = args.get('until')
+    return {
+        'filters': {field: args.getlist(field) for field in FILTER_COLUMNS},
+        'since': parse_time(since) if since else None,
+        'until': parse_time(until) if until else None,
+        'search': args.get('q', '').strip()[:200] or None,
+        'sort': args.get('sort', 'timestamp'),
+        'order': args.get('order', 'desc'),
+        'limit': max(1, min(args.get('limit', default_limit, type=int), HISTORY_MAX_LIMIT)),
+        'cursor': args.get('cursor') or None,
     }
-    try:
-        with open(cache_file, 'w') as f:
-            json.dump(cache_data, f, indent=2, default=str)
+
+
+def next_page_url(cursor: str) -> str:
+    """URL of the next page: the current query with the cursor replaced."""
+    args = request.args.to_dict(flat=False)
+    args['cursor'] = [cursor]
+    return url_for(request.endpoint, **args)
+
+
+def analyze_and_cache(cache_key: str, output: str, rule: str, priority: str,
+                      hostname: str, store: bool) -> tuple[dict, bool]:
+    """Analyze an alert (coalescing identical in-flight requests) and cache it.
+    
+    Returns:
+        Tuple of (cache record, shared) where shared is True when another
+        request's analysis was reused.
+    """
+    def run_analysis() -> dict:
+        alert = {
+            'output': output,
+            '_labels': {
+                'rule': rule,
+                'priority': priority,
+                'hostname': hostname,
+            },
+            '_timestamp': datetime.now()
+        }
+        
+        analyzer = AlertAnalyzer(config, cache=analysis_cache)
+        # Alerts answered from the rule knowledge base or a similar analysis don't wait for an LLM slot
+        with admission.slot(LLM_PROVIDER) if analyzer.needs_llm(alert) else nullcontext():
+            result = analyzer.analyze_alert(alert, dry_run=False)
+        
+        # Store in Loki if requested
+        if store and 'error' not in result.get('analysis', {}):
+            try:
+                analyzer.store_analysis(result)
+            except Exception as e:
+                logger.warning(f"Failed to store analysis: {e}")
+        
+        return analysis_cache.save(cache_key, result, output, rule, priority, hostname)
+    
+    return single_flight.do(cache_key, run_analysis, analysis_cache.get)
+
+
+def run_analysis_job(params: dict) -> str:
+    """Job runner: analyze unless cached meanwhile, return the cache key."""
+    if analysis_cache.get(params['cache_key']) is None:
         try:
-            os.chmod(cache_file, 0o600)
-        except OSError:
-            pass
-        logger.info(f"Cached analysis: {cache_key}")
-    except Exception as e:
-        logger.warning(f"Failed to save cache: {e}")
+            analyze_and_cache(**params)
+        except Overloaded as e:
+            raise JobError(f"LLM service overloaded, retry in {e.retry_after}s")
+    return params['cache_key']
 
 
-def list_cached_analyses(limit: int = 50) -> list:
-    """List all cached analyses, most recent first."""
-    cache_files = sorted(CACHE_DIR.glob("*.json"), key=lambda f: f.stat().st_mtime, reverse=True)
-    results = []
-    for cache_file in cache_files[:limit]:
+# Background analysis jobs (status shared across workers via CACHE_DIR/jobs)
+jobs = JobQueue(
+    CACHE_DIR / 'jobs',
+    run_analysis_job,
+    workers=int(os.environ.get('JOB_WORKERS', '2')),
+    max_queued=int(os.environ.get('JOB_QUEUE_SIZE', '100')),
+)
+jobs.cleanup()
+
+
+def conditional(response):
+    """Add a body ETag and return 304 instead when the client's copy is current."""
+    response.add_etag(weak=True)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+def render_cached(cached: dict, show_mapping: bool = False, original_output: str | None = None):
+    """Render a cached analysis record as the results page.
+    
+    Cached analyses never change, so the ETag and Last-Modified come from the
+    record itself and a revalidating client gets a 304 without rendering.
+    The page also depends on show_mapping and the original_output override,
+    so those are part of the ETag, and such renders are validated by ETag
+    only (a Last-Modified date can't tell them apart).
+    """
+    record_version = hashlib.sha256(str(cached.get('timestamp')).encode()).hexdigest()[:8]
+    etag = f"{cached.get('cache_key', 'unknown')}-{record_version}-{TEMPLATE_VERSION}"
+    last_modified = None
+    if show_mapping or original_output is not None:
+        variant = f"{show_mapping}:{original_output}"
+        etag += '-' + hashlib.sha256(variant.encode()).hexdigest()[:8]
+    else:
         try:
-            with open(cache_file, 'r') as f:
-                data = json.load(f)
-                results.append({
-                    'cache_key': data.get('cache_key', cache_file.stem),
-                    'timestamp': data.get('timestamp'),
-                    'rule': data.get('rule'),
-                    'priority': data.get('priority'),
-                    'hostname': data.get('hostname'),
-                    'severity': data.get('analysis', {}).get('risk', {}).get('severity', 'unknown')
-                })
-        except Exception:
+            last_modified = datetime.fromtimestamp(parse_time(cached.get('timestamp', '')), tz=timezone.utc)
+        except (ValueError, TypeError):
             pass
-    return results
+    
+    if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        response = make_response('', 304)
+    else:
+        analysis = cached.get('analysis', {})
+        risk = analysis.get('risk', {})
+        severity = (risk.get('severity') or 'medium').lower()
+        severity_class = severity if severity in ['critical', 'high', 'medium', 'low'] else 'medium'
+        
+        response = make_response(render_template('analysis.html',
+            error=None,
+            analysis=analysis,
+            original_output=original_output if original_output is not None else cached.get('original_output', ''),
+            obfuscated_output=cached.get('obfuscated_output', ''),
+            severity_class=severity_class,
+            obfuscation_mapping=cached.get('obfuscation_mapping', {}),
+            show_mapping=show_mapping,
+            timestamp=cached.get('timestamp', 'cached'),
+            cached=True
+        ))
+    response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        # Assigning None would stamp the current time
+        response.last_modified = last_modified
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    if show_mapping:
+        # The de-obfuscation mapping must not be kept by any cache
+        response.cache_control.no_store = True
+    response.vary.add('X-API-Key')
+    return response
+
+
+def render_error(message: str, original_output: str = ''):
+    """Render the results page with an error message."""
+    return render_template('analysis.html',
+        error=message,
+        analysis={},
+        original_output=original_output,
+        obfuscated_output='',
+        severity_class='',
+        obfuscation_mapping={},
+        show_mapping=False,
+        timestamp=datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        cached=False
+    )
+
+
+def queue_full_response():
+    """503 with a Retry-After hint when the job queue is saturated."""
+    response = jsonify({'error': 'Analysis queue is full, retry later'})
+    response.status_code = 503
+    response.headers['Retry-After'] = '30'
+    return response
 
 
 @app.route('/health', methods=['GET'])
 def health():
     """Health check endpoint."""
-    return jsonify({'status': 'healthy', 'service': 'sib-analysis-api'})
+    try:
+        llm = admission.stats(LLM_PROVIDER)
+    except Exception:
+        llm = None
+    return jsonify({'status': 'healthy', 'service': 'sib-analysis-api', 'llm': llm,
+                    'jobs_pending': jobs.pending()})
 
 
 @app.route('/api/analyze', methods=['POST'])
-@limiter.limit("5 per minute")
+@limiter.limit("5 per minute", deduct_when=llm_was_called)
 def analyze_api():
     """
     API endpoint for analyzing an alert.
@@ -598,16 +934,48 @@ def analyze_api():
             "rule": "rule name",
             "priority": "Critical",
             "hostname": "host",
-            "store": true/false
+            "store": true/false,
+            "async": true/false
         }
     
-    Returns JSON analysis result.
+    Returns JSON analysis result, or 202 with a job id when async is set.
     """
     try:
         data = request.get_json()
         if not data or 'alert' not in data:
             return jsonify({'error': 'Missing alert data'}), 400
         
+        if data.get('async', False):
+            output = str(data.get('alert'))
+            rule = str(data.get('rule', 'Unknown'))
+            cache_key = get_cache_key(output, rule)
+            params = {
+                'cache_key': cache_key,
+                'output': output,
+                'rule': rule,
+                'priority': str(data.get('priority', 'Unknown')),
+                'hostname': str(data.get('hostname', 'Unknown')),
+                'store': bool(data.get('store', False)),
+            }
+            try:
+                admission.check(LLM_PROVIDER)
+                job, created = jobs.submit(params, dedupe_key=cache_key)
+            except QueueFull:
+                return queue_full_response()
+            except Overloaded as e:
+                return overloaded_response(e)
+            if not created:
+                g.llm_call = False
+            response = jsonify({
+                'job_id': job['id'],
+                'status': job['status'],
+                'status_url': f"/api/jobs/{job['id']}",
+                'events_url': f"/api/jobs/{job['id']}/events",
+            })
+            response.status_code = 202
+            response.headers['Location'] = f"/api/jobs/{job['id']}"
+            return response
+        
         # Build alert object
         alert = {
             'output': data.get('alert'),
@@ -621,7 +989,15 @@ def analyze_api():
         
         # Analyze
         analyzer = AlertAnalyzer(config)
-        result = analyzer.analyze_alert(alert, dry_run=False)
+        try:
+            if analyzer.needs_llm(alert):
+                with admission.slot(LLM_PROVIDER):
+                    result = analyzer.analyze_alert(alert, dry_run=False)
+            else:
+                g.llm_call = False
+                result = analyzer.analyze_alert(alert, dry_run=False)
+        except Overloaded as e:
+            return overloaded_response(e)
         
         # Optionally store in Loki
         if data.get('store', False):
@@ -638,8 +1014,187 @@ def analyze_api():
         return jsonify({'error': 'Internal analysis error'}), 500
 
 
+# Batch analysis limits; the batch rate limit counts LLM calls, not requests
+BATCH_MAX_ALERTS = int(os.environ.get('BATCH_MAX_ALERTS', '500'))
+BATCH_CONCURRENCY = int(os.environ.get('BATCH_CONCURRENCY', '4'))
+BATCH_RATE_LIMIT = os.environ.get('BATCH_RATE_LIMIT', '300 per hour')
+# Most LLM calls one batch may need; a larger batch could never fit a window
+BATCH_MAX_COST = min(limit.amount for limit in parse_many(BATCH_RATE_LIMIT))
+
+
+def parse_batch() -> list:
+    """Parse a batch body (JSON array, {"alerts": [...]} or NDJSON) into job params.
+    
+    Parsed once per request and kept on flask.g so the rate-limit cost
+    function and the view share the work.
+    """
+    if 'batch' in g:
+        return g.batch
+    
+    body = request.get_data(cache=True, as_text=True)
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl', 'application/json-seq'):
+        items = []
+        for n, line in enumerate(body.splitlines(), 1):
+            line = line.strip().lstrip('\x1e')
+            if not line:
+                continue
+            try:
+                items.append(json.loads(line))
+            except json.JSONDecodeError:
+                raise ValueError(f"Invalid JSON on line {n}")
+    else:
+        try:
+            items = json.loads(body) if body else None
+        except json.JSONDecodeError:
+            raise ValueError("Invalid JSON body")
+        if isinstance(items, dict):
+            items = items.get('alerts')
+        if not isinstance(items, list):
+            raise ValueError("Expected a JSON array of alerts, {\"alerts\": [...]} or NDJSON")
+    
+    if not items:
+        raise ValueError("No alerts provided")
+    if len(items) > BATCH_MAX_ALERTS:
+        raise ValueError(f"Too many alerts ({len(items)} > {BATCH_MAX_ALERTS})")
+    
+    default_store = request.args.get('store', 'false').lower() == 'true'
+    batch = []
+    for n, item in enumerate(items):
+        if not isinstance(item, dict) or not (item.get('alert') or item.get('output')):
+            raise ValueError(f"Alert {n} is missing alert text")
+        output = str(item.get('alert') or item.get('output'))[:50000]
+        rule = str(item.get('rule', 'Unknown'))[:500]
+        priority = str(item.get('priority', 'Unknown'))
+        if priority not in VALID_PRIORITIES:
+            priority = 'Unknown'
+        batch.append({
+            'cache_key': get_cache_key(output, rule),
+            'output': output,
+            'rule': rule,
+            'priority': priority,
+            'hostname': str(item.get('hostname', 'Unknown'))[:500],
+            'store': bool(item.get('store', default_store)),
+        })
+    g.batch = batch
+    return batch
+
+
+def batch_uncached(batch: list) -> int:
+    """Distinct alerts of a batch without a cached analysis (kept on flask.g)."""
+    if 'batch_uncached' not in g:
+        keys = {params['cache_key'] for params in batch}
+        g.batch_uncached = sum(1 for key in keys if analysis_cache.get(key) is None)
+    return g.batch_uncached
+
+
+def batch_cost() -> int:
+    """Rate-limit cost of a batch: one unit per distinct uncached alert.
+    
+    Invalid batches cost one unit. Batches over BATCH_MAX_COST cost
+    nothing: the view rejects them without analyzing anything.
+    """
+    try:
+        uncached = batch_uncached(parse_batch())
+    except ValueError:
+        return 1
+    if uncached > BATCH_MAX_COST:
+        return 0
+    return max(1, uncached)
+
+
+@app.route('/api/analyze/batch', methods=['POST'])
+@limiter.limit(BATCH_RATE_LIMIT, cost=batch_cost)
+def analyze_batch_api():
+    """
+    Analyze many alerts over one connection.
+    
+    Request body: a JSON array of alert objects (same fields as
+    /api/analyze), {"alerts": [...]}, or NDJSON with Content-Type
+    application/x-ndjson. Identical alerts are analyzed once and cached
+    results are reused.
+    
+    Streams NDJSON: one line per alert as soon as its analysis finishes,
+    followed by a summary line.
+    """
+    try:
+        batch = parse_batch()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    uncached = batch_uncached(batch)
+    if uncached > BATCH_MAX_COST:
+        return jsonify({
+            'error': f"Batch needs {uncached} LLM analyses, more than the batch rate limit "
+                     f"allows ({BATCH_RATE_LIMIT}); split it into batches of at most "
+                     f"{BATCH_MAX_COST} uncached alerts",
+        }), 413
+    
+    def result_line(index: int, params: dict, record: dict | None, cached: bool,
+                    error: str | None = None) -> str:
+        analysis = (record or {}).get('analysis', {})
+        failed = record is None or 'error' in analysis
+        line = {
+            'index': index,
+            'cache_key': params['cache_key'],
+            'rule': params['rule'],
+            'success': not failed,
+            'cached': cached,
+            'analysis': analysis,
+            'obfuscation_mapping': (record or {}).get('obfuscation_mapping', {}),
+        }
+        if failed:
+            line['error'] = error or analysis.get('error', 'Internal analysis error')
+        return json.dumps(line, default=str) + '\n'
+    
+    def stream():
+        # Group duplicate alerts so each distinct alert costs one LLM call
+        indices_by_key: dict = {}
+        for index, params in enumerate(batch):
+            indices_by_key.setdefault(params['cache_key'], []).append(index)
+        
+        stats = {'total': len(batch), 'analyzed': 0, 'cached': 0, 'errors': 0}
+        pool = ThreadPoolExecutor(max_workers=BATCH_CONCURRENCY)
+        try:
+            pending = {}
+            for key, indices in indices_by_key.items():
+                params = batch[indices[0]]
+                cached = analysis_cache.get(key)
+                if cached:
+                    stats['cached'] += len(indices)
+                    for index in indices:
+                        yield result_line(index, batch[index], cached, True)
+                else:
+                    pending[pool.submit(analyze_and_cache, **params)] = key
+            
+            for future in as_completed(pending):
+                key = pending[future]
+                indices = indices_by_key[key]
+                error = None
+                try:
+                    record, shared = future.result()
+                except Overloaded as e:
+                    record, shared = None, False
+                    error = f"LLM service overloaded, retry in {e.retry_after}s"
+                except Exception:
+                    logger.exception(f"Batch analysis failed for {key}")
+                    record, shared = None, False
+                if record is None or 'error' in record.get('analysis', {}):
+                    stats['errors'] += len(indices)
+                else:
+                    stats['analyzed'] += len(indices)
+                for index in indices:
+                    yield result_line(index, batch[index], record, shared, error)
+        finally:
+            # Client may disconnect mid-stream; drop work that hasn't started
+            pool.shutdown(wait=False, cancel_futures=True)
+        
+        yield json.dumps({'summary': stats}) + '\n'
+    
+    return Response(stream(), mimetype='application/x-ndjson',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
 @app.route('/analyze', methods=['GET'])
-@limiter.limit("5 per minute")
+@limiter.limit("5 per minute", deduct_when=llm_was_called)
 def analyze_page():
     """
     Web page for analyzing an alert (called from Grafana data link).
@@ -662,150 +1217,139 @@ def analyze_page():
         show_mapping = request.args.get('show_mapping', 'false').lower() == 'true'
         
         if not output:
-            return render_template_string(ANALYSIS_TEMPLATE, 
-                error="No alert output provided. Use ?output=... parameter.",
-                analysis={},
-                original_output='',
-                obfuscated_output='',
-                severity_class='',
-                obfuscation_mapping={},
-                show_mapping=False,
-                timestamp=datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                cached=False
-            )
+            return render_error("No alert output provided. Use ?output=... parameter.")
         
         # Check cache first
         cache_key = get_cache_key(output, rule)
-        cached_result = get_cached_analysis(cache_key)
+        cached_result = analysis_cache.get(cache_key)
         
         if cached_result:
-            # Return cached analysis
-            analysis = cached_result.get('analysis', {})
-            risk = analysis.get('risk', {})
-            severity = (risk.get('severity') or 'medium').lower()
-            severity_class = severity if severity in ['critical', 'high', 'medium', 'low'] else 'medium'
-            
-            return render_template_string(ANALYSIS_TEMPLATE,
-                error=None,
-                analysis=analysis,
-                original_output=output,
-                obfuscated_output=cached_result.get('obfuscated_output', ''),
-                severity_class=severity_class,
-                obfuscation_mapping=cached_result.get('obfuscation_mapping', {}),
-                show_mapping=show_mapping,
-                timestamp=cached_result.get('timestamp', 'cached'),
-                cached=True
-            )
+            g.llm_call = False
+            return render_cached(cached_result, show_mapping=show_mapping, original_output=output)
         
-        # Build alert object
-        alert = {
+        params = {
+            'cache_key': cache_key,
             'output': output,
-            '_labels': {
-                'rule': rule,
-                'priority': priority,
-                'hostname': hostname,
-            },
-            '_timestamp': datetime.now()
+            'rule': rule,
+            'priority': priority,
+            'hostname': hostname,
+            'store': store,
         }
+        if not AlertAnalyzer(config, cache=analysis_cache).needs_llm(
+                {'output': output, '_labels': {'rule': rule, 'priority': priority}}):
+            # Routine alert of a well-known rule, or a near-duplicate of an
+            # analyzed one: answered right away, no LLM call
+            g.llm_call = False
+            record, _ = analyze_and_cache(**params)
+            return render_cached(record, show_mapping=show_mapping, original_output=output)
         
-        # Analyze
-        analyzer = AlertAnalyzer(config)
-        result = analyzer.analyze_alert(alert, dry_run=False)
-        
-        # Store in Loki if requested
-        if store and 'error' not in result.get('analysis', {}):
-            try:
-                analyzer.store_analysis(result)
-            except Exception as e:
-                logger.warning(f"Failed to store analysis: {e}")
-        
-        # Save to cache
-        save_to_cache(cache_key, result, output, rule, priority, hostname)
-        
-        # Determine severity class for styling
-        analysis = result.get('analysis', {})
-        risk = analysis.get('risk', {})
-        severity = (risk.get('severity') or 'medium').lower()
-        severity_class = severity if severity in ['critical', 'high', 'medium', 'low'] else 'medium'
-        
-        # Get obfuscated output
-        obfuscated_alert = result.get('obfuscated_alert', {})
-        obfuscated_output = obfuscated_alert.get('output', '') if isinstance(obfuscated_alert, dict) else str(obfuscated_alert)
+        # Queue the analysis and show a loading page that follows the job
+        try:
+            admission.check(LLM_PROVIDER)
+            job, created = jobs.submit(params, dedupe_key=cache_key, show_mapping=show_mapping)
+        except QueueFull:
+            return render_error("The analysis queue is full. Please retry in a minute.", output), 503
+        except Overloaded as e:
+            return (render_error(f"The AI service is busy. Please retry in {e.retry_after} seconds.", output),
+                    429, {'Retry-After': str(e.retry_after)})
+        if not created:
+            g.llm_call = False
         
-        return render_template_string(ANALYSIS_TEMPLATE,
-            error=None,
-            analysis=analysis,
-            original_output=output,
-            obfuscated_output=obfuscated_output,
-            severity_class=severity_class,
-            obfuscation_mapping=result.get('obfuscation_mapping', {}),
-            show_mapping=show_mapping,
-            timestamp=datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            cached=False
-        )
+        return render_template('loading.html', job_id=job['id'])
         
     except Exception as e:
         logger.exception("Analysis page failed")
-        return render_template_string(ANALYSIS_TEMPLATE,
-            error="An internal error occurred during analysis. Check server logs for details.",
-            analysis={},
-            original_output=request.args.get('output', ''),
-            obfuscated_output='',
-            severity_class='',
-            obfuscation_mapping={},
-            show_mapping=False,
-            timestamp=datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            cached=False
-        )
+        return render_error("An internal error occurred during analysis. Check server logs for details.",
+                            request.args.get('output', ''))
+
+
+@app.route('/result', methods=['GET'])
+@limiter.limit("60 per minute")
+def result_page():
+    """Show the result of a queued analysis (target of the loading page)."""
+    job_id = request.args.get('job', '')
+    if not is_valid_job_id(job_id):
+        return "Invalid job id format", 400
+    job = jobs.get(job_id)
+    if not job:
+        return "Job not found", 404
+    
+    if job['status'] in ACTIVE_STATES:
+        return render_template('loading.html', job_id=job_id)
+    
+    cached = analysis_cache.get(job['cache_key']) if job['status'] == DONE else None
+    if not cached:
+        return render_error(job.get('error') or "Analysis result is no longer available.")
+    return render_cached(cached, show_mapping=job.get('show_mapping', False))
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+@limiter.limit("120 per minute")
+def api_job(job_id: str):
+    """Poll the status of an analysis job; includes the result once done."""
+    if not is_valid_job_id(job_id):
+        return jsonify({'error': 'Invalid job id format'}), 400
+    job = jobs.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    body = {
+        'job_id': job['id'],
+        'status': job['status'],
+        'cache_key': job.get('cache_key'),
+        'error': job.get('error'),
+    }
+    if job['status'] == DONE:
+        cached = analysis_cache.get(job['cache_key']) or {}
+        body.update({
+            'success': True,
+            'analysis': cached.get('analysis', {}),
+            'obfuscation_mapping': cached.get('obfuscation_mapping', {}),
+        })
+    return jsonify(body)
+
+
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+@limiter.limit("30 per minute")
+def api_job_events(job_id: str):
+    """Server-sent events stream of job status changes."""
+    if not is_valid_job_id(job_id):
+        return jsonify({'error': 'Invalid job id format'}), 400
+    if not jobs.get(job_id):
+        return jsonify({'error': 'Job not found'}), 404
+    
+    def stream():
+        idle = 0
+        for job in jobs.watch(job_id, timeout=float(os.environ.get('SSE_TIMEOUT', '60'))):
+            if job is None:
+                idle += 1
+                if idle % 30 == 0:
+                    yield ": keepalive\n\n"
+                continue
+            idle = 0
+            status = {k: job.get(k) for k in ('id', 'status', 'cache_key', 'error')}
+            yield f"event: status\ndata: {json.dumps(status)}\n\n"
+    
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 
 @app.route('/history', methods=['GET'])
 @limiter.limit("30 per minute")
 def history_page():
-    """List all cached analyses."""
-    analyses = list_cached_analyses(limit=100)
-    
-    rows = ""
-    for a in analyses:
-        severity = html_escape(a.get('severity', 'unknown'))
-        severity_color = {'critical': '#f2495c', 'high': '#ff9830', 'medium': '#fade2a', 'low': '#73bf69'}.get(str(severity), '#8e8e8e')
-        cache_key = html_escape(a.get('cache_key', ''))
-        rows += f"""
-        <tr onclick="window.location='/history/{cache_key}'" style="cursor: pointer;">
-            <td>{html_escape(a.get('timestamp', '')[:19])}</td>
-            <td>{html_escape(a.get('rule', ''))}</td>
-            <td>{html_escape(a.get('priority', ''))}</td>
-            <td style="color: {severity_color}; font-weight: bold;">{severity}</td>
-            <td>{html_escape(a.get('hostname', ''))}</td>
-        </tr>"""
-    
-    return f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>Analysis History - SIB</title>
-        <style>
-            body {{ font-family: -apple-system, sans-serif; background: #111217; color: #d8d9da; padding: 40px; }}
-            h1 {{ color: #ff9830; }}
-            table {{ width: 100%; border-collapse: collapse; margin-top: 20px; }}
-            th, td {{ padding: 12px; text-align: left; border-bottom: 1px solid #2c3235; }}
-            th {{ background: #1f2129; color: #73bf69; }}
-            tr:hover {{ background: #1f2129; }}
-            a {{ color: #3274d9; text-decoration: none; }}
-            .back {{ margin-bottom: 20px; }}
-        </style>
-    </head>
-    <body>
-        <div class="back"><a href="/">← Back to API</a></div>
-        <h1>📜 Analysis History</h1>
-        <p>{len(analyses)} cached analyses</p>
-        <table>
-            <tr><th>Timestamp</th><th>Rule</th><th>Priority</th><th>AI Severity</th><th>Hostname</th></tr>
-            {rows}
-        </table>
-    </body>
-    </html>
-    """
+    """List cached analyses with filters and cursor pagination."""
+    try:
+        analyses, next_cursor = history_index.query(**history_query_args(default_limit=100))
+    except ValueError as e:
+        return f"Invalid query: {html_escape(str(e))}", 400
+    
+    response = make_response(render_template('history.html',
+        analyses=analyses,
+        total=history_index.count(),
+        next_url=next_page_url(next_cursor) if next_cursor else None,
+        sort_fields=list(SORT_COLUMNS),
+    ))
+    return conditional(response)
 
 
 @app.route('/history/<cache_key>', methods=['GET'])
@@ -814,97 +1358,57 @@ def history_detail(cache_key: str):
     """View a cached analysis."""
     if not is_valid_cache_key(cache_key):
         return "Invalid cache key format", 400
-    cached = get_cached_analysis(cache_key)
+    cached = analysis_cache.get(cache_key)
     if not cached:
         return "Analysis not found", 404
     
-    analysis = cached.get('analysis', {})
-    risk = analysis.get('risk', {})
-    severity = (risk.get('severity') or 'medium').lower()
-    severity_class = severity if severity in ['critical', 'high', 'medium', 'low'] else 'medium'
-    
-    return render_template_string(ANALYSIS_TEMPLATE,
-        error=None,
-        analysis=analysis,
-        original_output=cached.get('original_output', ''),
-        obfuscated_output=cached.get('obfuscated_output', ''),
-        severity_class=severity_class,
-        obfuscation_mapping=cached.get('obfuscation_mapping', {}),
-        show_mapping=False,
-        timestamp=cached.get('timestamp', 'cached'),
-        cached=True
-    )
+    return render_cached(cached)
 
 
 @app.route('/api/history', methods=['GET'])
 @limiter.limit("30 per minute")
 def api_history():
-    """API endpoint to list cached analyses."""
-    limit = min(request.args.get('limit', 50, type=int), 100)
-    return jsonify(list_cached_analyses(limit=limit))
+    """
+    API endpoint to list cached analyses.
+    
+    Accepts the same filters as /history (see history_query_args). Returns
+    a JSON array; when more results exist the next page is given by the
+    X-Next-Cursor header and a Link rel="next" header.
+    """
+    try:
+        analyses, next_cursor = history_index.query(**history_query_args())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    response = jsonify(analyses)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+        response.headers['Link'] = f'<{next_page_url(next_cursor)}>; rel="next"'
+    return conditional(response)
+
+
+@app.route('/api/mitre', methods=['GET'])
+@limiter.limit("60 per minute")
+def api_mitre():
+    """
+    MITRE ATT&CK mapping of a rule from the Falco rule tags (no LLM call).
+    
+    Query params:
+        - rule: rule name
+    """
+    rule = request.args.get('rule', '')[:500]
+    if not rule:
+        return jsonify({'error': 'Missing rule parameter'}), 400
+    mapping = MitreIndex.from_config(config).lookup(rule)
+    if mapping is None:
+        return jsonify({'error': 'No MITRE mapping for this rule', 'rule': rule}), 404
+    return jsonify(dict(mapping, rule=rule))
 
 
 @app.route('/', methods=['GET'])
 def index():
     """Home page with API documentation."""
-    cached_count = len(list(CACHE_DIR.glob("*.json")))
-    return f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>SIB Analysis API</title>
-        <style>
-            body {{ font-family: -apple-system, sans-serif; background: #111217; color: #d8d9da; padding: 40px; }}
-            h1 {{ color: #ff9830; }}
-            h2 {{ color: #73bf69; margin-top: 30px; }}
-            code {{ background: #2a2d35; padding: 2px 8px; border-radius: 4px; }}
-            pre {{ background: #1f2129; padding: 20px; border-radius: 8px; overflow-x: auto; }}
-            a {{ color: #3274d9; }}
-            .stat {{ display: inline-block; background: #1f2129; padding: 15px 25px; border-radius: 8px; margin-right: 15px; }}
-            .stat-value {{ font-size: 2em; color: #73bf69; }}
-            .stat-label {{ color: #8e8e8e; }}
-        </style>
-    </head>
-    <body>
-        <h1>🛡️ SIB Analysis API</h1>
-        <p>AI-powered security alert analysis with privacy protection.</p>
-        
-        <div style="margin: 30px 0;">
-            <div class="stat">
-                <div class="stat-value">{cached_count}</div>
-                <div class="stat-label">Cached Analyses</div>
-            </div>
-            <a href="/history" style="background: #3274d9; color: white; padding: 15px 25px; border-radius: 8px; text-decoration: none;">📜 View History</a>
-        </div>
-        
-        <h2>Endpoints</h2>
-        
-        <h3>GET /analyze</h3>
-        <p>Analyze an alert and display results in a web page (for Grafana data links).</p>
-        <pre>GET /analyze?output=&lt;alert_text&gt;&amp;rule=&lt;rule_name&gt;&amp;priority=&lt;priority&gt;&amp;hostname=&lt;host&gt;</pre>
-        
-        <h3>GET /history</h3>
-        <p>View all cached analyses.</p>
-        
-        <h3>POST /api/analyze</h3>
-        <p>Analyze an alert and return JSON results.</p>
-        <pre>{{
-    "alert": "alert output text",
-    "rule": "rule name",
-    "priority": "Critical",
-    "hostname": "host",
-    "store": true
-}}</pre>
-        
-        <h3>GET /health</h3>
-        <p>Health check endpoint.</p>
-        
-        <h2>Grafana Integration</h2>
-        <p>Add a data link to your log panels:</p>
-        <pre>http://localhost:5000/analyze?output=${{__value.raw}}&amp;rule=${{__data.fields.rule}}&amp;priority=${{__data.fields.priority}}&amp;hostname=${{__data.fields.hostname}}</pre>
-    </body>
-    </html>
-    """
+    return render_template('index.html', cached_count=history_index.count())
 
 
 if __name__ == '__main__':
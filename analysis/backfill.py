@@ -0,0 +1,298 @@
+"""
+SIB Backfill - Re-analyze a historical time range in parallel
+
+The range is split into time shards. Shards are fetched in parallel and
+their alerts feed one bounded pool of analysis workers through the
+priority scheduler, so fetching and LLM calls overlap and critical alerts
+are analyzed first. Finished shards are recorded in a checkpoint file, and
+re-running the same command resumes where an interrupted run stopped.
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+from scheduler import PRIORITY_RANK, AnalysisScheduler
+
+DEFAULT_CHECKPOINT = os.path.expanduser('~/.local/state/sib/backfill.json')
+
+
+def split_range(since: datetime, until: datetime, shard: timedelta) -> List[Tuple[datetime, datetime]]:
+    """Split [since, until) into consecutive shards of at most the given size."""
+    shards = []
+    start = since
+    while start < until:
+        end = min(start + shard, until)
+        shards.append((start, end))
+        start = end
+    return shards
+
+
+def _format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds}s"
+
+
+class _Shard:
+    """Progress of one shard."""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.fetched = False
+        self.alerts = 0
+        self.pending = 0
+        self.failed = 0
+
+
+class Checkpoint:
+    """Finished shards of a backfill, kept in a JSON file.
+
+    Args:
+        path: Checkpoint file
+        key: Identifies the backfill (query and arguments as given)
+    """
+
+    def __init__(self, path: Path, key: dict):
+        self.path = Path(path)
+        self.key = key
+        self.since: Optional[datetime] = None
+        self.until: Optional[datetime] = None
+        self.done: set = set()
+        self._lock = threading.Lock()
+
+    def load(self) -> bool:
+        """Load a checkpoint for the same backfill; False if there is none."""
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if data.get('key') != self.key:
+            return False
+        self.since = datetime.fromisoformat(data['since'])
+        self.until = datetime.fromisoformat(data['until'])
+        self.done = set(data.get('done', []))
+        return True
+
+    def start(self, since: datetime, until: datetime):
+        self.since, self.until, self.done = since, until, set()
+        self.save()
+
+    def mark_done(self, index: int):
+        with self._lock:
+            self.done.add(index)
+            self.save()
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix('.tmp')
+        with open(tmp, 'w') as f:
+            json.dump({
+                'key': self.key,
+                'since': self.since.isoformat(),
+                'until': self.until.isoformat(),
+                'done': sorted(self.done),
+            }, f)
+        os.replace(tmp, self.path)
+
+    def remove(self):
+        try:
+            self.path.unlink()
+        except OSError:
+            pass
+
+
+class Backfill:
+    """Sharded, resumable re-analysis of a time range.
+
+    Args:
+        analyzer: AlertAnalyzer used for fetching, analysis and storage
+        query: Alert selector for the log backend
+        shards: (start, end) ranges to process, by index
+        checkpoint: Records finished shards
+        writer: Batch writer for storing results (None for dry runs)
+        ledger: Optional processed-alert ledger (skips enriched alerts)
+        fetch_workers: Shards fetched at the same time
+        concurrency: Alerts analyzed at the same time
+        page_size: Alerts per backend request within a shard
+        scheduler: Priority queue feeding the workers (default: one
+            holding concurrency * 50 alerts)
+    """
+
+    def __init__(self, analyzer, query: str, shards: List[Tuple[datetime, datetime]],
+                 checkpoint: Checkpoint, writer=None, ledger=None, fetch_workers: int = 4,
+                 concurrency: int = 4, page_size: int = 1000, dry_run: bool = False,
+                 progress_interval: float = 5.0, scheduler: Optional[AnalysisScheduler] = None):
+        self.analyzer = analyzer
+        self.query = query
+        self.shards = shards
+        self.checkpoint = checkpoint
+        self.writer = writer
+        self.ledger = ledger
+        self.fetch_workers = fetch_workers
+        self.concurrency = concurrency
+        self.page_size = page_size
+        self.dry_run = dry_run
+        self.progress_interval = progress_interval
+        self.stats = {'fetched': 0, 'analyzed': 0, 'stored': 0, 'skipped': 0, 'failed': 0}
+        self._lock = threading.Lock()
+        self.scheduler = scheduler or AnalysisScheduler(max_queued=concurrency * 50)
+        self._state = {}
+        self._started = 0.0
+
+    def _count(self, key: str, n: int = 1):
+        with self._lock:
+            self.stats[key] += n
+
+    def _settle(self, shard: _Shard, ok: bool):
+        """One alert of a shard is finished; record the shard when all are."""
+        with self._lock:
+            shard.pending -= 1
+            if not ok:
+                shard.failed += 1
+            complete = shard.fetched and shard.pending == 0 and shard.failed == 0
+        if complete:
+            self.checkpoint.mark_done(shard.index)
+
+    def _fetch(self, shard: _Shard):
+        start, end = self.shards[shard.index]
+        try:
+            for alert in self.analyzer.backend.iter_alerts(self.query, start, end, self.page_size):
+                with self._lock:
+                    shard.alerts += 1
+                    shard.pending += 1
+                    self.stats['fetched'] += 1
+                self.scheduler.put((shard, alert), alert)
+        except Exception as e:
+            print(f"Failed to fetch shard {start} - {end}: {e}", file=sys.stderr)
+            with self._lock:
+                shard.failed += 1
+        with self._lock:
+            shard.fetched = True
+            shard.pending += 1
+        # Settles the shard if all its alerts already finished
+        self._settle(shard, True)
+
+    def _stored_callback(self, shard: _Shard, alert: dict) -> Callable[[bool], None]:
+        def callback(ok: bool):
+            if ok:
+                self._count('stored')
+            if self.ledger is not None and '_fingerprint' in alert:
+                if ok:
+                    self.ledger.mark_done(alert)
+                else:
+                    self.ledger.release(alert)
+            self._settle(shard, ok)
+        return callback
+
+    def _analyze(self, shard: _Shard, alert: dict):
+        tracked = self.ledger is not None and '_fingerprint' in alert
+        if tracked and not self.ledger.claim(alert):
+            self._count('skipped')
+            self._settle(shard, True)
+            return
+
+        queued = False
+        try:
+            result = self.analyzer.analyze_alert(alert, self.dry_run)
+            self._count('analyzed')
+            if self.dry_run:
+                self._settle(shard, True)
+                return
+            if 'error' in result.get('analysis', {}):
+                self._count('failed')
+            elif self.writer is not None:
+                queued = self.analyzer.store_analysis(result, self.writer,
+                                                      self._stored_callback(shard, alert))
+        except Exception as e:
+            print(f"Analysis failed: {e}", file=sys.stderr)
+            self._count('failed')
+        if not queued:
+            if tracked:
+                self.ledger.release(alert)
+            self._settle(shard, False)
+
+    def _work(self):
+        while True:
+            item = self.scheduler.get()
+            if item is None:
+                return
+            self._analyze(*item)
+
+    def _report(self, final: bool = False):
+        with self._lock:
+            stats = dict(self.stats)
+            shards_done = len(self.checkpoint.done)
+            fetched_shards = [s for s in self._state.values() if s.fetched]
+            unfetched = len(self._state) - len(fetched_shards)
+            queued = sum(s.pending for s in self._state.values())
+        elapsed = time.monotonic() - self._started
+        total = len(self.shards)
+        line = (f"[backfill] shards {shards_done}/{total} | fetched {stats['fetched']} | "
+                f"analyzed {stats['analyzed']} | stored {stats['stored']} | "
+                f"skipped {stats['skipped']} | failed {stats['failed']} | {_format_duration(elapsed)}")
+        done = stats['analyzed'] + stats['skipped']
+        if not final and done and elapsed > 0:
+            rate = done / elapsed
+            # Estimate unfetched shards from the alerts per shard seen so far
+            per_shard = (sum(s.alerts for s in fetched_shards) / len(fetched_shards)) if fetched_shards else 0
+            remaining = queued + unfetched * per_shard
+            line += f" | {rate * 60:.0f}/min | ETA {_format_duration(remaining / rate)}"
+        print(line, file=sys.stderr)
+
+    def run(self) -> dict:
+        """Process every shard not yet in the checkpoint; returns the stats."""
+        todo = [i for i in range(len(self.shards)) if i not in self.checkpoint.done]
+        if len(todo) < len(self.shards):
+            print(f"Resuming backfill: {len(self.shards) - len(todo)}/{len(self.shards)} shards already done",
+                  file=sys.stderr)
+        self._state = {i: _Shard(i) for i in todo}
+        self._started = time.monotonic()
+
+        workers = [threading.Thread(target=self._work, daemon=True) for _ in range(self.concurrency)]
+        for t in workers:
+            t.start()
+
+        with ThreadPoolExecutor(max_workers=self.fetch_workers) as pool:
+            # Shards are started oldest first, fetch_workers at a time
+            futures = [pool.submit(self._fetch, self._state[i]) for i in todo]
+            next_report = time.monotonic() + self.progress_interval
+            while not all(f.done() for f in futures):
+                time.sleep(0.2)
+                if time.monotonic() >= next_report:
+                    self._report()
+                    next_report = time.monotonic() + self.progress_interval
+
+        self.scheduler.close()
+        while any(t.is_alive() for t in workers):
+            for t in workers:
+                t.join(timeout=self.progress_interval)
+            if any(t.is_alive() for t in workers):
+                self._report()
+        if self.writer is not None:
+            # Remaining buffered results; their callbacks complete the last shards
+            self.writer.close()
+
+        self._report(final=True)
+        waits = self.scheduler.stats()
+        if waits:
+            print("Queue wait by priority: " + ', '.join(
+                f"{p} avg {s['avg_wait']:.1f}s max {s['max_wait']:.1f}s"
+                + (f" ({s['missed']} past deadline)" if s['missed'] else '')
+                for p, s in sorted(waits.items(), key=lambda i: PRIORITY_RANK.get(i[0], 99))), file=sys.stderr)
+        if len(self.checkpoint.done) == len(self.shards):
+            self.checkpoint.remove()
+        else:
+            print(f"{len(self.shards) - len(self.checkpoint.done)} shards incomplete; "
+                  f"re-run the same command to retry them", file=sys.stderr)
+        return self.stats
@@ -0,0 +1,148 @@
+"""
+SIB Analysis Cache - File-backed cache of LLM analyses
+
+One JSON file per analysis, keyed by a hash of the normalized alert output
+and rule. Shared by the API (which serves cached results) and the
+auto-enrichment daemon (which fills the cache ahead of analysts). With a
+SimilarityIndex, LLM analyses are also found for near-duplicate alerts.
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, Tuple
+
+from history import HistoryIndex, is_cache_key
+from similarity import SimilarityIndex, key_fields
+from triage import is_llm_verdict
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_output(output: str) -> str:
+    """Normalize alert output for consistent cache keys.
+
+    Removes timestamps and normalizes whitespace to ensure
+    the same logical event produces the same cache key.
+    """
+    # Normalize whitespace
+    normalized = ' '.join(output.split())
+    # Remove common timestamp patterns that make each event unique
+    # ISO format: 2026-01-09T12:34:56.789Z
+    normalized = re.sub(r'\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(\.\d+)?Z?', '[TIME]', normalized)
+    # Unix timestamp: 1234567890 or 1234567890.123
+    normalized = re.sub(r'\b\d{10,13}(\.\d+)?\b', '[TIMESTAMP]', normalized)
+    # Common date formats
+    normalized = re.sub(r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}', '[TIME]', normalized)
+    return normalized
+
+
+def get_cache_key(output: str, rule: str) -> str:
+    """Generate a cache key from alert output and rule."""
+    normalized = normalize_output(output)
+    content = f"{normalized}:{rule}"
+    return hashlib.sha256(content.encode()).hexdigest()[:16]
+
+
+class AnalysisCache:
+    """Read and write cached analyses in a directory.
+
+    The directory also holds the HistoryIndex (history.db) and, when
+    enabled, the SimilarityIndex (similarity.db) that are kept in step with
+    saves and removals.
+
+    Args:
+        cache_dir: Cache directory (created with 0700 permissions)
+        config: Analysis config; enables the similarity index (analysis.similarity)
+    """
+
+    def __init__(self, cache_dir: Path, config: Optional[dict] = None):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        try:
+            os.chmod(self.cache_dir, 0o700)
+        except OSError:
+            pass
+        self.index = HistoryIndex(self.cache_dir / 'history.db')
+        self.similar = SimilarityIndex.from_config(config, self.cache_dir) if config else None
+
+    def get(self, cache_key: str) -> Optional[dict]:
+        """Retrieve cached analysis if it exists."""
+        cache_file = self.cache_dir / f"{cache_key}.json"
+        if cache_file.exists():
+            try:
+                with open(cache_file, 'r') as f:
+                    return json.load(f)
+            except Exception as e:
+                logger.warning(f"Failed to read cache: {e}")
+        return None
+
+    def save(self, cache_key: str, result: dict, original_output: str, rule: str,
+             priority: str, hostname: str) -> dict:
+        """Save analysis result to cache and return the cached record."""
+        cache_file = self.cache_dir / f"{cache_key}.json"
+        cache_data = {
+            'cache_key': cache_key,
+            'timestamp': datetime.now().isoformat(),
+            'original_output': original_output,
+            'rule': rule,
+            'priority': priority,
+            'hostname': hostname,
+            'analysis': result.get('analysis', {}),
+            'obfuscated_output': result.get('obfuscated_alert', {}).get('output', '') if isinstance(result.get('obfuscated_alert'), dict) else '',
+            'obfuscation_mapping': result.get('obfuscation_mapping', {})
+        }
+        try:
+            with open(cache_file, 'w') as f:
+                json.dump(cache_data, f, indent=2, default=str)
+            try:
+                os.chmod(cache_file, 0o600)
+            except OSError:
+                pass
+            logger.info(f"Cached analysis: {cache_key}")
+            self.index.add(cache_data)
+            # Only LLM verdicts are reused, so answers never chain off each other
+            if self.similar is not None and is_llm_verdict(cache_data['analysis']):
+                self.similar.add(cache_key, rule, cache_data['obfuscated_output'])
+        except Exception as e:
+            logger.warning(f"Failed to save cache: {e}")
+        return cache_data
+
+    def find_similar(self, rule: str, obfuscated_output: str) -> Optional[Tuple[dict, float]]:
+        """Cached LLM analysis of the most similar alert of the rule with the
+        same key fields (file, command line, executable), with its cosine
+        similarity, or None below the threshold."""
+        if self.similar is None or not obfuscated_output:
+            return None
+        fields = key_fields(obfuscated_output)
+        for cache_key, score in self.similar.search(rule, obfuscated_output):
+            # Entries removed by another process may still be in its index
+            cached = self.get(cache_key)
+            if (cached is not None and is_llm_verdict(cached.get('analysis'))
+                    and key_fields(cached.get('obfuscated_output', '')) == fields):
+                return cached, score
+        return None
+
+    def cleanup(self, max_age_days: int = 7):
+        """Remove cache files older than max_age_days."""
+        cutoff = time.time() - (max_age_days * 86400)
+        removed = []
+        for cache_file in self.cache_dir.glob("*.json"):
+            if not is_cache_key(cache_file.stem):
+                continue
+            try:
+                if cache_file.stat().st_mtime < cutoff:
+                    cache_file.unlink()
+                    removed.append(cache_file.stem)
+            except OSError:
+                pass
+        if removed:
+            self.index.remove(removed)
+            if self.similar is not None:
+                self.similar.remove(removed)
+            logger.info(f"Cache cleanup: removed {len(removed)} old entries")
@@ -0,0 +1,201 @@
+"""
+SIB Prompt Compaction - Fit oversized alerts into the model's token budget
+
+An alert output with a huge command line or file list inflates the prompt,
+and with it latency and cost; a small local model silently truncates what
+does not fit its context. compact() shortens such an output until the
+prompt fits the budget of the provider (or model), in fixed steps that
+each run only while the output is still too long:
+
+1. repeats: runs of a repeated segment become one copy and a count
+2. paths: long lists of paths keep their first entries and a summary by
+   directory
+3. arguments: long argument lists lose their middle
+4. truncate: the middle of the output is cut
+
+The same output always compacts the same way. Outputs within the budget
+are sent verbatim.
+"""
+
+import re
+from collections import Counter
+from typing import List, Optional, Tuple
+
+# Prompt token budget (system prompt + alert) per provider, when
+# analysis.prompt_budget does not set one. Ollama leaves room for the
+# response in an 8k context.
+DEFAULT_BUDGETS = {
+    'ollama': 6000,
+    'openai': 16000,
+    'anthropic': 16000,
+}
+MIN_OUTPUT_TOKENS = 256
+
+# Roughly how BPE tokenizers split text: short letter runs, digit groups,
+# and punctuation one by one. Overestimates slightly, which is the safe side.
+_PIECE = re.compile(r'[A-Za-z]{1,5}|\d{1,3}|[^\sA-Za-z\d]')
+# A Falco output field (proc.cmdline=..., proc.aname[2]=...) starts a new value
+_FIELD = re.compile(r'^[A-Za-z_][\w.]*(\[\d+\])?=')
+
+MAX_SEGMENT = 8        # longest repeated segment looked for, in words
+MIN_REPEATS = 3
+MIN_PATHS = 8          # path lists shorter than this are kept
+KEEP_PATHS = 3
+KEEP_ARGS = 4          # arguments kept at each end of an elided list
+MARKER_TOKENS = 16     # estimated tokens of an elision marker
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimated token count of text, without a tokenizer."""
+    return len(_PIECE.findall(text))
+
+
+def prompt_budget(config: dict, provider: str, model: str = '') -> int:
+    """Prompt token budget from analysis.prompt_budget: a per-model entry
+    under 'models', else the provider's entry, else DEFAULT_BUDGETS."""
+    settings = config.get('analysis', {}).get('prompt_budget') or {}
+    models = settings.get('models') or {}
+    budget = models.get(model) or settings.get(provider) or DEFAULT_BUDGETS.get(provider, 16000)
+    return int(budget)
+
+
+def _collapse_repeats(words: List[str]) -> List[str]:
+    out, i = [], 0
+    while i < len(words):
+        best_size, best_count = 0, 1
+        for size in range(1, MAX_SEGMENT + 1):
+            segment = words[i:i + size]
+            if len(segment) < size:
+                break
+            count = 1
+            while words[i + count * size:i + (count + 1) * size] == segment:
+                count += 1
+            if count >= MIN_REPEATS and count * size > best_count * best_size:
+                best_size, best_count = size, count
+        if best_size:
+            out.extend(words[i:i + best_size])
+            out.append(f"[repeated {best_count} times]")
+            i += best_size * best_count
+        else:
+            out.append(words[i])
+            i += 1
+    return out
+
+
+def _is_path(word: str) -> bool:
+    word = word.strip(',;:"\'()[]')
+    return '/' in word and not word.startswith(('http://', 'https://'))
+
+
+def _directory(word: str) -> str:
+    parts = word.strip(',;:"\'()[]').split('/')
+    return '/'.join(parts[:-1][:3]) or '/'
+
+
+def _summarize_paths(words: List[str]) -> List[str]:
+    out, i = [], 0
+    while i < len(words):
+        end = i
+        while end < len(words) and _is_path(words[end]) and (end == i or not _FIELD.match(words[end])):
+            end += 1
+        if end - i >= MIN_PATHS:
+            run = words[i:end]
+            dirs = Counter(_directory(w) for w in run[KEEP_PATHS:])
+            top = ', '.join(f"{d} ({n})" for d, n in dirs.most_common(3))
+            more = f", {len(dirs) - 3} more directories" if len(dirs) > 3 else ''
+            out.extend(run[:KEEP_PATHS])
+            out.append(f"[... {len(run) - KEEP_PATHS} more paths in {top}{more}]")
+            i = end
+        else:
+            out.append(words[i])
+            i += 1
+    return out
+
+
+def _elide_arguments(words: List[str], excess: int) -> List[str]:
+    """Drop the middle of the longest argument lists until about excess
+    tokens are gone."""
+    # Argument lists: runs of words between Falco fields (and markers of
+    # earlier steps, the only words with spaces), found once
+    runs, start = [], 0
+    for i in range(1, len(words) + 1):
+        if i == len(words) or _FIELD.match(words[i]) or ' ' in words[i]:
+            runs.append((start, i))
+            start = i
+    cuts = []
+    for start, end in sorted(runs, key=lambda r: r[0] - r[1]):
+        if excess <= 0 or end - start <= 2 * KEEP_ARGS + 1:
+            break
+        # Cut from the middle of the run until enough tokens are gone
+        cut_start = cut_end = (start + end) // 2
+        removed = -MARKER_TOKENS
+        while removed < excess and (cut_start > start + KEEP_ARGS or cut_end < end - KEEP_ARGS):
+            if cut_end < end - KEEP_ARGS:
+                removed += estimate_tokens(words[cut_end])
+                cut_end += 1
+            if removed < excess and cut_start > start + KEEP_ARGS:
+                cut_start -= 1
+                removed += estimate_tokens(words[cut_start])
+        cuts.append((cut_start, cut_end))
+        excess -= removed
+    out, i = [], 0
+    for cut_start, cut_end in sorted(cuts):
+        out.extend(words[i:cut_start])
+        out.append(f"[... {cut_end - cut_start} arguments elided ...]")
+        i = cut_end
+    out.extend(words[i:])
+    return out
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    """Cut the middle of text, keeping two thirds of what fits from the start."""
+    keep = int(len(text) * (max_tokens - MARKER_TOKENS) / estimate_tokens(text))
+    while True:
+        head = keep * 2 // 3
+        tail = text[len(text) - (keep - head):] if keep > head else ''
+        truncated = f"{text[:head]} [... {len(text) - keep} characters elided ...] {tail}".rstrip()
+        if keep <= 0 or estimate_tokens(truncated) <= max_tokens:
+            return truncated
+        keep = int(keep * 0.9)
+
+
+def compact(text: str, max_tokens: int) -> Tuple[str, Optional[dict]]:
+    """Shorten text to at most about max_tokens estimated tokens.
+
+    Returns:
+        Tuple of (text, report) where report is None when text already fit,
+        else a dict with the token counts before and after, the characters
+        removed and the steps applied
+    """
+    max_tokens = max(max_tokens, MIN_OUTPUT_TOKENS)
+    before = estimate_tokens(text)
+    if before <= max_tokens:
+        return text, None
+
+    steps = []
+    words = text.split()
+    for name, step in (('repeats', _collapse_repeats), ('paths', _summarize_paths)):
+        compacted = step(words)
+        if compacted != words:
+            steps.append(name)
+            words = compacted
+        if estimate_tokens(' '.join(words)) <= max_tokens:
+            break
+    else:
+        excess = estimate_tokens(' '.join(words)) - max_tokens
+        compacted = _elide_arguments(words, excess)
+        if compacted != words:
+            steps.append('arguments')
+            words = compacted
+    compacted_text = ' '.join(words)
+    if estimate_tokens(compacted_text) > max_tokens:
+        steps.append('truncate')
+        compacted_text = _truncate(compacted_text, max_tokens)
+
+    return compacted_text, {
+        'tokens_before': before,
+        'tokens_after': estimate_tokens(compacted_text),
+        'budget': max_tokens,
+        'chars_removed': len(text) - len(compacted_text),
+        'steps': steps,
+    }
@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+"""
+SIB Auto-Enrichment - Analyze new alerts as they arrive
+
+Polls the log backend (Loki or VictoriaLogs) for alerts newer than a
+persisted watermark, keeps the priorities listed in
+analysis.auto_enrich_priority, and analyzes them with bounded concurrency.
+Results are written back with store_analysis and into the API's analysis
+cache, so the page an analyst opens from Grafana is already there instead
+of waiting on the LLM. A processed-alert ledger makes sure each alert is
+enriched once, even across restarts or several enricher instances.
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import logging
+import argparse
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List, Optional
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from analyzer import AlertAnalyzer, LogBatchWriter, alert_selector, load_config, parse_duration
+from admission import AdmissionController, Overloaded, provider_limits
+from cache import AnalysisCache, get_cache_key
+from ledger import Ledger, stream_key
+from storm import StormController
+from scheduler import AnalysisScheduler
+from triage import LOW, SKIP
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PRIORITIES = ['Critical', 'Error']
+
+# Seconds between ledger cleanups of a running enricher
+LEDGER_PRUNE_INTERVAL = 3600
+
+# Analysis outcomes
+ENRICHED = 'enriched'
+CACHED = 'cached'
+SKIPPED = 'skipped'
+FAILED = 'failed'
+DEFERRED = 'deferred'
+SAMPLED_OUT = 'sampled_out'
+TRIAGED = 'triaged'
+
+
+def is_enabled(value) -> bool:
+    """Interpret a config flag that may arrive as a string after ${VAR} expansion."""
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes', 'on')
+    return bool(value)
+
+
+class Watermark:
+    """Timestamp (ns) of the newest alert already handled, kept in a JSON file."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+
+    def load(self) -> Optional[int]:
+        try:
+            with open(self.path) as f:
+                return int(json.load(f)['ns'])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def save(self, ns: int):
+        tmp = self.path.with_suffix('.tmp')
+        with open(tmp, 'w') as f:
+            json.dump({'ns': ns, 'updated': datetime.now().isoformat()}, f)
+        os.replace(tmp, self.path)
+
+
+class AutoEnricher:
+    """Poll the log backend for new alerts and analyze them ahead of analysts.
+
+    Args:
+        config: Analysis config (see config.yaml.example)
+        cache: Analysis cache shared with the API
+        watermark: Where progress is persisted between restarts
+        ledger: Processed-alert ledger (per-alert exactly-once bookkeeping)
+        admission: Optional LLM budget shared with the API workers
+        storm: Optional alert-storm sampler (see storm.py)
+        concurrency: Analyses run at the same time
+        batch_size: Alerts fetched per query
+        lookback: How far back to start when there is no watermark yet
+        max_attempts: Failed analyses of one alert before it is skipped
+    """
+
+    def __init__(self, config: dict, cache: AnalysisCache, watermark: Watermark,
+                 ledger: Ledger, admission: Optional[AdmissionController] = None,
+                 storm: Optional[StormController] = None, concurrency: int = 2,
+                 batch_size: int = 100, lookback: timedelta = timedelta(minutes=15),
+                 max_attempts: int = 3):
+        self.analyzer = AlertAnalyzer(config, triage=True, cache=cache)
+        self.writer = LogBatchWriter(self.analyzer.backend)
+        self.cache = cache
+        self.watermark = watermark
+        self.ledger = ledger
+        self.admission = admission
+        self.storm = storm
+        self.scheduler = AnalysisScheduler.from_config(config, max_queued=batch_size)
+        self.provider = config.get('analysis', {}).get('provider', 'ollama')
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.lookback = lookback
+        self.max_attempts = max_attempts
+        self.priorities = self._priorities(config)
+        self._attempts = {}
+        self._last_prune = None
+
+    @staticmethod
+    def _priorities(config: dict) -> List[str]:
+        priorities = config.get('analysis', {}).get('auto_enrich_priority') or DEFAULT_PRIORITIES
+        if isinstance(priorities, str):
+            priorities = [p.strip() for p in priorities.split(',')]
+        # Priorities go into a LogQL regex, so only plain words are accepted
+        valid = [p for p in priorities if p.isalnum()]
+        for p in set(priorities) - set(valid):
+            logger.warning(f"Ignoring invalid auto_enrich_priority: {p!r}")
+        return valid or DEFAULT_PRIORITIES
+
+    def query(self) -> str:
+        return alert_selector(self.priorities)
+
+    def _analyze(self, alert: dict) -> str:
+        if not self.ledger.claim(alert):
+            return SKIPPED
+        try:
+            outcome = self._enrich(alert)
+        except Exception:
+            self.ledger.release(alert)
+            raise
+        if outcome in (ENRICHED, CACHED, TRIAGED):
+            self.ledger.mark_done(alert)
+        else:
+            self.ledger.release(alert)
+        return outcome
+
+    def _enrich(self, alert: dict) -> str:
+        labels = alert.get('_labels', {})
+        rule = labels.get('rule', alert.get('rule', 'Unknown'))
+        output = alert.get('output', '')
+        cache_key = get_cache_key(output, rule)
+        if self.cache.get(cache_key) is not None:
+            return CACHED
+
+        try:
+            # Answers from the rule knowledge base, a similar analysis or pre-triage need no LLM slot
+            if self.admission is not None and self.analyzer.needs_llm(alert):
+                with self.admission.slot(self.provider):
+                    result = self.analyzer.analyze_alert(alert)
+            else:
+                result = self.analyzer.analyze_alert(alert)
+        except Overloaded as e:
+            logger.info(f"LLM busy, deferring {rule} alert ({e})")
+            return DEFERRED
+
+        if 'error' in result.get('analysis', {}):
+            return FAILED
+        self.analyzer.store_analysis(result, self.writer)
+        if result.get('triage', {}).get('action') == SKIP:
+            # Not cached: an analyst opening the alert still gets the LLM's analysis
+            return TRIAGED
+        self.cache.save(cache_key, result, output, rule,
+                        labels.get('priority', alert.get('priority', 'Unknown')),
+                        labels.get('hostname', alert.get('hostname', 'unknown')))
+        return ENRICHED
+
+    def _outcome(self, alert: dict, outcome: str) -> bool:
+        """Record an outcome; True when the alert no longer needs processing."""
+        fingerprint = alert['_fingerprint']
+        if outcome == FAILED:
+            self._attempts[fingerprint] = self._attempts.get(fingerprint, 0) + 1
+            if self._attempts[fingerprint] < self.max_attempts:
+                return False
+            logger.error(f"Giving up on alert at {alert['_timestamp']} after {self.max_attempts} attempts")
+            # Recorded as done so other runs don't retry it either
+            self.ledger.mark_done(alert)
+        elif outcome == SAMPLED_OUT:
+            # Represented by the storm samples analyzed in its window
+            self.ledger.mark_done(alert)
+        elif outcome in (DEFERRED, SKIPPED):
+            # Deferred, or claimed by another enricher that may still fail
+            return False
+        self._attempts.pop(fingerprint, None)
+        return True
+
+    def _run_scheduled(self, alerts: List[dict]) -> dict:
+        """Analyze alerts most urgent first; returns id(alert) -> outcome."""
+        missed = sum(s['missed'] for s in self.scheduler.stats().values())
+        for alert in alerts:
+            # Deadlines count from when the alert fired; alerts the triage
+            # model is sure are not severe wait behind the others
+            assessment = self.analyzer.pretriage(alert)
+            self.scheduler.put(alert, since=alert['_timestamp_ns'] / 1e9,
+                               demote=1.0 if assessment and assessment['action'] == LOW else 0.0)
+        outcomes = {}
+        
+        def work():
+            while True:
+                alert = self.scheduler.get(timeout=0)
+                if alert is None:
+                    return
+                try:
+                    outcomes[id(alert)] = self._analyze(alert)
+                except Exception as e:
+                    logger.warning(f"Analysis failed: {e}")
+                    outcomes[id(alert)] = FAILED
+        
+        workers = [threading.Thread(target=work) for _ in range(min(self.concurrency, len(alerts)))]
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+        
+        stats = self.scheduler.stats()
+        if sum(s['missed'] for s in stats.values()) > missed:
+            logger.warning("Alerts missed their analysis deadline: "
+                           + ', '.join(f"{p} {s['missed']} (max wait {s['max_wait']:.0f}s)"
+                                       for p, s in sorted(stats.items()) if s['missed']))
+        return outcomes
+    
+    def poll_once(self) -> int:
+        """Analyze one batch of new alerts and advance the watermark.
+
+        The watermark only moves past alerts that are done, so a failed or
+        deferred analysis is retried on the next poll; alerts analyzed after
+        it are in the cache by then and are not sent to the LLM again.
+
+        Returns:
+            Number of alerts the watermark moved past
+        """
+        last_ns = self.watermark.load()
+        end = datetime.now()
+        if last_ns is None:
+            start = end - self.lookback
+        else:
+            # Inclusive (and rounded down) so entries sharing the watermark's
+            # timestamp in other streams are not lost; the ledger drops repeats
+            start = datetime.fromtimestamp((last_ns - 1000) / 1e9)
+
+        alerts = self.analyzer.backend.query_range(self.query(), start, end, self.batch_size,
+                                                direction='forward')
+        alerts = [a for a in alerts if not self.ledger.is_done(a)]
+        if not alerts:
+            return 0
+        alerts.sort(key=lambda a: a['_timestamp_ns'])
+
+        selected = alerts
+        if self.storm is not None:
+            selected = list(self.storm.stream(alerts))
+        analyzed = self._run_scheduled(selected)
+        outcomes = [analyzed.get(id(alert), SAMPLED_OUT) for alert in alerts]
+        # One push (per few hundred entries) for the whole batch
+        if not self.writer.flush():
+            logger.warning(f"Failed to store some analyses in {self.analyzer.backend.name}")
+
+        counts = {}
+        new_mark = last_ns
+        done = 0
+        blocked = False
+        streams = {}
+        for alert, outcome in zip(alerts, outcomes):
+            counts[outcome] = counts.get(outcome, 0) + 1
+            if self._outcome(alert, outcome) and not blocked:
+                new_mark = alert['_timestamp_ns']
+                labels = alert.get('_labels', {})
+                streams[stream_key(labels)] = (labels, new_mark)
+                done += 1
+            else:
+                blocked = True
+        if new_mark is not None and new_mark != last_ns:
+            self.watermark.save(new_mark)
+            # Everything before the last done entry of each stream is done
+            for labels, ts_ns in streams.values():
+                self.ledger.advance(labels, ts_ns)
+
+        logger.info(f"Auto-enrich: {len(alerts)} new alerts, "
+                    + ', '.join(f"{n} {k}" for k, n in sorted(counts.items())))
+        return done
+
+    def prune_ledger(self):
+        """Drop old fingerprints and abandoned claims, at most once per LEDGER_PRUNE_INTERVAL."""
+        now = time.monotonic()
+        if self._last_prune is not None and now - self._last_prune < LEDGER_PRUNE_INTERVAL:
+            return
+        self._last_prune = now
+        try:
+            self.ledger.prune()
+        except Exception as e:
+            logger.warning(f"Ledger cleanup failed: {e}")
+
+    def run(self, interval: float = 15.0, stop=None):
+        """Poll until stop() returns True, draining backlogs without sleeping."""
+        stop = stop or (lambda: False)
+        logger.info(f"Auto-enrich started: {self.query()} every {interval:.0f}s, "
+                    f"concurrency {self.concurrency}")
+        while not stop():
+            self.prune_ledger()
+            try:
+                done = self.poll_once()
+            except Exception as e:
+                logger.warning(f"Auto-enrich poll failed: {e}")
+                done = 0
+            if done >= self.batch_size:
+                # A full batch went through - more is likely waiting
+                continue
+            deadline = time.monotonic() + interval
+            while not stop() and time.monotonic() < deadline:
+                time.sleep(0.5)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='SIB Auto-Enrichment - analyze new alerts as they arrive'
+    )
+    parser.add_argument('--config', '-c', help='Path to config file')
+    parser.add_argument('--interval', type=float, default=15.0,
+                        help='Seconds between polls (default: 15)')
+    parser.add_argument('--concurrency', type=int, default=2,
+                        help='Analyses run at the same time (default: 2)')
+    parser.add_argument('--batch-size', type=int, default=100,
+                        help='Alerts fetched per poll (default: 100)')
+    parser.add_argument('--lookback', default='15m',
+                        help='Where to start without saved progress (e.g., 15m, 1h)')
+    parser.add_argument('--cache-dir', default=os.environ.get('ANALYSIS_CACHE_DIR', '/app/cache'),
+                        help='Analysis cache shared with the API')
+    parser.add_argument('--state', help='Watermark file (default: <cache-dir>/enricher.state)')
+    parser.add_argument('--backend', choices=['loki', 'victorialogs'],
+                        help='Override log backend (config: log_backend)')
+    parser.add_argument('--loki-url', help='Override Loki URL')
+    parser.add_argument('--victorialogs-url', help='Override VictoriaLogs URL')
+    parser.add_argument('--once', action='store_true',
+                        help='Process one batch and exit')
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    config = load_config(args.config)
+    if args.backend:
+        config['log_backend'] = args.backend
+    if args.loki_url:
+        config.setdefault('loki', {})['url'] = args.loki_url
+    if args.victorialogs_url:
+        config.setdefault('victorialogs', {})['url'] = args.victorialogs_url
+
+    analysis_config = config.get('analysis', {})
+    if not is_enabled(analysis_config.get('enabled', True)) or not is_enabled(analysis_config.get('auto_enrich', False)):
+        print("Auto-enrichment is disabled in config. Set analysis.enabled and analysis.auto_enrich to true.")
+        sys.exit(0)
+
+    cache = AnalysisCache(Path(args.cache_dir), config)
+    admission = AdmissionController(
+        cache.cache_dir / 'admission.db',
+        max_in_flight=int(os.environ.get('LLM_MAX_IN_FLIGHT', '2')),
+        max_queue=int(os.environ.get('LLM_MAX_QUEUE', '20')),
+        wait_timeout=float(os.environ.get('LLM_QUEUE_TIMEOUT', '60')),
+        limits=provider_limits(config),
+    )
+    state = Path(args.state) if args.state else cache.cache_dir / 'enricher.state'
+    legacy_state = cache.cache_dir / 'enricher.json'
+    if not args.state and not state.exists() and legacy_state.exists():
+        # Kept as enricher.json before, where it was mistaken for a cached analysis
+        os.replace(legacy_state, state)
+    enricher = AutoEnricher(
+        config, cache,
+        Watermark(state),
+        Ledger(cache.cache_dir / 'ledger.db'),
+        admission=admission,
+        storm=StormController.from_config(config),
+        concurrency=max(1, args.concurrency),
+        batch_size=args.batch_size,
+        lookback=parse_duration(args.lookback),
+    )
+
+    # Load a local model before the first batch instead of during it
+    enricher.analyzer.provider.warm_up()
+
+    if args.once:
+        enricher.poll_once()
+        return
+
+    # Finish the batch in progress on SIGTERM/SIGINT, then exit
+    stopping = []
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *_: stopping.append(True))
+    enricher.run(interval=args.interval, stop=lambda: bool(stopping))
+
+
+if __name__ == '__main__':
+    main()
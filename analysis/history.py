@@ -0,0 +1,263 @@
+"""
+SIB Analysis History Index - SQLite index over cached analyses
+
+The analysis cache stores one JSON file per analysis. Listing, filtering
+and paging by reading those files costs time proportional to the size of
+the cache, so this module keeps a small SQLite index next to them with
+the fields the history views query on, plus a full-text index over the
+summary. Pages are fetched with keyset (cursor) pagination so deep pages
+cost the same as the first one.
+"""
+
+import re
+import json
+import base64
+import sqlite3
+import logging
+from contextlib import closing
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SEVERITY_RANK = {'critical': 4, 'high': 3, 'medium': 2, 'low': 1}
+
+# Sortable fields -> indexed columns
+SORT_COLUMNS = {
+    'timestamp': 'ts',
+    'severity': 'severity_rank',
+    'rule': 'rule',
+    'hostname': 'hostname',
+    'priority': 'priority',
+}
+
+# Filterable fields -> indexed columns (exact match, repeatable)
+FILTER_COLUMNS = {
+    'rule': 'rule',
+    'severity': 'severity',
+    'hostname': 'hostname',
+    'priority': 'priority',
+}
+
+
+# Cache files are named <cache_key>.json; other JSON state may share the directory
+_CACHE_KEY = re.compile(r'^[a-f0-9]{16}$')
+
+
+def is_cache_key(name: str) -> bool:
+    """True for cache keys (16 hex chars of a SHA256), e.g. a cache file's stem."""
+    return bool(_CACHE_KEY.match(name))
+
+
+def parse_time(value: str) -> float:
+    """Parse an epoch-seconds or ISO 8601 timestamp into epoch seconds."""
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+
+
+def encode_cursor(sort_value, cache_key: str) -> str:
+    raw = json.dumps([sort_value, cache_key]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[object, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        sort_value, cache_key = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(cache_key, str):
+        raise ValueError("Invalid cursor")
+    return sort_value, cache_key
+
+
+class HistoryIndex:
+    """Queryable index of cached analyses.
+
+    Args:
+        db_path: SQLite file in the (shared) cache directory
+    """
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        with closing(self._connect()) as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript("""
+                CREATE TABLE IF NOT EXISTS analyses (
+                    cache_key TEXT PRIMARY KEY,
+                    ts REAL NOT NULL,
+                    timestamp TEXT,
+                    rule TEXT,
+                    priority TEXT,
+                    hostname TEXT,
+                    severity TEXT,
+                    severity_rank INTEGER,
+                    summary TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_analyses_ts ON analyses (ts, cache_key);
+                CREATE INDEX IF NOT EXISTS idx_analyses_rule ON analyses (rule, ts);
+                CREATE INDEX IF NOT EXISTS idx_analyses_hostname ON analyses (hostname, ts);
+                CREATE INDEX IF NOT EXISTS idx_analyses_severity ON analyses (severity, ts);
+                CREATE INDEX IF NOT EXISTS idx_analyses_priority ON analyses (priority, ts);
+                CREATE INDEX IF NOT EXISTS idx_analyses_severity_rank ON analyses (severity_rank, cache_key);
+            """)
+            try:
+                db.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS analyses_fts
+                              USING fts5(cache_key UNINDEXED, summary)""")
+                self.fts = True
+            except sqlite3.OperationalError:
+                # SQLite built without FTS5 - fall back to LIKE scans
+                logger.warning("SQLite FTS5 unavailable, history search will use LIKE")
+                self.fts = False
+        try:
+            self.db_path.chmod(0o600)
+        except OSError:
+            pass
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.db_path, timeout=10)
+        db.row_factory = sqlite3.Row
+        return db
+
+    @staticmethod
+    def _row(data: dict, cache_key: str, mtime: Optional[float] = None) -> tuple:
+        timestamp = data.get('timestamp') or ''
+        try:
+            ts = parse_time(timestamp)
+        except (ValueError, TypeError):
+            ts = mtime or datetime.now().timestamp()
+        analysis = data.get('analysis') or {}
+        severity = str((analysis.get('risk') or {}).get('severity') or 'unknown').lower()
+        return (
+            data.get('cache_key', cache_key), ts, timestamp,
+            data.get('rule'), data.get('priority'), data.get('hostname'),
+            severity, SEVERITY_RANK.get(severity, 0), analysis.get('summary') or '',
+        )
+
+    def _upsert(self, db: sqlite3.Connection, rows: Iterable[tuple]):
+        for row in rows:
+            db.execute("INSERT OR REPLACE INTO analyses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", row)
+            if self.fts:
+                db.execute("DELETE FROM analyses_fts WHERE cache_key = ?", (row[0],))
+                db.execute("INSERT INTO analyses_fts (cache_key, summary) VALUES (?, ?)", (row[0], row[8]))
+
+    def add(self, cache_data: dict):
+        """Index (or re-index) one cached analysis record."""
+        with closing(self._connect()) as db, db:
+            self._upsert(db, [self._row(cache_data, cache_data['cache_key'])])
+
+    def remove(self, cache_keys: Iterable[str]):
+        """Drop entries whose cache files were deleted."""
+        keys = [(k,) for k in cache_keys]
+        if not keys:
+            return
+        with closing(self._connect()) as db, db:
+            db.executemany("DELETE FROM analyses WHERE cache_key = ?", keys)
+            if self.fts:
+                db.executemany("DELETE FROM analyses_fts WHERE cache_key = ?", keys)
+
+    def sync(self, cache_dir: Path):
+        """Reconcile the index with the cache files (run once at startup)."""
+        with closing(self._connect()) as db:
+            indexed = {row[0] for row in db.execute("SELECT cache_key FROM analyses")}
+        on_disk = {f.stem: f for f in Path(cache_dir).glob("*.json") if is_cache_key(f.stem)}
+
+        rows = []
+        for cache_key in on_disk.keys() - indexed:
+            cache_file = on_disk[cache_key]
+            try:
+                with open(cache_file) as f:
+                    rows.append(self._row(json.load(f), cache_key, cache_file.stat().st_mtime))
+            except (OSError, ValueError):
+                pass
+        if rows:
+            with closing(self._connect()) as db, db:
+                self._upsert(db, rows)
+            logger.info(f"History index: added {len(rows)} cached analyses")
+        self.remove(indexed - on_disk.keys())
+
+    def count(self) -> int:
+        with closing(self._connect()) as db:
+            return db.execute("SELECT COUNT(*) FROM analyses").fetchone()[0]
+
+    def query(self, filters: Optional[dict] = None, since: Optional[float] = None,
+              until: Optional[float] = None, search: Optional[str] = None,
+              sort: str = 'timestamp', order: str = 'desc', limit: int = 50,
+              cursor: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+        """Return one page of matching analyses and the cursor for the next page.
+
+        Args:
+            filters: Field name -> list of accepted values (see FILTER_COLUMNS)
+            since / until: Epoch-second bounds on the analysis timestamp
+            search: Full-text query over the summary
+            sort: One of SORT_COLUMNS
+            order: 'asc' or 'desc'
+            cursor: Opaque cursor from a previous page
+
+        Raises:
+            ValueError: Unknown sort field or malformed cursor
+        """
+        if sort not in SORT_COLUMNS:
+            raise ValueError(f"Unknown sort field: {sort}")
+        column = SORT_COLUMNS[sort]
+        descending = order != 'asc'
+
+        where, params = [], []
+        for field, values in (filters or {}).items():
+            values = [v for v in values if v]
+            if not values or field not in FILTER_COLUMNS:
+                continue
+            if field == 'severity':
+                values = [v.lower() for v in values]
+            where.append(f"a.{FILTER_COLUMNS[field]} IN ({','.join('?' * len(values))})")
+            params.extend(values)
+        if since is not None:
+            where.append("a.ts >= ?")
+            params.append(since)
+        if until is not None:
+            where.append("a.ts <= ?")
+            params.append(until)
+        if search:
+            if self.fts:
+                # Quote each term so user input is never parsed as FTS syntax
+                terms = ' '.join('"' + t.replace('"', '""') + '"' for t in search.split())
+                where.append("a.cache_key IN (SELECT cache_key FROM analyses_fts WHERE analyses_fts MATCH ?)")
+                params.append(terms)
+            else:
+                where.append("a.summary LIKE ?")
+                params.append(f"%{search}%")
+        if cursor:
+            sort_value, cache_key = decode_cursor(cursor)
+            op = '<' if descending else '>'
+            where.append(f"(a.{column} {op} ? OR (a.{column} = ? AND a.cache_key {op} ?))")
+            params.extend([sort_value, sort_value, cache_key])
+
+        direction = 'DESC' if descending else 'ASC'
+        sql = "SELECT a.* FROM analyses a"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY a.{column} {direction}, a.cache_key {direction} LIMIT ?"
+        params.append(limit + 1)
+
+        with closing(self._connect()) as db:
+            rows = db.execute(sql, params).fetchall()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            next_cursor = encode_cursor(last[column], last['cache_key'])
+
+        items = [{
+            'cache_key': row['cache_key'],
+            'timestamp': row['timestamp'],
+            'rule': row['rule'],
+            'priority': row['priority'],
+            'hostname': row['hostname'],
+            'severity': row['severity'],
+            'summary': row['summary'],
+        } for row in rows]
+        return items, next_cursor
@@ -0,0 +1,180 @@
+"""
+SIB Incident Correlation - Group related alerts into incidents
+
+An intrusion rarely fires one rule: a shell in a container, a read of
+/etc/shadow, an outbound connection and a miner are links of one chain.
+IncidentCorrelator groups alerts from the same host that share a
+container, a process (its pid or parent pid) or a session, and keeps an
+incident open while new alerts keep joining it within the window. Each
+closed incident is analyzed with one LLM call over its timeline instead
+of one call per alert.
+"""
+
+import hashlib
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Set, Tuple
+
+# Ids that many unrelated processes share (init, the host "container")
+_SHARED_IDS = {'', '0', '1', 'host', 'None', 'null'}
+
+# Output fields that tie an alert to a process tree: pid, parent, ancestors, session
+_LINEAGE_FIELDS = ('proc.pid', 'proc.ppid', 'proc.apid[2]', 'proc.apid[3]', 'proc.sid')
+
+
+def entity_keys(alert: dict) -> Set[Tuple[str, str]]:
+    """Container, process and session ids an alert can be correlated by."""
+    fields = alert.get('output_fields') or {}
+    keys = set()
+    container = str(fields.get('container.id') or '')
+    if container not in _SHARED_IDS:
+        keys.add(('container', container))
+    for field in _LINEAGE_FIELDS:
+        value = str(fields.get(field) or '')
+        if value not in _SHARED_IDS:
+            # Sessions and pids are separate id spaces
+            keys.add(('sid' if field == 'proc.sid' else 'pid', value))
+    return keys
+
+
+def _hostname(alert: dict) -> str:
+    labels = alert.get('_labels', {})
+    return str(labels.get('hostname', alert.get('hostname', 'unknown')))
+
+
+class Incident:
+    """Related alerts from one host, in time order."""
+
+    def __init__(self, hostname: str):
+        self.hostname = hostname
+        self.alerts: List[dict] = []
+        self.keys: Set[Tuple[str, str]] = set()
+        self.first_ns = 0
+        self.last_ns = 0
+
+    @property
+    def id(self) -> str:
+        """Stable id derived from the first alert."""
+        first = self.alerts[0]
+        seed = first.get('_fingerprint') or f"{self.hostname}:{self.first_ns}:{first.get('output', '')}"
+        return hashlib.sha256(seed.encode()).hexdigest()[:16]
+
+    @property
+    def rules(self) -> List[str]:
+        seen = []
+        for alert in self.alerts:
+            rule = alert.get('_labels', {}).get('rule', alert.get('rule', 'Unknown'))
+            if rule not in seen:
+                seen.append(rule)
+        return seen
+
+    @property
+    def containers(self) -> List[str]:
+        return sorted(value for kind, value in self.keys if kind == 'container')
+
+    @property
+    def start(self) -> datetime:
+        return datetime.fromtimestamp(self.first_ns / 1e9)
+
+    @property
+    def end(self) -> datetime:
+        return datetime.fromtimestamp(self.last_ns / 1e9)
+
+    def add(self, alert: dict, ts_ns: int, keys: Set[Tuple[str, str]]):
+        if not self.alerts:
+            self.first_ns = ts_ns
+        self.alerts.append(alert)
+        self.keys |= keys
+        self.first_ns = min(self.first_ns, ts_ns)
+        self.last_ns = max(self.last_ns, ts_ns)
+
+    def merge(self, other: 'Incident'):
+        self.alerts = sorted(self.alerts + other.alerts, key=lambda a: a.get('_timestamp_ns', 0))
+        self.keys |= other.keys
+        self.first_ns = min(self.first_ns, other.first_ns)
+        self.last_ns = max(self.last_ns, other.last_ns)
+
+
+class IncidentCorrelator:
+    """Streaming sessionization of alerts into incidents.
+
+    Args:
+        window: Seconds without a related alert after which an incident closes
+        max_alerts: Alerts after which an incident is closed and a new one started
+    """
+
+    def __init__(self, window: float = 600.0, max_alerts: int = 50):
+        self.window_ns = int(window * 1e9)
+        self.max_alerts = max_alerts
+        self._open: Dict[str, List[Incident]] = {}
+
+    def _expire(self, now_ns: int) -> List[Incident]:
+        closed = []
+        for hostname, incidents in list(self._open.items()):
+            keep = []
+            for incident in incidents:
+                (closed if incident.last_ns + self.window_ns < now_ns else keep).append(incident)
+            if keep:
+                self._open[hostname] = keep
+            else:
+                del self._open[hostname]
+        return closed
+
+    def add(self, alert: dict) -> List[Incident]:
+        """Add an alert (in time order); returns the incidents it closed."""
+        ts_ns = int(alert.get('_timestamp_ns') or 0)
+        closed = self._expire(ts_ns)
+        hostname = _hostname(alert)
+        keys = entity_keys(alert)
+        incidents = self._open.setdefault(hostname, [])
+
+        # Alerts without ids to correlate by stay on their own
+        related = [i for i in incidents if keys & i.keys] if keys else []
+        if related:
+            incident = related[0]
+            for other in related[1:]:
+                incident.merge(other)
+                incidents.remove(other)
+        else:
+            incident = Incident(hostname)
+            incidents.append(incident)
+        incident.add(alert, ts_ns, keys)
+
+        if len(incident.alerts) >= self.max_alerts:
+            incidents.remove(incident)
+            closed.append(incident)
+        return sorted(closed, key=lambda i: i.first_ns)
+
+    def flush(self) -> List[Incident]:
+        """Close and return every open incident."""
+        closed = [i for incidents in self._open.values() for i in incidents]
+        self._open = {}
+        return sorted(closed, key=lambda i: i.first_ns)
+
+    def stream(self, alerts: Iterable[dict]) -> Iterator[Incident]:
+        """Yield incidents (including single-alert ones) as they close."""
+        for alert in alerts:
+            yield from self.add(alert)
+        yield from self.flush()
+
+
+def format_timeline(alerts: List[dict], max_entries: int = 20, max_line: int = 300) -> str:
+    """One line per (obfuscated) alert: offset, priority, rule and output.
+
+    Long incidents keep their first and last entries.
+    """
+    if not alerts:
+        return ''
+    first_ns = int(alerts[0].get('_timestamp_ns') or 0)
+    lines = []
+    for alert in alerts:
+        labels = alert.get('_labels', {})
+        offset = (int(alert.get('_timestamp_ns') or 0) - first_ns) / 1e9
+        output = ' '.join(str(alert.get('output', '')).split())
+        if len(output) > max_line:
+            output = output[:max_line] + '...'
+        lines.append(f"+{offset:.0f}s [{labels.get('priority', alert.get('priority', '?'))}] "
+                     f"{labels.get('rule', alert.get('rule', 'Unknown'))}: {output}")
+    if len(lines) > max_entries:
+        head = max_entries // 2
+        lines = lines[:head] + [f"... {len(lines) - max_entries} more alerts ..."] + lines[-(max_entries - head):]
+    return '\n'.join(lines)
@@ -0,0 +1,194 @@
+"""
+SIB Analysis Jobs - Background job queue for slow LLM analyses
+
+Submitting a job returns immediately with a job id. A bounded pool of
+worker threads drains the queue, and job status is published as small
+JSON files in a shared directory so that any gunicorn worker can answer
+polls and SSE subscriptions, not just the one that accepted the job.
+"""
+
+import os
+import json
+import time
+import uuid
+import queue
+import logging
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Job states
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+ERROR = 'error'
+ACTIVE_STATES = {QUEUED, RUNNING}
+
+
+class QueueFull(Exception):
+    """Raised when the job queue cannot accept more work."""
+
+
+class JobError(Exception):
+    """Raised by runners with a message that is safe to show to clients."""
+
+
+def is_valid_job_id(job_id: str) -> bool:
+    """Validate job id format (32 hex chars from uuid4)."""
+    return len(job_id) == 32 and all(c in '0123456789abcdef' for c in job_id)
+
+
+class JobQueue:
+    """Bounded in-process worker pool with job state in a shared directory.
+
+    Args:
+        job_dir: Directory for job status files, shared by all workers
+        runner: Called with the job params in a worker thread; returns the
+            cache key under which the result was stored
+        workers: Number of worker threads in this process
+        max_queued: Maximum jobs waiting in this process before rejecting
+        stale_after: Seconds after which an unfinished job is reported lost
+    """
+
+    def __init__(self, job_dir: Path, runner: Callable[[dict], str], workers: int = 2,
+                 max_queued: int = 100, stale_after: float = 600.0):
+        self.job_dir = Path(job_dir)
+        self.job_dir.mkdir(parents=True, exist_ok=True)
+        self.runner = runner
+        self.workers = workers
+        self.stale_after = stale_after
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queued)
+        self._lock = threading.Lock()
+        self._active: Dict[str, str] = {}  # dedupe key -> job id
+        self._threads: list = []
+
+    def _path(self, job_id: str) -> Path:
+        return self.job_dir / f"{job_id}.json"
+
+    def _write(self, job: dict):
+        """Atomically publish job state for other workers."""
+        job['updated'] = time.time()
+        tmp = self._path(job['id']).with_suffix('.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(job, f)
+        os.replace(tmp, self._path(job['id']))
+
+    def _start_workers(self):
+        # Started lazily so threads are created after gunicorn forks
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._work, name=f"analysis-job-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def _work(self):
+        while True:
+            job, params, dedupe_key = self._queue.get()
+            try:
+                job['status'] = RUNNING
+                self._write(job)
+                job['cache_key'] = self.runner(params)
+                job['status'] = DONE
+            except JobError as e:
+                logger.warning(f"Analysis job {job['id']} failed: {e}")
+                job['status'] = ERROR
+                job['error'] = str(e)
+            except Exception:
+                logger.exception(f"Analysis job {job['id']} failed")
+                job['status'] = ERROR
+                job['error'] = 'Internal analysis error'
+            finally:
+                with self._lock:
+                    if dedupe_key and self._active.get(dedupe_key) == job['id']:
+                        del self._active[dedupe_key]
+                try:
+                    self._write(job)
+                except OSError as e:
+                    # Readers see the job expire after stale_after
+                    logger.warning(f"Could not record analysis job {job['id']}: {e}")
+                self._queue.task_done()
+
+    def submit(self, params: dict, dedupe_key: Optional[str] = None, **meta) -> Tuple[dict, bool]:
+        """Queue a job.
+
+        Jobs submitted with the same dedupe_key while one is still pending
+        in this process share the pending job.
+
+        Returns:
+            Tuple of (job status record, created) where created is False
+            when an identical pending job was reused.
+        """
+        self._start_workers()
+        with self._lock:
+            if dedupe_key and dedupe_key in self._active:
+                existing = self.get(self._active[dedupe_key])
+                if existing and existing['status'] in ACTIVE_STATES:
+                    return existing, False
+
+            job = {
+                'id': uuid.uuid4().hex,
+                'status': QUEUED,
+                'created': time.time(),
+                'cache_key': dedupe_key,
+                'error': None,
+                **meta,
+            }
+            if self._queue.full():
+                raise QueueFull(f"Job queue full ({self._queue.maxsize} pending)")
+            # Publish before queueing so a worker's RUNNING write always wins
+            self._write(job)
+            self._queue.put_nowait((dict(job), params, dedupe_key))
+            if dedupe_key:
+                self._active[dedupe_key] = job['id']
+        return job, True
+
+    def get(self, job_id: str) -> Optional[dict]:
+        """Read job status from the shared directory."""
+        try:
+            with open(self._path(job_id)) as f:
+                job = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if job['status'] in ACTIVE_STATES and time.time() - job['updated'] > self.stale_after:
+            # Worker died or was recycled before finishing
+            job['status'] = ERROR
+            job['error'] = 'Job expired before completion'
+        return job
+
+    def pending(self) -> int:
+        """Number of jobs waiting in this process."""
+        return self._queue.qsize()
+
+    def watch(self, job_id: str, timeout: float, interval: float = 0.5) -> Iterator[Optional[dict]]:
+        """Yield the job record whenever it changes until it finishes.
+
+        Yields None between changes so SSE streams can send keepalives.
+        """
+        deadline = time.monotonic() + timeout
+        last_status = None
+        while time.monotonic() < deadline:
+            job = self.get(job_id)
+            if job is None:
+                return
+            if job['status'] != last_status:
+                last_status = job['status']
+                yield job
+                if job['status'] not in ACTIVE_STATES:
+                    return
+            else:
+                yield None
+            time.sleep(interval)
+
+    def cleanup(self, max_age: float = 86400):
+        """Remove status files for jobs older than max_age seconds."""
+        cutoff = time.time() - max_age
+        for job_file in self.job_dir.glob("*.json"):
+            try:
+                if job_file.stat().st_mtime < cutoff:
+                    job_file.unlink()
+            except OSError:
+                pass
@@ -0,0 +1,322 @@
+"""
+SIB Rule Knowledge - Answer routine alerts of well-known rules directly
+
+For many stock Falco rules the MITRE mapping, mitigations and usual
+false-positive causes are the same every time the rule fires. The rule
+knowledge base holds a curated analysis per rule, in the schema of the
+LLM's answer, and returns it without an LLM call when an alert looks the
+way the rule normally does: its output matches the rule's `expected`
+patterns, matches none of the `suspicious` patterns (built-in and
+per-rule), and its priority is not raised above the rule's usual one.
+Anything else, and every rule not in the knowledge base, goes to the LLM.
+
+The built-in entries can be extended, replaced or removed with YAML files
+(analysis.knowledge.files):
+
+    version: 3
+    rules:
+      My custom rule:
+        priority: Notice
+        expected: ['command=backup\\.sh']
+        suspicious: ['--exfil']
+        mitre_attack: {tactic: Collection, technique_id: T1119, technique_name: Automated Collection}
+        risk: {severity: Low, confidence: High, impact: ...}
+        ...
+      Terminal shell in container: null    # always ask the LLM
+"""
+
+import os
+import re
+import copy
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import yaml
+
+from scheduler import PRIORITY_RANK
+
+logger = logging.getLogger(__name__)
+
+BUILTIN_VERSION = 1
+
+# Signs of an attack in any alert: never answered from the knowledge base
+SUSPICIOUS_PATTERNS = [
+    r'/dev/(tcp|udp)/',
+    r'\bbase64\s+(-d|--decode)',
+    r'\b(curl|wget)\b[^|;]*\|\s*(ba|da|z)?sh\b',
+    r'\bnc(at)?\b[^|;]*\s-[a-z]*e\b',
+    r'\bsocat\b',
+    r'\bmkfifo\b',
+    r'/dev/shm/',
+    r'\b(xmrig|minerd|stratum\+tcp)',
+    r'\bchmod\s+[0-7]*[+]?[sx]\b.*\s/tmp/',
+    r'\b(python[0-9.]*|perl|ruby|php)\s+-[a-z]*[ce]\b',
+    r'/etc/(shadow|sudoers)',
+    r'\.ssh/(id_|authorized_keys)',
+]
+
+# Fields of an entry that are returned as the analysis
+ANALYSIS_FIELDS = ('attack_vector', 'mitre_attack', 'risk', 'investigate', 'mitigations',
+                   'false_positive', 'summary')
+
+BUILTIN_RULES = {
+    'Package management process launched': {
+        'priority': 'Notice',
+        'expected': [r'\b(apt|apt-get|aptitude|dpkg|yum|dnf|rpm|apk|zypper|pip[0-9.]*|npm|gem)\b'],
+        'attack_vector': 'Software installed or changed inside a running container, which may add tools for later stages or persist a modified image layer.',
+        'mitre_attack': {'tactic': 'Execution', 'technique_id': 'T1072',
+                         'technique_name': 'Software Deployment Tools', 'sub_technique': None},
+        'risk': {'severity': 'Low', 'confidence': 'Medium',
+                 'impact': 'Drift from the container image; unreviewed packages running in production.'},
+        'investigate': [
+            'Which packages were installed, and from which repository',
+            'Whether the container is a build or CI job where installs are expected',
+            'Other alerts from the same container around the same time',
+        ],
+        'mitigations': {
+            'immediate': ['Confirm the install was part of a deployment or debugging session'],
+            'short_term': ['Install packages at image build time instead of at runtime'],
+            'long_term': ['Run containers with a read-only root filesystem',
+                          'Remove package managers from production images (distroless or slim bases)'],
+        },
+        'false_positive': {
+            'likelihood': 'High',
+            'common_causes': ['Entrypoint scripts installing dependencies on start',
+                              'Operators debugging inside a container', 'CI and build containers'],
+            'distinguishing_factors': ['Interactive shell as the parent process',
+                                       'Packages such as network or scanning tools'],
+        },
+        'summary': 'A package manager ran in a container ({container_image}). This is usually an entrypoint script, a build job or an operator debugging; it is worth a look only if the container should be immutable or the installed packages are offensive tools.',
+    },
+    'Terminal shell in container': {
+        'priority': 'Notice',
+        'expected': [r'\bshell=(ba|da|z|k|c|tc|a)?sh\b'],
+        'suspicious': [r'\bparent=(nginx|httpd|apache2?|php(-fpm)?|java|node|python[0-9.]*|ruby|perl)\b'],
+        'attack_vector': 'Interactive shell opened in a container, typically through kubectl exec or docker exec.',
+        'mitre_attack': {'tactic': 'Execution', 'technique_id': 'T1059.004',
+                         'technique_name': 'Command and Scripting Interpreter: Unix Shell', 'sub_technique': None},
+        'risk': {'severity': 'Medium', 'confidence': 'Medium',
+                 'impact': 'Full command execution in the container with its credentials and network access.'},
+        'investigate': [
+            'Who ran kubectl exec or docker exec (Kubernetes audit log, Docker events)',
+            'Commands run in the session (follow-up alerts from the same container)',
+            'Whether the user normally has exec access to this workload',
+        ],
+        'mitigations': {
+            'immediate': ['Confirm the session with the user who opened it'],
+            'short_term': ['Restrict pods/exec in RBAC to the on-call group'],
+            'long_term': ['Use ephemeral debug containers and audit their use',
+                          'Remove shells from production images'],
+        },
+        'false_positive': {
+            'likelihood': 'Medium',
+            'common_causes': ['Operators debugging a workload', 'Runbooks that exec into pods'],
+            'distinguishing_factors': ['Parent process other than runc/containerd-shim',
+                                       'Follow-up reads of credentials or outbound connections'],
+        },
+        'summary': 'A terminal shell was opened in a container ({container_image}), most often by an operator using kubectl or docker exec. Confirm who opened it; follow-up alerts from the same container decide whether it was malicious.',
+    },
+    'Sudo to root': {
+        'priority': 'Notice',
+        'expected': [r'\bsudo\b'],
+        'suspicious': [r'\bsudo\s+(-[a-z]*\s+)*(su|bash|sh|chmod|chown|useradd|usermod|visudo|tee)\b'],
+        'attack_vector': 'A non-root user elevated to root with sudo.',
+        'mitre_attack': {'tactic': 'Privilege Escalation', 'technique_id': 'T1548.003',
+                         'technique_name': 'Abuse Elevation Control Mechanism: Sudo and Sudo Caching',
+                         'sub_technique': None},
+        'risk': {'severity': 'Low', 'confidence': 'Medium',
+                 'impact': 'Root access for the duration of the command.'},
+        'investigate': [
+            'Whether the user is expected to administer this host',
+            'The command run with sudo and its parent process',
+        ],
+        'mitigations': {
+            'immediate': [],
+            'short_term': ['Limit sudoers entries to the commands each role needs'],
+            'long_term': ['Require MFA or just-in-time elevation for sudo'],
+        },
+        'false_positive': {
+            'likelihood': 'High',
+            'common_causes': ['Administrators and configuration management running commands as root'],
+            'distinguishing_factors': ['Unusual user or time', 'sudo used to spawn a shell or edit auth files'],
+        },
+        'summary': 'A user ran a command as root with sudo. Routine administration is the usual cause; check that the user is expected to administer this host.',
+    },
+    'System information discovery': {
+        'priority': 'Informational',
+        'expected': [r'\b(uname|hostname|cat)\b'],
+        'attack_vector': 'Reading OS version or account information, an early reconnaissance step.',
+        'mitre_attack': {'tactic': 'Discovery', 'technique_id': 'T1082',
+                         'technique_name': 'System Information Discovery', 'sub_technique': None},
+        'risk': {'severity': 'Low', 'confidence': 'Low', 'impact': 'Information gathering only.'},
+        'investigate': ['Parent process (scripts and package managers read these files routinely)',
+                        'Other discovery or execution alerts from the same process tree'],
+        'mitigations': {'immediate': [], 'short_term': [],
+                        'long_term': ['Alert on discovery only together with other suspicious activity']},
+        'false_positive': {
+            'likelihood': 'High',
+            'common_causes': ['Installers, monitoring agents and shell profiles reading /etc/os-release'],
+            'distinguishing_factors': ['Interactive shell or web server as the parent process'],
+        },
+        'summary': 'A process read system information (OS release, kernel version or account list). This is routine for installers and agents and only matters alongside other suspicious activity from the same process tree.',
+    },
+    'Network discovery': {
+        'priority': 'Informational',
+        'expected': [r'\b(ifconfig|ip|netstat|ss|arp|route)\b'],
+        'suspicious': [r'\bnmap\b'],
+        'attack_vector': 'Listing network interfaces, routes or connections, an early reconnaissance step.',
+        'mitre_attack': {'tactic': 'Discovery', 'technique_id': 'T1016',
+                         'technique_name': 'System Network Configuration Discovery', 'sub_technique': None},
+        'risk': {'severity': 'Low', 'confidence': 'Low', 'impact': 'Information gathering only.'},
+        'investigate': ['Parent process and user', 'Scanning or lateral movement alerts that follow'],
+        'mitigations': {'immediate': [], 'short_term': [],
+                        'long_term': ['Remove network tools from production images']},
+        'false_positive': {
+            'likelihood': 'High',
+            'common_causes': ['Health checks, entrypoint scripts and operators troubleshooting'],
+            'distinguishing_factors': ['Web server or unusual parent process', 'nmap or scans of many hosts'],
+        },
+        'summary': 'A network configuration command ran. Health checks and troubleshooting are the usual cause; it only matters alongside scanning or lateral movement from the same host.',
+    },
+    'Container Running as Root': {
+        'priority': 'Notice',
+        'expected': [r'\buser=root\b'],
+        'attack_vector': 'A container process runs as root, which makes container escapes and host compromise easier.',
+        'mitre_attack': {'tactic': 'Privilege Escalation', 'technique_id': 'T1611',
+                         'technique_name': 'Escape to Host', 'sub_technique': None},
+        'risk': {'severity': 'Low', 'confidence': 'High',
+                 'impact': 'No attack by itself; raises the impact of any compromise of the container.'},
+        'investigate': ['Whether the image sets a non-root USER', 'Whether the pod needs root at all'],
+        'mitigations': {
+            'immediate': [],
+            'short_term': ['Set runAsNonRoot and a runAsUser in the pod security context'],
+            'long_term': ['Enforce the restricted Pod Security Standard',
+                          'Build images with a non-root USER'],
+        },
+        'false_positive': {
+            'likelihood': 'High',
+            'common_causes': ['Images that run as root by default'],
+            'distinguishing_factors': ['Root processes that are not the main workload (shells, tools)'],
+        },
+        'summary': 'A container ({container_image}) runs processes as root. This is a hardening finding rather than an attack: fix it in the image or pod security context.',
+    },
+}
+
+
+_loaded: Dict[Tuple[str, ...], tuple] = {}
+
+
+class RuleKnowledge:
+    """Curated analyses per rule, with the patterns that decide when they apply.
+
+    Args:
+        rules: Rule name -> entry (see BUILTIN_RULES)
+        version: Version of the knowledge base, recorded in each answer
+    """
+
+    def __init__(self, rules: Dict[str, dict], version: str):
+        self.version = version
+        self.suspicious = [re.compile(p, re.IGNORECASE) for p in SUSPICIOUS_PATTERNS]
+        self.rules = {}
+        for rule, entry in rules.items():
+            try:
+                self.rules[rule] = self._compile(entry)
+            except (re.error, TypeError, ValueError) as e:
+                logger.warning(f"Ignoring knowledge for rule {rule!r}: {e}")
+
+    @staticmethod
+    def _compile(entry: dict) -> dict:
+        compiled = dict(entry)
+        for key in ('expected', 'suspicious'):
+            patterns = entry.get(key) or []
+            if isinstance(patterns, str):
+                patterns = [patterns]
+            compiled[key] = [re.compile(p, re.IGNORECASE) for p in patterns]
+        priority = str(entry.get('priority', '')).lower()
+        if priority and priority not in PRIORITY_RANK:
+            raise ValueError(f"unknown priority {entry['priority']!r}")
+        compiled['rank'] = PRIORITY_RANK.get(priority)
+        missing = [f for f in ANALYSIS_FIELDS if f not in entry]
+        if missing:
+            raise ValueError(f"missing {', '.join(missing)}")
+        return compiled
+
+    @classmethod
+    def from_config(cls, config: dict) -> Optional['RuleKnowledge']:
+        """Built-in entries plus analysis.knowledge.files; None if disabled."""
+        knowledge = config.get('analysis', {}).get('knowledge') or {}
+        if str(knowledge.get('enabled', True)).strip().lower() in ('0', 'false', 'no', 'off'):
+            return None
+        files = knowledge.get('files') or []
+        if isinstance(files, str):
+            files = [f.strip() for f in files.split(',') if f.strip()]
+        # Reused until a file changes (the API builds an analyzer per request)
+        key = tuple(files)
+        stamp = tuple(os.path.getmtime(f) if os.path.exists(f) else None for f in files)
+        cached = _loaded.get(key)
+        if cached is None or cached[0] != stamp:
+            cached = (stamp, cls.load(files))
+            _loaded[key] = cached
+        return cached[1]
+
+    @classmethod
+    def load(cls, files: List[str]) -> 'RuleKnowledge':
+        """Built-in entries, then each YAML file in order (later files win)."""
+        rules = dict(BUILTIN_RULES)
+        versions = [f"builtin-{BUILTIN_VERSION}"]
+        for path in files:
+            try:
+                with open(path) as f:
+                    data = yaml.safe_load(f) or {}
+                entries = data.get('rules') or {}
+                if not isinstance(entries, dict):
+                    raise ValueError("'rules' must be a mapping of rule name to entry")
+            except (OSError, ValueError, yaml.YAMLError) as e:
+                logger.warning(f"Cannot load rule knowledge from {path}: {e}")
+                continue
+            for rule, entry in entries.items():
+                if entry is None:
+                    rules.pop(rule, None)
+                else:
+                    rules[rule] = entry
+            versions.append(f"{Path(path).stem}-{data.get('version', 1)}")
+        return cls(rules, '+'.join(versions))
+
+    def match(self, alert: dict) -> Optional[dict]:
+        """The entry for the alert's rule, if the alert looks as usual."""
+        labels = alert.get('_labels', {})
+        entry = self.rules.get(labels.get('rule', alert.get('rule', '')))
+        if entry is None:
+            return None
+        rank = PRIORITY_RANK.get(str(labels.get('priority', alert.get('priority', ''))).lower())
+        if entry['rank'] is not None and rank is not None and rank < entry['rank']:
+            # Fired at a higher priority than the rule normally has
+            return None
+        output = str(alert.get('output', ''))
+        if not all(p.search(output) for p in entry['expected']):
+            return None
+        if any(p.search(output) for p in self.suspicious + entry['suspicious']):
+            return None
+        return entry
+
+    def answer(self, alert: dict, obfuscated: dict) -> Optional[dict]:
+        """Analysis in the LLM's schema for a routine alert of a known rule,
+        or None if the LLM is needed."""
+        entry = self.match(alert)
+        if entry is None:
+            return None
+        fields = obfuscated.get('output_fields') or {}
+        context = {
+            'container_image': fields.get('container.image.repository') or 'unknown image',
+            'process': fields.get('proc.name') or 'unknown process',
+            'parent_process': fields.get('proc.pname') or 'unknown parent',
+        }
+        analysis = {field: copy.deepcopy(entry[field]) for field in ANALYSIS_FIELDS}
+        try:
+            analysis['summary'] = str(entry['summary']).format(**context)
+        except (KeyError, IndexError, ValueError):
+            pass
+        labels = alert.get('_labels', {})
+        analysis['knowledge'] = {'rule': labels.get('rule', alert.get('rule', '')), 'version': self.version}
+        return analysis
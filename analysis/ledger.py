@@ -0,0 +1,162 @@
+"""
+SIB Enrichment Ledger - Remember which alerts have been enriched
+
+Every alert pulled from Loki gets a stable fingerprint (stream labels,
+nanosecond timestamp and a hash of the log line). Enriching an alert
+claims its fingerprint first and marks it done once the analysis is
+stored, so overlapping or repeated runs - cron jobs, the enricher
+service, restarts - never analyze or push the same alert twice.
+
+A per-stream high-watermark records that everything older in a stream is
+done, which lets contiguous readers drop their individual fingerprints.
+"""
+
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import logging
+from contextlib import closing
+from pathlib import Path
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+CLAIMED = 'claimed'
+DONE = 'done'
+
+
+def stream_key(labels: Dict[str, str]) -> str:
+    """Canonical form of a stream's label set."""
+    return json.dumps(labels or {}, sort_keys=True, separators=(',', ':'))
+
+
+def alert_fingerprint(labels: Dict[str, str], timestamp_ns: int, log_line: str) -> str:
+    """Stable identity of one log entry, independent of when it was fetched."""
+    line_hash = hashlib.sha256(log_line.encode()).hexdigest()
+    content = f"{stream_key(labels)}\n{int(timestamp_ns)}\n{line_hash}"
+    return hashlib.sha256(content.encode()).hexdigest()[:32]
+
+
+class Ledger:
+    """Processed-alert ledger in SQLite.
+
+    Args:
+        db_path: SQLite file (created with its directory if missing)
+        claim_timeout: Seconds after which another run's unfinished claim
+            is considered abandoned and can be taken over
+    """
+
+    def __init__(self, db_path: Path, claim_timeout: float = 600.0):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.claim_timeout = claim_timeout
+        with closing(self._connect()) as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript("""
+                CREATE TABLE IF NOT EXISTS processed (
+                    fingerprint TEXT PRIMARY KEY,
+                    stream TEXT NOT NULL,
+                    ts_ns INTEGER NOT NULL,
+                    state TEXT NOT NULL,
+                    updated REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_processed_stream ON processed (stream, ts_ns);
+                CREATE INDEX IF NOT EXISTS idx_processed_updated ON processed (updated);
+                CREATE TABLE IF NOT EXISTS watermarks (
+                    stream TEXT PRIMARY KEY,
+                    ts_ns INTEGER NOT NULL
+                );
+            """)
+        try:
+            os.chmod(self.db_path, 0o600)
+        except OSError:
+            pass
+
+    def _connect(self) -> sqlite3.Connection:
+        # Autocommit mode; writers take the lock explicitly with BEGIN IMMEDIATE
+        return sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+
+    @staticmethod
+    def _identity(alert: dict):
+        labels = alert.get('_labels', {})
+        return alert['_fingerprint'], stream_key(labels), int(alert['_timestamp_ns'])
+
+    def _below_watermark(self, db: sqlite3.Connection, stream: str, ts_ns: int) -> bool:
+        row = db.execute("SELECT ts_ns FROM watermarks WHERE stream = ?", (stream,)).fetchone()
+        return row is not None and ts_ns < row[0]
+
+    def is_done(self, alert: dict) -> bool:
+        """True if the alert was already enriched (by this or any other run)."""
+        fingerprint, stream, ts_ns = self._identity(alert)
+        with closing(self._connect()) as db:
+            if self._below_watermark(db, stream, ts_ns):
+                return True
+            row = db.execute("SELECT state FROM processed WHERE fingerprint = ?",
+                             (fingerprint,)).fetchone()
+            return row is not None and row[0] == DONE
+
+    def claim(self, alert: dict) -> bool:
+        """Reserve an alert for enrichment.
+
+        Returns:
+            False if it is done or another run is working on it
+        """
+        fingerprint, stream, ts_ns = self._identity(alert)
+        now = time.time()
+        with closing(self._connect()) as db:
+            db.execute("BEGIN IMMEDIATE")
+            if self._below_watermark(db, stream, ts_ns):
+                db.execute("COMMIT")
+                return False
+            row = db.execute("SELECT state, updated FROM processed WHERE fingerprint = ?",
+                             (fingerprint,)).fetchone()
+            if row is not None and (row[0] == DONE or now - row[1] < self.claim_timeout):
+                db.execute("COMMIT")
+                return False
+            db.execute("INSERT OR REPLACE INTO processed VALUES (?, ?, ?, ?, ?)",
+                       (fingerprint, stream, ts_ns, CLAIMED, now))
+            db.execute("COMMIT")
+            return True
+
+    def mark_done(self, alert: dict):
+        """Record that an alert's enrichment was stored."""
+        fingerprint, stream, ts_ns = self._identity(alert)
+        with closing(self._connect()) as db:
+            db.execute("INSERT OR REPLACE INTO processed VALUES (?, ?, ?, ?, ?)",
+                       (fingerprint, stream, ts_ns, DONE, time.time()))
+
+    def release(self, alert: dict):
+        """Give up a claim so a later run can retry the alert."""
+        fingerprint = alert['_fingerprint']
+        with closing(self._connect()) as db:
+            db.execute("DELETE FROM processed WHERE fingerprint = ? AND state = ?",
+                       (fingerprint, CLAIMED))
+
+    def advance(self, labels: Dict[str, str], ts_ns: int):
+        """Record that every entry of a stream older than ts_ns is done.
+
+        Only callers that read a stream in order (oldest first, without
+        gaps) may advance its watermark.
+        """
+        stream = stream_key(labels)
+        with closing(self._connect()) as db:
+            db.execute("BEGIN IMMEDIATE")
+            db.execute("""INSERT INTO watermarks (stream, ts_ns) VALUES (?, ?)
+                          ON CONFLICT(stream) DO UPDATE SET ts_ns = MAX(ts_ns, excluded.ts_ns)""",
+                       (stream, ts_ns))
+            # Fingerprints below the watermark are implied by it
+            db.execute("DELETE FROM processed WHERE stream = ? AND ts_ns < ? AND state = ?",
+                       (stream, ts_ns, DONE))
+            db.execute("COMMIT")
+
+    def prune(self, max_age_days: int = 30):
+        """Forget fingerprints recorded more than max_age_days ago, and
+        claims abandoned for longer than claim_timeout (crashed runs)."""
+        now = time.time()
+        with closing(self._connect()) as db:
+            removed = db.execute("DELETE FROM processed WHERE updated < ? OR (state = ? AND updated < ?)",
+                                 (now - max_age_days * 86400, CLAIMED, now - self.claim_timeout)).rowcount
+        if removed:
+            logger.info(f"Ledger cleanup: removed {removed} old entries")
@@ -0,0 +1,386 @@
+"""
+SIB MITRE Index - Rule to ATT&CK mapping from the Falco rule files
+
+Falco rules carry their MITRE mapping as tags (mitre_execution, T1059.004;
+Sigma-converted rules use mitre_technique_T1059), and Sigma rules as
+attack.* tags. The index parses every rule file once into a compact
+rule -> tactics/techniques map and keeps it in a JSON cache file together
+with the size, mtime and SHA-256 of each source, so later starts only stat
+the files and load the JSON. Any changed, added or removed rule file
+rebuilds the index.
+
+The index gives every alert of a tagged rule a MITRE mapping without the
+LLM, and is used to normalize the technique IDs and tactics the LLM
+returns.
+"""
+
+import os
+import re
+import glob
+import json
+import time
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import yaml
+
+from prompts import MITRE_MAPPING
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+
+_REPO = Path(__file__).resolve().parent.parent
+
+# Rule files of a Falco install, the compose mounts and this repository
+DEFAULT_PATHS = [
+    '/etc/falco/falco_rules.yaml',
+    '/etc/falco/falco_rules.local.yaml',
+    '/etc/falco/rules.d/*.yaml',
+    '/app/rules/**/*.yaml',
+    '/app/rules/**/*.yml',
+    str(_REPO / 'detection/config/rules/*.yaml'),
+    str(_REPO / 'examples/rules/*.yaml'),
+    str(_REPO / 'sigma/rules/*.yml'),
+]
+
+# ATT&CK Enterprise tactics: tag slug -> (name, id)
+TACTICS = {
+    'reconnaissance': ('Reconnaissance', 'TA0043'),
+    'resource_development': ('Resource Development', 'TA0042'),
+    'initial_access': ('Initial Access', 'TA0001'),
+    'execution': ('Execution', 'TA0002'),
+    'persistence': ('Persistence', 'TA0003'),
+    'privilege_escalation': ('Privilege Escalation', 'TA0004'),
+    'defense_evasion': ('Defense Evasion', 'TA0005'),
+    'credential_access': ('Credential Access', 'TA0006'),
+    'discovery': ('Discovery', 'TA0007'),
+    'lateral_movement': ('Lateral Movement', 'TA0008'),
+    'collection': ('Collection', 'TA0009'),
+    'command_and_control': ('Command and Control', 'TA0011'),
+    'exfiltration': ('Exfiltration', 'TA0010'),
+    'impact': ('Impact', 'TA0040'),
+}
+_TACTIC_IDS = {tactic_id: slug for slug, (_, tactic_id) in TACTICS.items()}
+
+# Names of the techniques the bundled rules are tagged with
+TECHNIQUE_NAMES = {
+    'T1003': 'OS Credential Dumping',
+    'T1005': 'Data from Local System',
+    'T1014': 'Rootkit',
+    'T1016': 'System Network Configuration Discovery',
+    'T1021': 'Remote Services',
+    'T1021.004': 'Remote Services: SSH',
+    'T1027': 'Obfuscated Files or Information',
+    'T1036': 'Masquerading',
+    'T1046': 'Network Service Discovery',
+    'T1048': 'Exfiltration Over Alternative Protocol',
+    'T1048.003': 'Exfiltration Over Alternative Protocol: Exfiltration Over Unencrypted Non-C2 Protocol',
+    'T1053.003': 'Scheduled Task/Job: Cron',
+    'T1055.008': 'Process Injection: Ptrace System Calls',
+    'T1057': 'Process Discovery',
+    'T1059': 'Command and Scripting Interpreter',
+    'T1059.004': 'Command and Scripting Interpreter: Unix Shell',
+    'T1059.006': 'Command and Scripting Interpreter: Python',
+    'T1070': 'Indicator Removal',
+    'T1070.002': 'Indicator Removal: Clear Linux or Mac System Logs',
+    'T1070.003': 'Indicator Removal: Clear Command History',
+    'T1070.006': 'Indicator Removal: Timestomp',
+    'T1071.004': 'Application Layer Protocol: DNS',
+    'T1074.001': 'Data Staged: Local Data Staging',
+    'T1078': 'Valid Accounts',
+    'T1082': 'System Information Discovery',
+    'T1087': 'Account Discovery',
+    'T1090': 'Proxy',
+    'T1090.003': 'Proxy: Multi-hop Proxy',
+    'T1098': 'Account Manipulation',
+    'T1098.004': 'Account Manipulation: SSH Authorized Keys',
+    'T1113': 'Screen Capture',
+    'T1190': 'Exploit Public-Facing Application',
+    'T1485': 'Data Destruction',
+    'T1489': 'Service Stop',
+    'T1496': 'Resource Hijacking',
+    'T1505': 'Server Software Component',
+    'T1505.003': 'Server Software Component: Web Shell',
+    'T1528': 'Steal Application Access Token',
+    'T1537': 'Transfer Data to Cloud Account',
+    'T1543.002': 'Create or Modify System Process: Systemd Service',
+    'T1548': 'Abuse Elevation Control Mechanism',
+    'T1548.001': 'Abuse Elevation Control Mechanism: Setuid and Setgid',
+    'T1548.003': 'Abuse Elevation Control Mechanism: Sudo and Sudo Caching',
+    'T1552': 'Unsecured Credentials',
+    'T1552.004': 'Unsecured Credentials: Private Keys',
+    'T1552.005': 'Unsecured Credentials: Cloud Instance Metadata API',
+    'T1560': 'Archive Collected Data',
+    'T1561': 'Disk Wipe',
+    'T1562': 'Impair Defenses',
+    'T1562.001': 'Impair Defenses: Disable or Modify Tools',
+    'T1572': 'Protocol Tunneling',
+    'T1610': 'Deploy Container',
+    'T1611': 'Escape to Host',
+    'T1620': 'Reflective Code Loading',
+}
+TECHNIQUE_NAMES.update({m['technique']: m['name'] for m in MITRE_MAPPING.values()})
+
+_STRICT_TECHNIQUE = re.compile(r'^T\d{4}(\.\d{3})?$')
+
+
+def normalize_technique(value) -> Optional[str]:
+    """Canonical technique ID ('T1059.004') from forms such as 't1059.4',
+    'T1059/004', 'attack.t1059.004' or 'T1059.004 - Unix Shell'; None if
+    there is none."""
+    text = str(value or '').strip()
+    if not text:
+        return None
+    match = re.search(r'(?<![A-Za-z0-9])[Tt](\d{4})(?:[./](\d{1,3}))?(?!\d)', text)
+    if match is None:
+        return None
+    technique = f"T{match.group(1)}"
+    if match.group(2):
+        technique += f".{int(match.group(2)):03d}"
+    return technique
+
+
+def normalize_tactic(value) -> Optional[str]:
+    """Tactic slug ('command_and_control') from a name, tag or TA id."""
+    text = str(value or '').strip()
+    if text.upper() in _TACTIC_IDS:
+        return _TACTIC_IDS[text.upper()]
+    slug = re.sub(r'[^a-z]+', '_', text.lower().replace('&', 'and')).strip('_')
+    for prefix in ('mitre_', 'attack_'):
+        if slug.startswith(prefix):
+            slug = slug[len(prefix):]
+    slug = slug.replace('command_control', 'command_and_control')
+    return slug if slug in TACTICS else None
+
+
+def _tags_mapping(tags) -> Dict[str, List[str]]:
+    """Tactics and techniques named by Falco or Sigma tags."""
+    tactics, techniques = [], []
+    for tag in tags or []:
+        tag = str(tag).strip()
+        lowered = tag.lower()
+        if lowered.startswith('mitre_technique_') or lowered.startswith('attack.t') or _STRICT_TECHNIQUE.match(tag.upper()):
+            technique = normalize_technique(tag.split('_')[-1] if lowered.startswith('mitre_technique_') else tag)
+            if technique and technique not in techniques:
+                techniques.append(technique)
+        elif lowered.startswith('mitre_') or lowered.startswith('attack.'):
+            tactic = normalize_tactic(lowered.split('.', 1)[-1] if lowered.startswith('attack.') else lowered)
+            if tactic and tactic not in tactics:
+                tactics.append(tactic)
+    return {'tactics': tactics, 'techniques': techniques}
+
+
+def parse_rule_file(path: str) -> Dict[str, Dict[str, List[str]]]:
+    """Rule name -> tactics and techniques of one Falco or Sigma rule file."""
+    with open(path) as f:
+        documents = [d for d in yaml.safe_load_all(f) if d]
+    rules = {}
+    for document in documents:
+        if isinstance(document, dict) and 'title' in document:
+            # Sigma rule (converted rules are named after the title)
+            entries = [{'rule': document['title'], 'tags': document.get('tags')}]
+        elif isinstance(document, list):
+            entries = [e for e in document if isinstance(e, dict) and 'rule' in e]
+        else:
+            continue
+        for entry in entries:
+            mapping = _tags_mapping(entry.get('tags'))
+            if not mapping['tactics'] and not mapping['techniques']:
+                continue
+            # Later definitions (appends, overrides) add to earlier ones
+            merged = rules.setdefault(str(entry['rule']), {'tactics': [], 'techniques': []})
+            for key in ('tactics', 'techniques'):
+                merged[key] += [v for v in mapping[key] if v not in merged[key]]
+    return rules
+
+
+def _sha256(path: str) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+class MitreIndex:
+    """Rule -> ATT&CK mapping built from rule files, cached on disk.
+
+    Args:
+        paths: Rule file globs
+        cache_path: JSON cache of the built index (None to keep it in memory)
+    """
+
+    def __init__(self, paths: List[str], cache_path: Optional[Path] = None):
+        self.paths = list(paths)
+        self.cache_path = Path(cache_path) if cache_path else None
+        self.rules: Dict[str, Dict[str, List[str]]] = {}
+        self.sources: Dict[str, dict] = {}
+
+    @classmethod
+    def from_config(cls, config: dict) -> 'MitreIndex':
+        """Build from analysis.mitre_index (paths, cache); loaded once per process."""
+        settings = config.get('analysis', {}).get('mitre_index') or {}
+        paths = settings.get('paths') or DEFAULT_PATHS
+        if isinstance(paths, str):
+            paths = [p.strip() for p in paths.split(',') if p.strip()]
+        cache_dir = os.environ.get('ANALYSIS_CACHE_DIR') or os.path.expanduser('~/.cache/sib')
+        cache_path = settings.get('cache') or os.path.join(cache_dir, 'mitre_index.cache')
+        return get_index(tuple(paths), cache_path)
+
+    def _files(self) -> List[str]:
+        files = []
+        for pattern in self.paths:
+            for path in sorted(glob.glob(os.path.expanduser(pattern), recursive=True)):
+                if os.path.isfile(path) and path not in files:
+                    files.append(path)
+        return files
+
+    def load(self) -> 'MitreIndex':
+        """Use the cache file if no rule file changed; rebuild otherwise."""
+        started = time.perf_counter()
+        files = self._files()
+        cached = self._read_cache()
+        if cached is not None and self._unchanged(cached['sources'], files):
+            self.rules, self.sources = cached['rules'], cached['sources']
+            logger.debug(f"MITRE index: {len(self.rules)} rules from cache "
+                         f"in {(time.perf_counter() - started) * 1e3:.1f}ms")
+            return self
+        self.build(files)
+        logger.info(f"MITRE index: {len(self.rules)} rules from {len(files)} rule files "
+                    f"in {(time.perf_counter() - started) * 1e3:.0f}ms")
+        return self
+
+    def build(self, files: List[str]):
+        rules, sources = {}, {}
+        for path in files:
+            try:
+                stat = os.stat(path)
+                parsed = parse_rule_file(path)
+                sources[path] = {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'sha256': _sha256(path)}
+            except (OSError, yaml.YAMLError) as e:
+                logger.warning(f"MITRE index: skipping {path}: {e}")
+                continue
+            for rule, mapping in parsed.items():
+                merged = rules.setdefault(rule, {'tactics': [], 'techniques': []})
+                for key in ('tactics', 'techniques'):
+                    merged[key] += [v for v in mapping[key] if v not in merged[key]]
+        self.rules, self.sources = rules, sources
+        self._write_cache()
+
+    def _unchanged(self, sources: Dict[str, dict], files: List[str]) -> bool:
+        if sorted(sources) != sorted(files):
+            return False
+        for path in files:
+            try:
+                stat = os.stat(path)
+                known = sources[path]
+                if stat.st_size == known['size'] and stat.st_mtime_ns == known['mtime']:
+                    continue
+                # Touched but maybe not changed (checkouts, copies)
+                if stat.st_size != known['size'] or _sha256(path) != known['sha256']:
+                    return False
+                known['mtime'] = stat.st_mtime_ns
+            except (OSError, KeyError):
+                return False
+        return True
+
+    def _read_cache(self) -> Optional[dict]:
+        if self.cache_path is None:
+            return None
+        try:
+            with open(self.cache_path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get('version') != INDEX_VERSION or data.get('paths') != self.paths:
+            return None
+        return data
+
+    def _write_cache(self):
+        if self.cache_path is None:
+            return
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.cache_path.with_name(self.cache_path.name + '.tmp')
+            with open(tmp, 'w') as f:
+                json.dump({'version': INDEX_VERSION, 'paths': self.paths, 'sources': self.sources,
+                           'rules': self.rules}, f, separators=(',', ':'))
+            os.replace(tmp, self.cache_path)
+        except OSError as e:
+            logger.warning(f"MITRE index: cannot write {self.cache_path}: {e}")
+
+    def lookup(self, rule: str) -> Optional[dict]:
+        """Mapping of a rule in the LLM's mitre_attack schema, or None.
+
+        The primary technique is the most specific one (sub-technique
+        first); all tagged tactics and techniques are listed as well.
+        """
+        entry = self.rules.get(rule)
+        if entry is None:
+            fallback = MITRE_MAPPING.get(rule)
+            if fallback is None:
+                return None
+            tactic = normalize_tactic(fallback['tactic'])
+            entry = {'tactics': [tactic] if tactic else [], 'techniques': [fallback['technique']]}
+        techniques = sorted(entry['techniques'], key=lambda t: -len(t))
+        tactic = entry['tactics'][0] if entry['tactics'] else None
+        technique = techniques[0] if techniques else None
+        return {
+            'tactic': TACTICS[tactic][0] if tactic else 'unknown',
+            'technique_id': technique or 'unknown',
+            'technique_name': TECHNIQUE_NAMES.get(technique, ''),
+            'tactics': [TACTICS[t][0] for t in entry['tactics']],
+            'techniques': entry['techniques'],
+            'source': 'rule_tags',
+        }
+
+    def fallback(self, rule: str) -> Optional[dict]:
+        """Mapping in the MITRE_MAPPING shape (tactic, technique, name)."""
+        mapping = self.lookup(rule)
+        if mapping is None or (mapping['technique_id'] == 'unknown' and mapping['tactic'] == 'unknown'):
+            return None
+        return {'tactic': mapping['tactic'], 'technique': mapping['technique_id'], 'name': mapping['technique_name']}
+
+    def normalize(self, mitre: dict, rule: str) -> dict:
+        """Validate the LLM's mitre_attack: canonical technique ID and
+        tactic name, with the rule's tagged mapping filling in what is
+        missing or malformed and kept alongside as 'rule_mapping'."""
+        mitre = dict(mitre) if isinstance(mitre, dict) else {}
+        mapping = self.lookup(rule)
+        technique = normalize_technique(mitre.get('technique_id'))
+        tactic = normalize_tactic(mitre.get('tactic'))
+        if technique is None and mapping is not None and mapping['technique_id'] != 'unknown':
+            technique = mapping['technique_id']
+            mitre['technique_name'] = mitre.get('technique_name') or mapping['technique_name']
+        if tactic is None and mapping is not None and mapping['tactic'] != 'unknown':
+            tactic = normalize_tactic(mapping['tactic'])
+        mitre['technique_id'] = technique or 'unknown'
+        if not mitre.get('technique_name') and technique in TECHNIQUE_NAMES:
+            mitre['technique_name'] = TECHNIQUE_NAMES[technique]
+        mitre['tactic'] = TACTICS[tactic][0] if tactic else mitre.get('tactic') or 'unknown'
+        sub = normalize_technique(mitre.get('sub_technique'))
+        if mitre.get('sub_technique') and sub and '.' in sub:
+            mitre['sub_technique'] = sub
+        if mapping is not None:
+            mitre['rule_mapping'] = {'tactics': mapping['tactics'], 'techniques': mapping['techniques']}
+        return mitre
+
+
+_indexes: Dict[tuple, tuple] = {}
+_lock = threading.Lock()
+
+# Seconds between checks of the rule files in a running process
+RECHECK_INTERVAL = 60.0
+
+
+def get_index(paths: tuple, cache_path: str) -> MitreIndex:
+    """Shared index for these paths, re-validated at most every RECHECK_INTERVAL."""
+    key = (paths, cache_path)
+    with _lock:
+        cached = _indexes.get(key)
+        if cached is None or time.monotonic() - cached[0] > RECHECK_INTERVAL:
+            index = MitreIndex(list(paths), Path(cache_path)).load()
+            cached = (time.monotonic(), index)
+            _indexes[key] = cached
+        return cached[1]
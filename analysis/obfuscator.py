@@ -484,6 +484,14 @@ class Obfuscator:
         text = re.sub(r'\b[a-zA-Z0-9][-a-zA-Z0-9]*(?:\.[a-zA-Z0-9][-a-zA-Z0-9]*)+\b', replace_hostname, text)
         return text
     
+    def obfuscate_hostname(self, hostname: str) -> str:
+        """Token for a bare hostname, at every level.
+        
+        A name like prod-db-01 matches none of the text patterns, so a
+        hostname passed on its own is always replaced.
+        """
+        return self._get_token('host', hostname, self.map.hostnames)
+    
     def obfuscate(self, text: str) -> str:
         """
         Obfuscate sensitive data in text based on configured level.
@@ -533,7 +541,26 @@ def obfuscate_alert(alert: dict, level: str = "standard") -> tuple[dict, dict]:
         Tuple of (obfuscated_alert, obfuscation_mapping)
     """
     obfuscator = Obfuscator(ObfuscationLevel(level))
+    return _obfuscate_with(obfuscator, alert), obfuscator.get_mapping()
+
+
+def obfuscate_incident(alerts: list, hostname: str, level: str = "standard") -> tuple[list, str, dict]:
+    """
+    Obfuscate related alerts with one shared mapping, so the same host,
+    user or process gets the same token in every alert, and replace the
+    incident's hostname with a token.
     
+    Returns:
+        Tuple of (obfuscated_alerts, hostname_token, obfuscation_mapping)
+    """
+    obfuscator = Obfuscator(ObfuscationLevel(level))
+    # First, so the host gets the same token where its FQDN appears in an alert
+    host_token = obfuscator.obfuscate_hostname(hostname)
+    obfuscated = [_obfuscate_with(obfuscator, alert) for alert in alerts]
+    return obfuscated, host_token, obfuscator.get_mapping()
+
+
+def _obfuscate_with(obfuscator: Obfuscator, alert: dict) -> dict:
     obfuscated = alert.copy()
     
     # Obfuscate the main output field
@@ -548,7 +575,7 @@ def obfuscate_alert(alert: dict, level: str = "standard") -> tuple[dict, dict]:
                 fields[key] = obfuscator.obfuscate(value)
         obfuscated['output_fields'] = fields
     
-    return obfuscated, obfuscator.get_mapping()
+    return obfuscated
 
 
 # Example usage and testing
@@ -102,6 +102,23 @@ USER_PROMPT_TEMPLATE = """Analyze this security alert:
 Provide your security analysis in JSON format."""
 
 
+INCIDENT_PROMPT_TEMPLATE = """Analyze this incident: {alert_count} related security alerts from the same host, correlated by container and process lineage.
+
+**Host**: {hostname}
+**Containers**: {containers}
+**Time span**: {start} to {end} ({duration})
+**Rules**: {rules}
+
+**Timeline** (offset from the first alert, priority, rule, details):
+```
+{timeline}
+```
+
+Analyze the alerts together as one possible attack chain: the attack_vector and summary should describe the sequence of steps, and the MITRE mapping should name the most advanced stage reached.
+
+Provide your security analysis in JSON format."""
+
+
 # Mapping of common Falco rules to MITRE ATT&CK for quick reference
 MITRE_MAPPING = {
     "Read sensitive file untrusted": {
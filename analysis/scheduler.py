@@ -0,0 +1,174 @@
+"""
+SIB Analysis Scheduler - Analyze the alerts that matter first
+
+Worker threads take alerts from an AnalysisScheduler instead of a FIFO
+queue. The next alert is the one with the most urgent effective rank:
+its Falco priority, raised for rules tied to high-impact MITRE tactics,
+and raised further the longer it waits so low-priority work still gets
+its turn. Alerts past their priority's deadline go first, earliest
+deadline first. When the queue is full, producers of routine alerts
+wait, but urgent alerts are always admitted and jump ahead of the
+queued work.
+"""
+
+import time
+import threading
+from typing import Dict, Optional
+
+from prompts import MITRE_MAPPING
+
+# Falco priorities, most urgent first
+PRIORITY_RANK = {
+    'emergency': 0, 'alert': 1, 'critical': 2, 'error': 3,
+    'warning': 4, 'notice': 5, 'informational': 6, 'info': 6, 'debug': 7,
+}
+UNKNOWN_RANK = 5
+
+# Seconds from queueing to analysis each priority should not exceed
+DEFAULT_DEADLINES = {
+    'emergency': 30, 'alert': 30, 'critical': 60, 'error': 300,
+    'warning': 900, 'notice': 3600, 'informational': 3600, 'info': 3600, 'debug': 3600,
+}
+
+# Rules in these tactics are ranked one step more urgent
+SEVERE_TACTICS = {
+    'privilege_escalation', 'credential_access', 'command_and_control',
+    'exfiltration', 'impact', 'defense_evasion',
+}
+
+
+def alert_priority(alert: dict) -> str:
+    labels = alert.get('_labels', {})
+    return str(labels.get('priority', alert.get('priority', ''))).lower()
+
+
+def rule_boost(alert: dict) -> float:
+    """1 for rules tied to a severe MITRE tactic (by Falco tags or the
+    built-in rule mapping), else 0."""
+    labels = alert.get('_labels', {})
+    tactics = set()
+    tags = alert.get('tags') or []
+    if isinstance(tags, list):
+        tactics.update(str(t)[len('mitre_'):] for t in tags if str(t).startswith('mitre_'))
+    mapping = MITRE_MAPPING.get(labels.get('rule', alert.get('rule', '')))
+    if mapping:
+        tactics.add(mapping['tactic'].lower().replace(' ', '_'))
+    return 1.0 if tactics & SEVERE_TACTICS else 0.0
+
+
+class _Entry:
+    __slots__ = ('item', 'priority', 'rank', 'queued', 'deadline', 'seq')
+
+    def __init__(self, item, priority: str, rank: float, queued: float, deadline: float, seq: int):
+        self.item = item
+        self.priority = priority
+        self.rank = rank
+        self.queued = queued
+        self.deadline = deadline
+        self.seq = seq
+
+
+class AnalysisScheduler:
+    """Thread-safe priority queue with deadlines and aging.
+
+    Args:
+        max_queued: Queued alerts at which put() blocks for routine alerts
+        aging: Seconds of waiting that make an alert one rank more urgent
+        deadlines: Priority -> seconds (overrides DEFAULT_DEADLINES)
+        urgent_rank: Alerts at or above this rank (critical by default)
+            are admitted even when the queue is full
+    """
+
+    def __init__(self, max_queued: int = 200, aging: float = 300.0,
+                 deadlines: Optional[Dict[str, float]] = None, urgent_rank: int = 2):
+        self.max_queued = max_queued
+        self.aging = aging
+        self.deadlines = dict(DEFAULT_DEADLINES, **(deadlines or {}))
+        self.urgent_rank = urgent_rank
+        self._entries = []
+        self._seq = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._stats: Dict[str, dict] = {}
+
+    @classmethod
+    def from_config(cls, config: dict, max_queued: int = 200) -> 'AnalysisScheduler':
+        """Build from analysis.scheduler (aging seconds, per-priority deadlines)."""
+        scheduler = config.get('analysis', {}).get('scheduler') or {}
+        deadlines = {str(k).lower(): float(v) for k, v in (scheduler.get('deadlines') or {}).items()}
+        return cls(max_queued=max_queued, aging=float(scheduler.get('aging', 300)), deadlines=deadlines)
+
+    def __len__(self) -> int:
+        with self._cond:
+            return len(self._entries)
+
+    def put(self, item, alert: Optional[dict] = None, since: Optional[float] = None,
+            demote: float = 0.0):
+        """Queue an item (ranked by its alert, or the item itself).
+
+        Blocks while the queue is full, unless the alert is urgent.
+
+        Args:
+            since: Epoch seconds the wait (and deadline) is counted from,
+                such as the alert's own timestamp; default now
+            demote: Ranks the item this many steps less urgent (such as
+                alerts pre-triaged as routine); its deadline is unchanged
+        """
+        alert = item if alert is None else alert
+        priority = alert_priority(alert)
+        base = PRIORITY_RANK.get(priority, UNKNOWN_RANK)
+        with self._cond:
+            while (base > self.urgent_rank and len(self._entries) >= self.max_queued
+                   and not self._closed):
+                self._cond.wait()
+            queued = time.time() if since is None else since
+            self._seq += 1
+            self._entries.append(_Entry(
+                item, priority or 'unknown', base - rule_boost(alert) + demote, queued,
+                queued + self.deadlines.get(priority, max(self.deadlines.values())), self._seq))
+            self._cond.notify_all()
+
+    def _key(self, entry: _Entry, now: float) -> tuple:
+        if now >= entry.deadline:
+            # Overdue: earliest deadline first, ahead of everything else
+            return (0, entry.deadline, entry.seq)
+        return (1, entry.rank - (now - entry.queued) / self.aging, entry.seq)
+
+    def get(self, timeout: Optional[float] = None):
+        """Return the most urgent item; None once closed and drained (or on timeout)."""
+        until = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while not self._entries:
+                if self._closed:
+                    return None
+                remaining = None if until is None else until - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+            now = time.time()
+            # Ranks change as entries age, so pick by scanning (queues are short)
+            entry = min(self._entries, key=lambda e: self._key(e, now))
+            self._entries.remove(entry)
+            stats = self._stats.setdefault(entry.priority, {'count': 0, 'wait': 0.0, 'max_wait': 0.0, 'missed': 0})
+            waited = now - entry.queued
+            stats['count'] += 1
+            stats['wait'] += waited
+            stats['max_wait'] = max(stats['max_wait'], waited)
+            if now > entry.deadline:
+                stats['missed'] += 1
+            self._cond.notify_all()
+            return entry.item
+
+    def close(self):
+        """Let get() return None once the queue is empty and unblock put()."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, dict]:
+        """Per priority: alerts started, average and maximum queue wait
+        (seconds) and deadline misses."""
+        with self._cond:
+            return {p: {'count': s['count'], 'avg_wait': round(s['wait'] / s['count'], 3),
+                        'max_wait': round(s['max_wait'], 3), 'missed': s['missed']}
+                    for p, s in self._stats.items() if s['count']}
@@ -0,0 +1,261 @@
+"""
+SIB Similarity Cache - Reuse the analysis of a near-duplicate alert
+
+The analysis cache only hits when an alert's normalized output matches an
+analyzed one exactly. Variants of one event - another binary in the same
+directory, reordered arguments, another image - miss it and cost an LLM
+call each. SimilarityIndex embeds the obfuscated output of every alert the
+LLM analyzed; a new alert of the same rule whose closest analyzed alert
+scores above the cosine similarity threshold reuses that analysis, marked
+with 'similar'.
+
+Embeddings come from hashed word counts ('hashing', the default, no
+network) or an Ollama embedding model ('ollama'). Vectors are kept in
+SQLite in the cache directory, shared by the API workers and the enricher,
+and searched in memory with NumPy.
+
+A few words can change what an alert means (file=/etc/hosts vs
+file=/etc/shadow) while barely moving the score, so an analysis is never
+reused when the key fields (KEY_FIELDS: the file, command line or
+executable) differ. Reuse is off unless analysis.similarity.enabled is set.
+"""
+
+import re
+import zlib
+import sqlite3
+import logging
+import threading
+from contextlib import closing
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import requests
+
+try:
+    import numpy as np
+except ImportError:  # optional - similarity reuse is disabled without it
+    np = None
+
+from triage import tokenize
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_THRESHOLD = 0.98
+DEFAULT_OLLAMA_MODEL = 'nomic-embed-text'
+
+# Falco output fields whose values must match exactly for reuse
+KEY_FIELDS = ('file', 'fd.name', 'cmdline', 'proc.cmdline', 'command',
+              'exepath', 'proc.exepath', 'proc_exepath')
+# A Falco output field (proc.cmdline=..., proc.aname[2]=...) starts a new value
+_FIELD = re.compile(r'^[A-Za-z_][\w.]*(\[\d+\])?=')
+
+
+def key_fields(text: str) -> Dict[str, str]:
+    """Values of the KEY_FIELDS in an alert output, by field name."""
+    fields, name = {}, None
+    for word in text.split():
+        if _FIELD.match(word.lstrip('(')):
+            word = word.lstrip('(')
+            name, _, value = word.partition('=')
+            if name not in KEY_FIELDS:
+                name = None
+                continue
+            fields[name] = value
+        elif name:
+            fields[name] += ' ' + word
+    return {k: v.rstrip(')') for k, v in fields.items()}
+
+
+class HashingEmbedder:
+    """Signed hashed word counts, L2-normalized; needs no model or network.
+
+    Obfuscation tokens ([USER-3]) and numbers are folded (see
+    triage.tokenize), so only the words that differ lower the similarity.
+
+    Args:
+        dims: Vector size
+    """
+
+    def __init__(self, dims: int = 1024):
+        self.dims = dims
+        self.name = f"hashing-{dims}"
+
+    def embed(self, text: str):
+        vector = np.zeros(self.dims, dtype=np.float32)
+        for word in tokenize(text):
+            h = zlib.crc32(word.encode())
+            vector[h % self.dims] += 1.0 if h & 0x80000000 else -1.0
+        return vector
+
+
+class OllamaEmbedder:
+    """Embeddings from a local Ollama model (POST /api/embed).
+
+    Args:
+        url: Ollama base URL
+        model: Embedding model, e.g. nomic-embed-text
+        timeout: Seconds to wait for one embedding
+    """
+
+    def __init__(self, url: str = "http://localhost:11434", model: str = DEFAULT_OLLAMA_MODEL,
+                 timeout: float = 10.0):
+        if not url.startswith(('http://', 'https://')):
+            raise ValueError(f"Invalid Ollama URL: {url} (only http/https allowed)")
+        self.url = url.rstrip('/')
+        self.model = model
+        self.timeout = timeout
+        self.name = f"ollama-{model}"
+
+    def embed(self, text: str):
+        response = requests.post(f"{self.url}/api/embed",
+                                 json={'model': self.model, 'input': text}, timeout=self.timeout)
+        response.raise_for_status()
+        return np.asarray(response.json()['embeddings'][0], dtype=np.float32)
+
+
+class SimilarityIndex:
+    """Cosine top-k search over the embedded outputs of analyzed alerts.
+
+    Only alerts of the same rule are compared. Each process keeps the
+    vectors in memory, per rule, and picks up rows other processes added
+    before every search.
+
+    Args:
+        db_path: SQLite file in the (shared) cache directory
+        embedder: HashingEmbedder or OllamaEmbedder
+        threshold: Minimum cosine similarity for reuse
+        top_k: Candidates returned by search()
+    """
+
+    def __init__(self, db_path: Path, embedder, threshold: float = DEFAULT_THRESHOLD,
+                 top_k: int = 5):
+        if np is None:
+            raise RuntimeError("Similarity reuse needs NumPy (pip install numpy)")
+        self.db_path = Path(db_path)
+        self.embedder = embedder
+        self.threshold = threshold
+        self.top_k = top_k
+        self._lock = threading.Lock()
+        self._last_id = 0
+        # rule -> (cache keys, matrix of unit vectors, one row per key)
+        self._vectors: Dict[str, Tuple[List[str], object]] = {}
+        with closing(self._connect()) as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS vectors (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    cache_key TEXT NOT NULL,
+                    rule TEXT NOT NULL,
+                    embedder TEXT NOT NULL,
+                    vector BLOB NOT NULL,
+                    UNIQUE (cache_key, embedder)
+                )
+            """)
+        try:
+            self.db_path.chmod(0o600)
+        except OSError:
+            pass
+
+    @classmethod
+    def from_config(cls, config: dict, cache_dir: Path) -> Optional['SimilarityIndex']:
+        """Index configured by analysis.similarity, or None when disabled."""
+        analysis_config = config.get('analysis', {})
+        settings = analysis_config.get('similarity') or {}
+        if str(settings.get('enabled', False)).strip().lower() not in ('true', '1', 'yes', 'on'):
+            return None
+        if np is None:
+            logger.info("Similarity reuse disabled: NumPy is not installed")
+            return None
+        name = str(settings.get('embedder', 'hashing')).strip().lower()
+        if name == 'ollama':
+            embedder = OllamaEmbedder(
+                url=settings.get('url') or analysis_config.get('ollama', {}).get('url', 'http://localhost:11434'),
+                model=settings.get('model', DEFAULT_OLLAMA_MODEL),
+            )
+        elif name == 'hashing':
+            embedder = HashingEmbedder(int(settings.get('dims', 1024)))
+        else:
+            raise ValueError(f"Unknown analysis.similarity.embedder: {name}")
+        return cls(Path(cache_dir) / 'similarity.db', embedder,
+                   threshold=float(settings.get('threshold', DEFAULT_THRESHOLD)),
+                   top_k=int(settings.get('top_k', 5)))
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=10)
+
+    def _embed(self, text: str):
+        """Unit vector of the text, or None when it can't be embedded."""
+        try:
+            vector = self.embedder.embed(text)
+        except Exception as e:
+            logger.warning(f"Embedding failed ({self.embedder.name}): {e}")
+            return None
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm else None
+
+    def _refresh(self):
+        """Load the rows added since the last refresh (by any process)."""
+        with closing(self._connect()) as db:
+            rows = db.execute("SELECT id, cache_key, rule, vector FROM vectors WHERE id > ? AND embedder = ?"
+                              " ORDER BY id", (self._last_id, self.embedder.name)).fetchall()
+        added: Dict[str, Tuple[List[str], list]] = {}
+        for row_id, cache_key, rule, blob in rows:
+            keys, vectors = added.setdefault(rule, ([], []))
+            keys.append(cache_key)
+            vectors.append(np.frombuffer(blob, dtype=np.float32))
+            self._last_id = row_id
+        for rule, (keys, vectors) in added.items():
+            matrix = np.vstack(vectors)
+            if rule in self._vectors:
+                old_keys, old_matrix = self._vectors[rule]
+                keys, matrix = old_keys + keys, np.vstack([old_matrix, matrix])
+            self._vectors[rule] = (keys, matrix)
+
+    def add(self, cache_key: str, rule: str, text: str) -> bool:
+        """Index the obfuscated output of an analyzed alert."""
+        vector = self._embed(text)
+        if vector is None:
+            return False
+        with closing(self._connect()) as db, db:
+            db.execute("INSERT OR IGNORE INTO vectors (cache_key, rule, embedder, vector) VALUES (?, ?, ?, ?)",
+                       (cache_key, rule, self.embedder.name, vector.astype(np.float32).tobytes()))
+        return True
+
+    def search(self, rule: str, text: str) -> List[Tuple[str, float]]:
+        """Cache keys of analyzed alerts of the rule at or above the
+        threshold, most similar first, with their cosine similarity."""
+        vector = self._embed(text)
+        if vector is None:
+            return []
+        with self._lock:
+            self._refresh()
+            keys, matrix = self._vectors.get(rule, ([], None))
+        if matrix is None or matrix.shape[1] != vector.shape[0]:
+            return []
+        scores = matrix @ vector
+        k = min(self.top_k, len(keys))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(keys[i], float(scores[i])) for i in top if scores[i] >= self.threshold]
+
+    def remove(self, cache_keys: Iterable[str]):
+        """Drop vectors of removed cache entries.
+
+        Other processes keep them in memory until restarted; their
+        searches skip keys whose cache entry is gone.
+        """
+        keys = [(k,) for k in cache_keys]
+        if not keys:
+            return
+        with closing(self._connect()) as db, db:
+            db.executemany("DELETE FROM vectors WHERE cache_key = ?", keys)
+        removed = {k for (k,) in keys}
+        with self._lock:
+            for rule, (rule_keys, matrix) in list(self._vectors.items()):
+                keep = [i for i, k in enumerate(rule_keys) if k not in removed]
+                if len(keep) == len(rule_keys):
+                    continue
+                if keep:
+                    self._vectors[rule] = ([rule_keys[i] for i in keep], matrix[keep])
+                else:
+                    del self._vectors[rule]
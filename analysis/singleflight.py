@@ -0,0 +1,194 @@
+"""
+SIB Single-Flight - Coalesce identical concurrent analysis requests
+
+When several analysts open the same alert at once, only the first request
+(the leader) calls the LLM. Everyone else waits for the leader's result:
+inside one worker through a shared in-memory call record, and across
+gunicorn workers through an exclusive lock file in the shared cache
+directory. Waiters give up after a timeout and fall back to doing the
+work themselves, so a crashed leader never blocks a page forever.
+
+A lock file names its owner (host, pid and a per-acquisition token). It is
+taken over when its process on this host is gone, or when it is older than
+stale_after, which must exceed the longest analysis (admission wait plus
+LLM request). Leaders only ever remove their own lock.
+"""
+
+import os
+import time
+import uuid
+import socket
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class _Call:
+    """An in-flight call that local followers can wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+
+
+class SingleFlight:
+    """Run at most one computation per key at a time.
+
+    Args:
+        lock_dir: Directory shared by all workers (the analysis cache dir)
+        timeout: Seconds a follower waits for the leader before falling back
+        stale_after: Seconds after which another worker's lock is taken over
+            even though its process may still run
+        poll_interval: Seconds between checks of the shared store while
+            another worker holds the lock
+    """
+
+    def __init__(self, lock_dir: Path, timeout: float = 90.0, stale_after: float = 300.0,
+                 poll_interval: float = 0.5):
+        self.lock_dir = Path(lock_dir)
+        self.timeout = timeout
+        self.stale_after = max(stale_after, timeout)
+        self.poll_interval = poll_interval
+        self.host = socket.gethostname()
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        # key -> content of the lock file this process wrote
+        self._owned: Dict[str, str] = {}
+
+    def _lock_path(self, key: str) -> Path:
+        return self.lock_dir / f"{key}.lock"
+
+    def _create_lock(self, key: str) -> bool:
+        """Atomically create the lock file; False if another worker holds it."""
+        try:
+            fd = os.open(self._lock_path(key), os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600)
+        except FileExistsError:
+            return False
+        owner = f"{self.host} {os.getpid()} {uuid.uuid4().hex}"
+        os.write(fd, owner.encode())
+        os.close(fd)
+        self._owned[key] = owner
+        return True
+
+    def _read_lock(self, key: str) -> Optional[str]:
+        try:
+            return self._lock_path(key).read_text()
+        except OSError:
+            return None
+
+    def _is_stale(self, key: str, owner: str) -> bool:
+        """True when the lock's process on this host is gone or it is too old."""
+        host, _, rest = owner.partition(' ')
+        pid = rest.partition(' ')[0]
+        if host == self.host and pid.isdigit() and not _pid_alive(int(pid)):
+            return True
+        return time.time() - self._lock_path(key).stat().st_mtime > self.stale_after
+
+    def _try_acquire(self, key: str) -> bool:
+        """Claim cross-worker leadership for key, clearing stale locks."""
+        try:
+            if self._create_lock(key):
+                return True
+            owner = self._read_lock(key)
+            if owner is None or not self._is_stale(key, owner):
+                return False
+            logger.warning(f"Removing stale single-flight lock for {key} ({owner})")
+            # Only remove the lock we judged stale, not one taken since
+            if self._read_lock(key) == owner:
+                self._lock_path(key).unlink()
+            return self._create_lock(key)
+        except FileNotFoundError:
+            # Lock released between our open and stat - race for it again
+            return self._create_lock(key)
+        except OSError as e:
+            # Shared store unavailable - behave like a single worker
+            logger.warning(f"Single-flight lock unavailable for {key}: {e}")
+            return True
+
+    def _release(self, key: str):
+        """Remove the lock file if this process still owns it."""
+        owner = self._owned.pop(key, None)
+        try:
+            if owner is not None and self._read_lock(key) == owner:
+                self._lock_path(key).unlink()
+        except OSError:
+            pass
+
+    def _wait_remote(self, key: str, lookup: Callable[[str], Any], deadline: float) -> Any:
+        """Wait for another worker's leader to publish a result."""
+        while time.monotonic() < deadline:
+            result = lookup(key)
+            if result is not None:
+                return result
+            if not self._lock_path(key).exists():
+                # Leader finished (or died) without a result we can see;
+                # one last look, then let the caller take over
+                return lookup(key)
+            time.sleep(self.poll_interval)
+        return None
+
+    def do(self, key: str, compute: Callable[[], Any],
+           lookup: Callable[[str], Any]) -> Tuple[Any, bool]:
+        """Return the result for key, computing it at most once.
+
+        Args:
+            key: Coalescing key (the analysis cache key)
+            compute: Produces and persists the result; only the leader runs it
+            lookup: Reads a result persisted by any worker, or returns None
+
+        Returns:
+            Tuple of (result, shared) where shared is True when the result
+            came from another request's computation.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            if call.done.wait(self.timeout) and call.result is not None:
+                return call.result, True
+            logger.warning(f"Single-flight wait for {key} timed out, computing directly")
+            return compute(), False
+
+        try:
+            deadline = time.monotonic() + self.timeout
+            while not self._try_acquire(key):
+                result = self._wait_remote(key, lookup, deadline)
+                if result is not None:
+                    call.result = result
+                    return result, True
+                if time.monotonic() >= deadline:
+                    logger.warning(f"Single-flight wait for {key} timed out, computing directly")
+                    call.result = compute()
+                    return call.result, False
+
+            try:
+                # Another worker may have published just before releasing
+                result = lookup(key)
+                if result is not None:
+                    call.result = result
+                    return result, True
+                call.result = compute()
+            finally:
+                self._release(key)
+            return call.result, False
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
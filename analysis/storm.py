@@ -0,0 +1,137 @@
+"""
+SIB Storm Control - Keep alert storms from using up the LLM budget
+
+A misbehaving workload can fire the same Falco rule thousands of times a
+minute. StormController tracks each rule's arrival rate over a sliding
+window. Below the threshold every alert is analyzed; above it, the
+rule's alerts go into a reservoir per window and only a few samples per
+window are analyzed, each tagged with the number of alerts it stands
+for. Rare rules are never sampled, and a storming rule always keeps its
+samples, so no rule goes invisible.
+"""
+
+import time
+import random
+import logging
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class _RuleState:
+    """Arrivals and the open reservoir of one rule."""
+
+    def __init__(self):
+        self.slots: Dict[int, int] = {}
+        self.window: Optional[int] = None
+        self.seen = 0
+        self.reservoir = []
+        self.emitted: Dict[int, int] = {}
+
+
+class StormController:
+    """Per-rule rate tracking and reservoir sampling.
+
+    Times are alert timestamps, so replays of old logs are sampled the
+    same way as live alerts.
+
+    Args:
+        threshold: Alerts of one rule per window before it is sampled
+        samples: Alerts analyzed per sampled rule and window
+        window: Window length in seconds
+        resolution: Slots the sliding window is counted in
+        rng: Random source (for reproducible sampling)
+    """
+
+    def __init__(self, threshold: int = 30, samples: int = 3, window: float = 60.0,
+                 resolution: int = 12, rng: Optional[random.Random] = None):
+        self.threshold = threshold
+        self.samples = samples
+        self.resolution = resolution
+        self.window_ns = int(window * 1e9)
+        self.slot_ns = max(1, self.window_ns // resolution)
+        self.rng = rng or random.Random()
+        self.dropped = 0
+        self._rules: Dict[str, _RuleState] = {}
+
+    @classmethod
+    def from_config(cls, config: dict) -> Optional['StormController']:
+        """Build from analysis.storm; None if storm control is disabled."""
+        storm = config.get('analysis', {}).get('storm') or {}
+        if str(storm.get('enabled', True)).strip().lower() in ('0', 'false', 'no', 'off'):
+            return None
+        return cls(threshold=int(storm.get('threshold', 30)),
+                   samples=int(storm.get('samples', 3)),
+                   window=float(storm.get('window', 60)))
+
+    def _rate(self, state: _RuleState, ts_ns: int) -> int:
+        """Count an arrival; return the rule's arrivals in the window ending at it."""
+        slot = ts_ns // self.slot_ns
+        state.slots[slot] = state.slots.get(slot, 0) + 1
+        first = slot - self.resolution + 1
+        if len(state.slots) > 2 * self.resolution:
+            state.slots = {s: n for s, n in state.slots.items() if s >= first}
+        return sum(n for s, n in state.slots.items() if first <= s <= slot)
+
+    def _flush(self, rule: str, state: _RuleState) -> list:
+        """Close the open reservoir and return its samples, tagged."""
+        sample = state.reservoir
+        if sample:
+            tag = {
+                'rule': rule,
+                'population': state.seen,
+                'sampled': len(sample),
+                'window_start': datetime.fromtimestamp(state.window / 1e9).isoformat(),
+            }
+            for alert in sample:
+                alert['_sampled'] = dict(tag)
+            state.emitted[state.window] = state.emitted.get(state.window, 0) + len(sample)
+            logger.info(f"Alert storm in {rule}: analyzing {len(sample)} of {state.seen} alerts")
+        if state.window is not None:
+            state.emitted = {w: n for w, n in state.emitted.items() if w >= state.window - self.window_ns}
+        state.window, state.seen, state.reservoir = None, 0, []
+        sample.sort(key=lambda a: a.get('_timestamp_ns', 0))
+        return sample
+
+    def stream(self, alerts: Iterable[dict],
+               on_drop: Optional[Callable[[dict], None]] = None) -> Iterator[dict]:
+        """Yield the alerts to analyze, in arrival order where possible.
+
+        Alerts of quiet rules are yielded immediately. Samples of a
+        storming rule are yielded when its window closes or the input
+        ends; every alert left out is passed to on_drop.
+        """
+        def drop(alert: dict):
+            self.dropped += 1
+            if on_drop is not None:
+                on_drop(alert)
+
+        for alert in alerts:
+            rule = alert.get('_labels', {}).get('rule', alert.get('rule', 'unknown'))
+            state = self._rules.setdefault(rule, _RuleState())
+            ts_ns = int(alert.get('_timestamp_ns') or time.time_ns())
+            window = ts_ns - ts_ns % self.window_ns
+            if state.window is not None and window != state.window:
+                yield from self._flush(rule, state)
+            if self._rate(state, ts_ns) <= self.threshold:
+                yield alert
+                continue
+
+            # Reservoir sampling (algorithm R) within the window, minus
+            # samples already taken in it by earlier calls
+            state.window = window
+            state.seen += 1
+            size = self.samples - state.emitted.get(window, 0)
+            if len(state.reservoir) < size:
+                state.reservoir.append(alert)
+                continue
+            j = self.rng.randrange(state.seen)
+            if j < size:
+                drop(state.reservoir[j])
+                state.reservoir[j] = alert
+            else:
+                drop(alert)
+
+        for rule, state in self._rules.items():
+            yield from self._flush(rule, state)
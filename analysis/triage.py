@@ -0,0 +1,417 @@
+#!/usr/bin/env python3
+"""
+SIB Pre-Triage - Answer routine alerts locally before the LLM
+
+A small linear model predicts the severity and false-positive likelihood
+the LLM would assign, from hashed word n-grams of the obfuscated alert
+output and the rule name. It is trained on the verdicts already in the
+analysis cache and predicts in microseconds. Alerts it is confident are
+false positives, with no real chance of being high severity, get a local
+verdict instead of an LLM call; other alerts it is confident are not
+severe are analyzed after the rest. Falco critical (and above) alerts
+always go to the LLM.
+
+Train and evaluate offline:
+
+    python triage.py train --cache-dir /app/cache
+    python triage.py eval --cache-dir /app/cache
+
+Needs NumPy; without it (or without a trained model) every alert goes to
+the LLM as before.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import zlib
+import logging
+import argparse
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # optional - pre-triage is disabled without it
+    np = None
+
+from scheduler import PRIORITY_RANK, UNKNOWN_RANK
+
+logger = logging.getLogger(__name__)
+
+SEVERITIES = ('Critical', 'High', 'Medium', 'Low')
+LIKELIHOODS = ('High', 'Medium', 'Low')
+
+# Decisions
+SKIP = 'skip'          # answered locally, no LLM call
+LOW = 'low'            # analyzed after other alerts
+ANALYZE = 'analyze'
+
+# Falco priorities at or above this rank are never skipped (critical)
+ALWAYS_ANALYZE_RANK = 2
+
+DEFAULT_MODEL = 'triage.npz'
+
+# Obfuscation tokens ([USER-3]) and numbers carry no meaning across alerts
+_PLACEHOLDER = re.compile(r'\[([A-Z]+)-\d+\]')
+_TOKEN = re.compile(r'<[a-z]+>|[a-z0-9_]+')
+_DIGITS = re.compile(r'\d+')
+
+
+def tokenize(text: str) -> List[str]:
+    text = _PLACEHOLDER.sub(lambda m: f' <{m.group(1).lower()}> ', text).lower()
+    return [_DIGITS.sub('0', t) for t in _TOKEN.findall(text)]
+
+
+def is_llm_verdict(analysis: dict) -> bool:
+    """True for analyses the LLM produced (not errors or local answers)."""
+    return (bool(analysis) and 'error' not in analysis and 'triage' not in analysis
+            and 'knowledge' not in analysis and 'similar' not in analysis)
+
+
+def _label(value, labels: Tuple[str, ...]) -> Optional[int]:
+    value = str(value or '').strip().capitalize()
+    return labels.index(value) if value in labels else None
+
+
+def _softmax(z):
+    z = z - z.max()
+    e = np.exp(z)
+    return e / e.sum()
+
+
+class TriageModel:
+    """Two softmax regressions (severity, false-positive likelihood) over
+    hashed features.
+
+    Args:
+        bits: Feature space of 2**bits hashed n-grams
+    """
+
+    def __init__(self, bits: int = 16):
+        if np is None:
+            raise RuntimeError("Pre-triage needs NumPy (pip install numpy)")
+        self.bits = bits
+        dims = 1 << bits
+        self.sev_w = np.zeros((dims, len(SEVERITIES)), dtype=np.float32)
+        self.sev_b = np.zeros(len(SEVERITIES), dtype=np.float32)
+        self.fp_w = np.zeros((dims, len(LIKELIHOODS)), dtype=np.float32)
+        self.fp_b = np.zeros(len(LIKELIHOODS), dtype=np.float32)
+        self.trained = 0
+        self.trained_at = ''
+
+    def features(self, rule: str, output: str):
+        """Hashed, signed and L2-normalized n-gram counts: (indices, values)."""
+        words = tokenize(output)
+        grams = [f"r:{rule}"] + [f"rw:{w}" for w in tokenize(rule)]
+        grams += [f"u:{w}" for w in words]
+        grams += [f"b:{a} {b}" for a, b in zip(words, words[1:])]
+        mask = (1 << self.bits) - 1
+        counts: Dict[int, float] = {}
+        for gram in grams:
+            h = zlib.crc32(gram.encode())
+            index = h & mask
+            counts[index] = counts.get(index, 0.0) + (1.0 if h & 0x80000000 else -1.0)
+        indices = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+        values = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+        norm = np.sqrt((values * values).sum())
+        return indices, (values / norm if norm else values)
+
+    def probabilities(self, rule: str, output: str):
+        """(severity probabilities, false-positive likelihood probabilities)."""
+        indices, values = self.features(rule, output)
+        return (_softmax(values @ self.sev_w[indices] + self.sev_b),
+                _softmax(values @ self.fp_w[indices] + self.fp_b))
+
+    def fit(self, samples: List[dict], epochs: int = 10, rate: float = 0.5, seed: int = 0):
+        """Train on samples from load_verdicts() with plain SGD."""
+        rows = [(self.features(s['rule'], s['output']), s['severity'], s['false_positive'])
+                for s in samples]
+        rng = np.random.default_rng(seed)
+        for epoch in range(epochs):
+            step = rate / (1 + epoch)
+            for i in rng.permutation(len(rows)):
+                (indices, values), severity, fp = rows[i]
+                for w, b, target in ((self.sev_w, self.sev_b, severity), (self.fp_w, self.fp_b, fp)):
+                    if target is None:
+                        continue
+                    grad = _softmax(values @ w[indices] + b)
+                    grad[target] -= 1.0
+                    w[indices] -= step * np.outer(values, grad)
+                    b -= step * grad
+        self.trained = len(rows)
+        self.trained_at = datetime.now().isoformat()
+
+    def save(self, path: Path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        meta = json.dumps({'bits': self.bits, 'trained': self.trained, 'trained_at': self.trained_at})
+        tmp = path.with_name(path.name + '.tmp')
+        with open(tmp, 'wb') as f:
+            np.savez_compressed(f, sev_w=self.sev_w, sev_b=self.sev_b, fp_w=self.fp_w,
+                                fp_b=self.fp_b, meta=np.array(meta))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path) -> 'TriageModel':
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data['meta']))
+            model = cls(bits=int(meta['bits']))
+            for name in ('sev_w', 'sev_b', 'fp_w', 'fp_b'):
+                setattr(model, name, data[name])
+        model.trained = meta.get('trained', 0)
+        model.trained_at = meta.get('trained_at', '')
+        return model
+
+
+_loaded: Dict[str, tuple] = {}
+
+
+def load_model(path: Path) -> TriageModel:
+    """Load a model, reusing the loaded copy until the file changes."""
+    path = Path(path)
+    mtime = path.stat().st_mtime_ns
+    cached = _loaded.get(str(path))
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, TriageModel.load(path))
+        _loaded[str(path)] = cached
+    return cached[1]
+
+
+class Triage:
+    """Decides per alert whether the LLM is needed.
+
+    Args:
+        model: Trained TriageModel
+        skip_threshold: Probability of a high false-positive likelihood
+            at which an alert is answered locally
+        max_severe: Highest predicted probability of a Critical or High
+            severity an alert may have to be skipped or analyzed last
+    """
+
+    def __init__(self, model: TriageModel, skip_threshold: float = 0.9, max_severe: float = 0.05):
+        self.model = model
+        self.skip_threshold = skip_threshold
+        self.max_severe = max_severe
+
+    @classmethod
+    def from_config(cls, config: dict) -> Optional['Triage']:
+        """Build from analysis.triage; None if disabled or no model is trained."""
+        triage = config.get('analysis', {}).get('triage') or {}
+        if str(triage.get('enabled', False)).strip().lower() not in ('1', 'true', 'yes', 'on'):
+            return None
+        if np is None:
+            logger.warning("Pre-triage is enabled but NumPy is not installed")
+            return None
+        path = Path(triage.get('model') or Path(os.environ.get('ANALYSIS_CACHE_DIR', '/app/cache')) / DEFAULT_MODEL)
+        try:
+            model = load_model(path)
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Pre-triage disabled, cannot load {path}: {e} (train with: python triage.py train)")
+            return None
+        return cls(model, skip_threshold=float(triage.get('skip_threshold', 0.9)),
+                   max_severe=float(triage.get('max_severe', 0.05)))
+
+    def decide(self, severity_p, fp_p, priority: str) -> str:
+        severe = float(severity_p[0] + severity_p[1])
+        if PRIORITY_RANK.get(str(priority).lower(), UNKNOWN_RANK) <= ALWAYS_ANALYZE_RANK:
+            return ANALYZE
+        if severe > self.max_severe:
+            return ANALYZE
+        return SKIP if fp_p[0] >= self.skip_threshold else LOW
+
+    def assess(self, rule: str, output: str, priority: str) -> dict:
+        """Predicted verdict and decision for one (obfuscated) alert."""
+        started = time.perf_counter()
+        severity_p, fp_p = self.model.probabilities(rule, output)
+        action = self.decide(severity_p, fp_p, priority)
+        return {
+            'action': action,
+            'severity': SEVERITIES[int(severity_p.argmax())],
+            'severity_probability': {s: round(float(p), 3) for s, p in zip(SEVERITIES, severity_p)},
+            'false_positive': LIKELIHOODS[int(fp_p.argmax())],
+            'false_positive_probability': {s: round(float(p), 3) for s, p in zip(LIKELIHOODS, fp_p)},
+            'elapsed_us': round((time.perf_counter() - started) * 1e6),
+        }
+
+    @staticmethod
+    def analysis(assessment: dict, mitre: Optional[dict] = None) -> dict:
+        """Local verdict in the LLM's analysis schema."""
+        mitre = mitre or {}
+        fp_p = assessment['false_positive_probability']['High']
+        return {
+            'attack_vector': '',
+            'mitre_attack': {
+                'tactic': mitre.get('tactic', 'unknown'),
+                'technique_id': mitre.get('technique', 'unknown'),
+                'technique_name': mitre.get('name', ''),
+                'sub_technique': None,
+            },
+            'risk': {'severity': assessment['severity'], 'confidence': 'Low', 'impact': ''},
+            'investigate': [],
+            'mitigations': {},
+            'false_positive': {'likelihood': 'High', 'common_causes': [], 'distinguishing_factors': []},
+            'summary': (f"Pre-triaged locally as a likely false positive ({fp_p:.0%} confidence) "
+                        f"based on earlier analyses of similar alerts; not sent to the LLM."),
+            'triage': assessment,
+        }
+
+
+def load_verdicts(cache_dir: Path, since: Optional[str] = None) -> Iterator[dict]:
+    """LLM verdicts from the analysis cache, as training samples.
+
+    Args:
+        since: Only analyses with a later ISO timestamp
+    """
+    for cache_file in sorted(Path(cache_dir).glob('*.json')):
+        try:
+            with open(cache_file) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if not isinstance(data, dict) or not data.get('obfuscated_output'):
+            continue
+        analysis = data.get('analysis') or {}
+        if not is_llm_verdict(analysis):
+            continue
+        if since and str(data.get('timestamp', '')) <= since:
+            continue
+        severity = _label((analysis.get('risk') or {}).get('severity'), SEVERITIES)
+        fp = _label((analysis.get('false_positive') or {}).get('likelihood'), LIKELIHOODS)
+        if severity is None and fp is None:
+            continue
+        yield {
+            'key': data.get('cache_key', cache_file.stem),
+            'rule': str(data.get('rule') or 'Unknown'),
+            'priority': str(data.get('priority') or 'Unknown'),
+            'output': data['obfuscated_output'],
+            'severity': severity,
+            'false_positive': fp,
+        }
+
+
+def split(samples: List[dict], holdout: float) -> Tuple[List[dict], List[dict]]:
+    """Deterministic train/holdout split by cache key."""
+    train, test = [], []
+    for sample in samples:
+        bucket = zlib.crc32(sample['key'].encode()) % 1000
+        (test if bucket < holdout * 1000 else train).append(sample)
+    return train, test
+
+
+def evaluate(triage: Triage, samples: Iterable[dict]) -> dict:
+    """Accuracy of the predictions and what the decisions would have cost.
+
+    'missed_severe' counts alerts the LLM rated Critical or High that
+    would have been answered locally.
+    """
+    report = {'alerts': 0, 'severity_correct': 0, 'severity_labeled': 0, 'fp_correct': 0, 'fp_labeled': 0,
+              'actions': {SKIP: 0, LOW: 0, ANALYZE: 0}, 'severe': 0, 'missed_severe': 0, 'delayed_severe': 0,
+              'skipped_false_positives': 0}
+    for sample in samples:
+        severity_p, fp_p = triage.model.probabilities(sample['rule'], sample['output'])
+        action = triage.decide(severity_p, fp_p, sample['priority'])
+        report['alerts'] += 1
+        report['actions'][action] += 1
+        if sample['severity'] is not None:
+            report['severity_labeled'] += 1
+            report['severity_correct'] += int(severity_p.argmax()) == sample['severity']
+            if sample['severity'] <= 1:
+                report['severe'] += 1
+                report['missed_severe'] += action == SKIP
+                report['delayed_severe'] += action == LOW
+        if sample['false_positive'] is not None:
+            report['fp_labeled'] += 1
+            report['fp_correct'] += int(fp_p.argmax()) == sample['false_positive']
+            if action == SKIP and sample['false_positive'] == 0:
+                report['skipped_false_positives'] += 1
+    return report
+
+
+def print_report(report: dict, title: str):
+    n = report['alerts']
+    if not n:
+        print(f"{title}: no alerts to evaluate")
+        return
+
+    def pct(a, b):
+        return f"{a / b:.1%}" if b else 'n/a'
+
+    actions = report['actions']
+    print(f"{title}: {n} alerts")
+    print(f"  Severity accuracy:        {pct(report['severity_correct'], report['severity_labeled'])}")
+    print(f"  FP likelihood accuracy:   {pct(report['fp_correct'], report['fp_labeled'])}")
+    print(f"  Answered locally (skip):  {actions[SKIP]} ({pct(actions[SKIP], n)} of LLM calls saved)")
+    print(f"    of which LLM said FP High: {pct(report['skipped_false_positives'], actions[SKIP])}")
+    print(f"  Analyzed last (low):      {actions[LOW]} ({pct(actions[LOW], n)})")
+    print(f"  Critical/High verdicts:   {report['severe']}, skipped {report['missed_severe']}, "
+          f"delayed {report['delayed_severe']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='SIB Pre-Triage - train and evaluate the local triage model')
+    parser.add_argument('command', choices=['train', 'eval'])
+    parser.add_argument('--cache-dir', default=os.environ.get('ANALYSIS_CACHE_DIR', '/app/cache'),
+                        help='Analysis cache with the LLM verdicts')
+    parser.add_argument('--model', help=f'Model file (default: <cache-dir>/{DEFAULT_MODEL})')
+    parser.add_argument('--bits', type=int, default=16, help='Hashed feature space of 2**bits (default: 16)')
+    parser.add_argument('--epochs', type=int, default=10, help='Training passes (default: 10)')
+    parser.add_argument('--holdout', type=float, default=0.2,
+                        help='Share of analyses held out for the report when training (default: 0.2)')
+    parser.add_argument('--min-samples', type=int, default=50,
+                        help='Refuse to train on fewer analyses (default: 50)')
+    parser.add_argument('--skip-threshold', type=float, default=0.9,
+                        help='FP probability at which alerts are answered locally (default: 0.9)')
+    parser.add_argument('--max-severe', type=float, default=0.05,
+                        help='Highest Critical/High probability of skipped alerts (default: 0.05)')
+    parser.add_argument('--all', action='store_true',
+                        help='eval: use every cached analysis, not only those newer than the model')
+    args = parser.parse_args()
+
+    if np is None:
+        print("Pre-triage needs NumPy (pip install numpy).", file=sys.stderr)
+        sys.exit(1)
+    model_path = Path(args.model) if args.model else Path(args.cache_dir) / DEFAULT_MODEL
+
+    if args.command == 'train':
+        samples = list(load_verdicts(Path(args.cache_dir)))
+        if len(samples) < args.min_samples:
+            print(f"Only {len(samples)} LLM analyses in {args.cache_dir}; need {args.min_samples} to train.",
+                  file=sys.stderr)
+            sys.exit(1)
+        train, test = split(samples, args.holdout)
+        started = time.monotonic()
+        model = TriageModel(bits=args.bits)
+        model.fit(train, epochs=args.epochs)
+        print(f"Trained on {len(train)} analyses in {time.monotonic() - started:.1f}s")
+        if test:
+            print_report(evaluate(Triage(model, args.skip_threshold, args.max_severe), test),
+                         'Held-out analyses')
+            # The saved model learns from everything
+            model = TriageModel(bits=args.bits)
+            model.fit(samples, epochs=args.epochs)
+        model.save(model_path)
+        print(f"Saved {model_path} ({len(samples)} analyses)")
+        return
+
+    try:
+        model = TriageModel.load(model_path)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Cannot load {model_path}: {e}", file=sys.stderr)
+        sys.exit(1)
+    triage = Triage(model, args.skip_threshold, args.max_severe)
+    since = None if args.all else model.trained_at
+    samples = list(load_verdicts(Path(args.cache_dir), since=since))
+    print_report(evaluate(triage, samples),
+                 f"Analyses since training ({model.trained_at})" if since else 'All cached analyses')
+    started = time.perf_counter()
+    for sample in samples[:1000]:
+        triage.assess(sample['rule'], sample['output'], sample['priority'])
+    if samples:
+        print(f"  Prediction time:          {(time.perf_counter() - started) / min(len(samples), 1000) * 1e6:.0f}us/alert")
+
+
+if __name__ == '__main__':
+    main()